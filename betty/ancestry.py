@@ -1,10 +1,12 @@
-from functools import total_ordering
+from functools import total_ordering, lru_cache
 from itertools import chain
 from os.path import splitext, basename
-from typing import Dict, Optional, List, Iterable, Set, Union, TypeVar, Generic, Callable, Sequence, Type
+from typing import Dict, Optional, List, Iterable, Set, Union, TypeVar, Generic, Callable, Sequence, Type, Any, \
+    Tuple
 
 from geopy import Point
 
+from betty.graph import tsort
 from betty.locale import Localized, Datey
 from betty.media_type import MediaType
 from betty.path import extension
@@ -13,8 +15,18 @@ T = TypeVar('T')
 
 
 class EventHandlingSetList(Generic[T]):
+    """
+    An ordered set that calls handlers whenever values are added or removed.
+
+    Values are stored as the keys of a dictionary, which preserves their order and makes membership tests O(1).
+    """
+
+    __slots__ = ('_values', '_list', '_addition_handler', '_removal_handler')
+
     def __init__(self, addition_handler: Callable[[T], None], removal_handler: Callable[[T], None]):
-        self._values = []
+        self._values = {}
+        # A lazily built copy of the values, for iteration and access by index.
+        self._list = None
         self._addition_handler = addition_handler
         self._removal_handler = removal_handler
 
@@ -26,38 +38,84 @@ class EventHandlingSetList(Generic[T]):
         for value in reversed(values):
             if value in self._values:
                 continue
-            self._values.insert(0, value)
-            self._addition_handler(value)
+            # Dictionaries cannot insert keys at the start, so prepending rebuilds them. Values are rarely prepended.
+            prepended_values = {value: None}
+            prepended_values.update(self._values)
+            self._values = prepended_values
+            self._list = None
+            self._handle_addition(value)
 
     def append(self, *values: T) -> None:
         for value in values:
             if value in self._values:
                 continue
-            self._values.append(value)
-            self._addition_handler(value)
+            self._values[value] = None
+            self._list = None
+            self._handle_addition(value)
 
     def remove(self, *values: T) -> None:
         for value in values:
             if value not in self._values:
-                return
-            self._values.remove(value)
-            self._removal_handler(value)
+                continue
+            del self._values[value]
+            self._list = None
+            self._handle_removal(value)
 
     def replace(self, *values: T) -> None:
-        self.remove(*list(self._values))
-        self.append(*values)
+        replacement_values = dict.fromkeys(values)
+        # Only values that are not part of the replacement are removed, so values that remain are not detached and
+        # reattached.
+        self.remove(*[value for value in self._values if value not in replacement_values])
+        self.append(*replacement_values)
+        if list(self._values) != list(replacement_values):
+            # Put remaining values in their new positions.
+            self._values = dict.fromkeys(value for value in replacement_values if value in self._values)
+            self._list = None
 
     def clear(self) -> None:
-        self.replace()
+        self.remove(*self._values)
+
+    def _handle_addition(self, value: T) -> None:
+        self._addition_handler(value)
+
+    def _handle_removal(self, value: T) -> None:
+        self._removal_handler(value)
+
+    def _get_list(self) -> List[T]:
+        if self._list is None:
+            self._list = list(self._values)
+        return self._list
 
     def __iter__(self):
-        return self._values.__iter__()
+        # Iterate over a copy, so values can be added and removed during iteration.
+        return self._get_list().__iter__()
 
     def __len__(self):
         return len(self._values)
 
+    def __contains__(self, value) -> bool:
+        return value in self._values
+
     def __getitem__(self, item):
-        return self._values[item]
+        return self._get_list()[item]
+
+
+class _Association(EventHandlingSetList[T]):
+    """
+    An association's values on one side, with handlers that are shared by all instances of the decorated class.
+    """
+
+    __slots__ = ('_owner',)
+
+    def __init__(self, owner: Any, addition_handler: Callable[[Any, T], None], removal_handler: Callable[[Any, T], None]):
+        EventHandlingSetList.__init__(self, addition_handler, removal_handler)
+        self._owner = owner
+
+    def _handle_addition(self, value: T) -> None:
+        self._addition_handler(self._owner, value)
+
+    def _handle_removal(self, value: T) -> None:
+        self._removal_handler(self._owner, value)
 
 
 ManyAssociation = Union[EventHandlingSetList[T], Sequence[T]]
@@ -70,34 +128,37 @@ class _to_many:
 
     def __call__(self, cls):
         _decorated_self_name = '_%s' % self._self_name
-        original_init = cls.__init__
-
-        def _init(decorated_self, *args, **kwargs):
-            association = EventHandlingSetList(self._create_addition_handler(decorated_self),
-                                               self._create_removal_handler(decorated_self))
-            setattr(decorated_self, _decorated_self_name, association)
-            original_init(decorated_self, *args, **kwargs)
-        cls.__init__ = _init
+        addition_handler = self._handle_addition
+        removal_handler = self._handle_removal
+
+        def _get(decorated_self):
+            # Associations are created when first used, because many of them never are.
+            try:
+                return getattr(decorated_self, _decorated_self_name)
+            except AttributeError:
+                association = _Association(decorated_self, addition_handler, removal_handler)
+                setattr(decorated_self, _decorated_self_name, association)
+                return association
         setattr(cls, self._self_name, property(
-            lambda decorated_self: getattr(decorated_self, _decorated_self_name),
-            lambda decorated_self, values: getattr(decorated_self, _decorated_self_name).replace(*values),
-            lambda decorated_self: getattr(decorated_self, _decorated_self_name).clear(),
+            _get,
+            lambda decorated_self, values: _get(decorated_self).replace(*values),
+            lambda decorated_self: _get(decorated_self).clear(),
         ))
         return cls
 
-    def _create_addition_handler(self, decorated_self):
+    def _handle_addition(self, decorated_self, associated) -> None:
         raise NotImplementedError
 
-    def _create_removal_handler(self, decorated_self):
+    def _handle_removal(self, decorated_self, associated) -> None:
         raise NotImplementedError
 
 
 class many_to_many(_to_many):
-    def _create_addition_handler(self, decorated_self):
-        return lambda associated: getattr(associated, self._associated_name).append(decorated_self)
+    def _handle_addition(self, decorated_self, associated) -> None:
+        getattr(associated, self._associated_name).append(decorated_self)
 
-    def _create_removal_handler(self, decorated_self):
-        return lambda associated: getattr(associated, self._associated_name).remove(decorated_self)
+    def _handle_removal(self, decorated_self, associated) -> None:
+        getattr(associated, self._associated_name).remove(decorated_self)
 
 
 def bridged_many_to_many(left_associated_name: str, left_self_name: str, right_self_name: str, right_associated_name: str):
@@ -109,26 +170,22 @@ def bridged_many_to_many(left_associated_name: str, left_self_name: str, right_s
 
 
 class one_to_many(_to_many):
-    def _create_addition_handler(self, decorated_self):
-        return lambda associated: setattr(associated, self._associated_name, decorated_self)
+    def _handle_addition(self, decorated_self, associated) -> None:
+        setattr(associated, self._associated_name, decorated_self)
 
-    def _create_removal_handler(self, decorated_self):
-        return lambda associated: setattr(associated, self._associated_name, None)
+    def _handle_removal(self, decorated_self, associated) -> None:
+        setattr(associated, self._associated_name, None)
 
 
 def many_to_one(self_name: str, associated_name: str, _removal_handler: Optional[Callable[[T], None]] = None):
     def decorator(cls):
         _decorated_self_name = '_%s' % self_name
-        original_init = cls.__init__
 
-        def _init(decorated_self, *args, **kwargs):
-            association = None
-            setattr(decorated_self, _decorated_self_name, association)
-            original_init(decorated_self, *args, **kwargs)
-        cls.__init__ = _init
+        def _get(decorated_self):
+            return getattr(decorated_self, _decorated_self_name, None)
 
         def _set(decorated_self, value):
-            previous_value = getattr(decorated_self, _decorated_self_name)
+            previous_value = _get(decorated_self)
             if previous_value == value:
                 return
             setattr(decorated_self, _decorated_self_name, value)
@@ -139,7 +196,7 @@ def many_to_one(self_name: str, associated_name: str, _removal_handler: Optional
             if value is not None:
                 getattr(value, associated_name).append(decorated_self)
         setattr(cls, self_name, property(
-            lambda decorated_self: getattr(decorated_self, _decorated_self_name),
+            _get,
             _set,
             lambda decorated_self: _set(decorated_self, None),
         ))
@@ -147,6 +204,26 @@ def many_to_one(self_name: str, associated_name: str, _removal_handler: Optional
     return decorator
 
 
+class _Interned:
+    """
+    Provides a single, shared instance per type, for types whose instances hold no state of their own.
+    """
+
+    __slots__ = ()
+
+    _instances = {}
+
+    def __new__(cls):
+        try:
+            return _Interned._instances[cls]
+        except KeyError:
+            instance = _Interned._instances[cls] = object.__new__(cls)
+            return instance
+
+
+# Mixins declare no __slots__, so they can be used on their own, and so resources can be given additional attributes.
+# Concrete types declare slots for all of their own and their mixins' attributes, so that their instances' dictionaries
+# are never populated, unless such additional attributes are set.
 class Resource:
     @classmethod
     def resource_type_name(cls) -> str:
@@ -177,6 +254,8 @@ class Identifiable:
 
 
 class Note(Resource, Identifiable):
+    __slots__ = ('_id', '_text')
+
     text: str
 
     def __init__(self, note_id: str, text: str):
@@ -215,6 +294,8 @@ class HasMediaType:
 
 
 class Link(HasMediaType, Localized, Described):
+    __slots__ = ('media_type', 'locale', 'description', 'url', 'label', 'relationship')
+
     url: str
     relationship: Optional[str]
     label: Optional[str]
@@ -239,6 +320,8 @@ class HasLinks:
 
 @many_to_many('resources', 'files')
 class File(Resource, Identifiable, Described, HasPrivacy, HasMediaType, HasNotes):
+    __slots__ = ('_id', 'description', 'private', 'media_type', 'notes', '_path', '_resources')
+
     resources: ManyAssociation['HasFiles']
     notes: List[Note]
 
@@ -299,6 +382,8 @@ class HasFiles:
 @one_to_many('contains', 'contained_by')
 @one_to_many('citations', 'source')
 class Source(Resource, Dated, HasFiles, HasLinks, HasPrivacy):
+    __slots__ = ('date', '_files', '_links', 'private', 'name', 'author', 'publisher', '_contained_by', '_contains', '_citations')
+
     name: Optional[str]
     contained_by: 'Source'
     contains: ManyAssociation['Source']
@@ -322,6 +407,8 @@ class Source(Resource, Dated, HasFiles, HasLinks, HasPrivacy):
 
 
 class IdentifiableSource(Source, Identifiable):
+    __slots__ = ('_id',)
+
     def __init__(self, source_id: str, *args, **kwargs):
         Identifiable.__init__(self, source_id)
         Source.__init__(self, *args, **kwargs)
@@ -330,6 +417,8 @@ class IdentifiableSource(Source, Identifiable):
 @many_to_many('facts', 'citations')
 @many_to_one('source', 'citations')
 class Citation(Resource, Dated, HasFiles, HasPrivacy):
+    __slots__ = ('date', '_files', 'private', 'location', '_source', '_facts')
+
     facts: ManyAssociation['HasCitations']
     source: Source
     location: Optional[str]
@@ -347,6 +436,8 @@ class Citation(Resource, Dated, HasFiles, HasPrivacy):
 
 
 class IdentifiableCitation(Citation, Identifiable):
+    __slots__ = ('_id',)
+
     def __init__(self, citation_id: str, *args, **kwargs):
         Identifiable.__init__(self, citation_id)
         Citation.__init__(self, *args, **kwargs)
@@ -358,6 +449,8 @@ class HasCitations:
 
 
 class PlaceName(Localized, Dated):
+    __slots__ = ('locale', 'date', '_name')
+
     def __init__(self, name: str, locale: Optional[str] = None, date: Optional[Datey] = None):
         Localized.__init__(self)
         self._name = name
@@ -382,6 +475,8 @@ class PlaceName(Localized, Dated):
 
 @bridged_many_to_many('enclosed_by', 'encloses', 'enclosed_by', 'encloses')
 class Enclosure(Dated, HasCitations):
+    __slots__ = ('date', '_citations', '_encloses', '_enclosed_by')
+
     encloses: 'Place'
     enclosed_by: 'Place'
 
@@ -396,6 +491,8 @@ class Enclosure(Dated, HasCitations):
 @one_to_many('enclosed_by', 'encloses')
 @one_to_many('encloses', 'enclosed_by')
 class Place(Resource, Identifiable, HasLinks):
+    __slots__ = ('_id', '_links', '_names', '_coordinates', '_events', '_enclosed_by', '_encloses')
+
     enclosed_by: ManyAssociation[Enclosure]
     encloses: ManyAssociation[Enclosure]
 
@@ -422,7 +519,9 @@ class Place(Resource, Identifiable, HasLinks):
         self._coordinates = coordinates
 
 
-class PresenceRole:
+class PresenceRole(_Interned):
+    __slots__ = ()
+
     @classmethod
     def name(cls) -> str:
         raise NotImplementedError
@@ -474,6 +573,8 @@ class Attendee(PresenceRole):
 
 @bridged_many_to_many('presences', 'person', 'event', 'presences')
 class Presence:
+    __slots__ = ('_person', '_event', 'role')
+
     person: Optional['Person']
     event: Optional['Event']
     role: PresenceRole
@@ -484,7 +585,9 @@ class Presence:
         self.event = event
 
 
-class EventType:
+class EventType(_Interned):
+    __slots__ = ()
+
     @classmethod
     def name(cls) -> str:
         raise NotImplementedError
@@ -818,9 +921,90 @@ EVENT_TYPE_TYPES = [
 ]
 
 
+class EventTypeOrder:
+    """
+    Orders event types according to their comes_before() and comes_after() relations.
+
+    Event types declare their relations to their nearest neighbours only, sometimes through abstract event types such as
+    LifeEventType. The order resolves these relations once, so events can be compared and sorted using integer ranks.
+    """
+
+    def __init__(self, event_type_types: Iterable[Type[EventType]]):
+        """
+        :raises betty.graph.CyclicGraphError: Raised if the event types' relations contradict each other.
+        """
+        event_type_types = list(event_type_types)
+        comes_before = {event_type_type: tuple(event_type_type.comes_before()) for event_type_type in event_type_types}
+        comes_after = {event_type_type: tuple(event_type_type.comes_after()) for event_type_type in event_type_types}
+        graph = {
+            event_type_type: {
+                other_event_type_type for other_event_type_type in event_type_types
+                if other_event_type_type is not event_type_type and (issubclass(other_event_type_type, comes_before[event_type_type]) or issubclass(event_type_type, comes_after[other_event_type_type]))
+            }
+            for event_type_type in event_type_types
+        }
+        self._event_type_types = tsort(graph)
+        self._ranks = {event_type_type: rank for rank, event_type_type in enumerate(self._event_type_types)}
+
+        # For each event type, a bitset of the ranks of the event types it comes before, directly or indirectly. Event
+        # types come before event types with higher ranks only, so the bitsets can be built from the highest rank down.
+        self._comes_before = [0] * len(self._event_type_types)
+        for rank in reversed(range(len(self._event_type_types))):
+            for other_event_type_type in graph[self._event_type_types[rank]]:
+                other_rank = self._ranks[other_event_type_type]
+                self._comes_before[rank] |= 1 << other_rank | self._comes_before[other_rank]
+
+    @property
+    def event_type_types(self) -> List[Type[EventType]]:
+        """
+        The ordered event types, in the order of their ranks.
+        """
+        return list(self._event_type_types)
+
+    def rank(self, event_type_type: Type[EventType]) -> int:
+        """
+        Gets an event type's rank.
+
+        Event types have lower ranks than the event types they come before. Event types that are not part of this order
+        rank after all others.
+        """
+        return self._ranks.get(event_type_type, len(self._event_type_types))
+
+    def comes_before(self, event_type_type: Type[EventType], other_event_type_type: Type[EventType]) -> bool:
+        """
+        Checks whether an event type comes before another, directly or through other event types.
+        """
+        try:
+            return bool(self._comes_before[self._ranks[event_type_type]] >> self._ranks[other_event_type_type] & 1)
+        except KeyError:
+            return False
+
+    def comes_after(self, event_type_type: Type[EventType], other_event_type_type: Type[EventType]) -> bool:
+        """
+        Checks whether an event type comes after another, directly or through other event types.
+        """
+        return self.comes_before(other_event_type_type, event_type_type)
+
+
+@lru_cache(maxsize=None)
+def _get_event_type_order(event_type_types: Tuple[Type[EventType], ...]) -> EventTypeOrder:
+    return EventTypeOrder(event_type_types)
+
+
+def get_event_type_order() -> EventTypeOrder:
+    """
+    Gets the order of EVENT_TYPE_TYPES.
+
+    The order is computed once, and again only if EVENT_TYPE_TYPES changes.
+    """
+    return _get_event_type_order(tuple(EVENT_TYPE_TYPES))
+
+
 @many_to_one('place', 'events')
 @one_to_many('presences', 'event')
 class Event(Resource, Dated, HasFiles, HasCitations, Described, HasPrivacy):
+    __slots__ = ('date', '_files', '_citations', 'description', 'private', '_type', '_place', '_presences')
+
     place: Place
     presences: ManyAssociation[Presence]
 
@@ -860,6 +1044,8 @@ class Event(Resource, Dated, HasFiles, HasCitations, Described, HasPrivacy):
 
 
 class IdentifiableEvent(Event, Identifiable):
+    __slots__ = ('_id',)
+
     def __init__(self, event_id: str, *args, **kwargs):
         Identifiable.__init__(self, event_id)
         Event.__init__(self, *args, **kwargs)
@@ -868,6 +1054,8 @@ class IdentifiableEvent(Event, Identifiable):
 @total_ordering
 @many_to_one('person', 'names')
 class PersonName(Localized, HasCitations):
+    __slots__ = ('locale', '_citations', '_individual', '_affiliation', '_person')
+
     person: Optional['Person']
 
     def __init__(self, individual: Optional[str] = None, affiliation: Optional[str] = None):
@@ -883,6 +1071,9 @@ class PersonName(Localized, HasCitations):
             return NotImplemented
         return (self._affiliation or '', self._individual or '') == (other._affiliation or '', other._individual or '')
 
+    def __hash__(self):
+        return hash((self._affiliation or '', self._individual or ''))
+
     def __gt__(self, other):
         if other is None:
             return True
@@ -905,6 +1096,8 @@ class PersonName(Localized, HasCitations):
 @one_to_many('presences', 'person')
 @one_to_many('names', 'person')
 class Person(Resource, Identifiable, HasFiles, HasCitations, HasLinks, HasPrivacy):
+    __slots__ = ('_id', '_files', '_citations', '_links', 'private', '_parents', '_children', '_presences', '_names')
+
     parents: ManyAssociation['Person']
     children: ManyAssociation['Person']
     presences: ManyAssociation[Presence]
@@ -926,6 +1119,9 @@ class Person(Resource, Identifiable, HasFiles, HasCitations, HasLinks, HasPrivac
             return NotImplemented
         return self.id == other.id
 
+    def __hash__(self):
+        return hash(self.id)
+
     def __gt__(self, other):
         if not isinstance(other, Person):
             return NotImplemented
@@ -934,7 +1130,7 @@ class Person(Resource, Identifiable, HasFiles, HasCitations, HasLinks, HasPrivac
     @property
     def name(self) -> Optional[PersonName]:
         try:
-            return self._names.list[0]
+            return self.names[0]
         except IndexError:
             return None
 
@@ -961,7 +1157,7 @@ class Person(Resource, Identifiable, HasFiles, HasCitations, HasLinks, HasPrivac
     @property
     def siblings(self) -> List:
         siblings = []
-        for parent in self._parents:
+        for parent in self.parents:
             for sibling in parent.children:
                 if sibling != self and sibling not in siblings:
                     siblings.append(sibling)
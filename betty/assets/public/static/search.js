@@ -4,11 +4,17 @@ var _ENTER_SEARCH_KEYS = ['s']
 var _HIDE_SEARCH_KEYS = ['Escape']
 var _NEXT_RESULT_KEYS = ['ArrowDown']
 var _PREVIOUS_RESULT_KEYS = ['ArrowUp']
+var _RESULTS_PER_PAGE = 50
 
 function Search () {
   this._query = null
   this._search = document.getElementById('search')
-  this._indexUrl = this._search.dataset.bettySearchIndex
+  this._indexUrl = new URL(this._search.dataset.bettySearchIndex, document.baseURI)
+  this._index = null
+  this._shards = {}
+  this._resultChunks = {}
+  this._matches = []
+  this._renderedMatchCount = 0
   this._form = this._search.getElementsByTagName('form').item(0)
   this._queryElement = document.getElementById('search-query')
   this._resultsContainer = document.getElementById('search-results-container')
@@ -33,6 +39,15 @@ function Search () {
     _this._navigateResults(e.key)
   })
 
+  // Render more results when the user scrolls to the last of the current results.
+  this._resultsContainer.addEventListener('scroll', function () {
+    if (this.scrollTop + 2 * this.clientHeight >= this.scrollHeight) {
+      _this._getIndex().then(function (index) {
+        return _this._renderMoreResults(index, false)
+      })
+    }
+  })
+
   // Allow navigation into and out of the search.
   document.addEventListener('keyup', function (e) {
     if (_ENTER_SEARCH_KEYS.indexOf(e.key) !== -1) {
@@ -90,9 +105,11 @@ Search.prototype._navigateResults = function (keyCode) {
   }
 }
 
-Search.prototype._setSearchResults = function (results) {
+Search.prototype._setSearchResults = function (results, reset) {
   this._resultsContainer.innerHTML = this._renderResults(results)
-  this._resultsContainer.scrollTop = 0
+  if (reset) {
+    this._resultsContainer.scrollTop = 0
+  }
 }
 
 Search.prototype.showSearchResults = function () {
@@ -120,51 +137,177 @@ Search.prototype.hideSearchResults = function () {
   }
 }
 
-Search.prototype._performCacheQuery = function (query) {
-  this._query = query
+Search.prototype._fetchJson = function (url) {
+  return fetch(url).then(function (response) {
+    if (!response.ok) {
+      throw new Error('Could not load ' + url + '.')
+    }
+    return response.json()
+  })
 }
 
-Search.prototype._performFromCachedQuery = function () {
-  var query = this._query
-  this._query = null
-  var _this = this
-  this._setSearchResults(this._index.filter(function (result) {
-    return _this._match(query, result.text)
-  }))
+Search.prototype._getIndex = function () {
+  if (!this._index) {
+    var _this = this
+    this._index = this._fetchJson(this._indexUrl).then(function (index) {
+      _this._resultContainerTemplate = index.resultContainerTemplate
+      _this._resultsContainerTemplate = index.resultsContainerTemplate
+      return index
+    })
+  }
+  return this._index
 }
 
-Search.prototype._performCached = function (query) {
-  this._performCacheQuery(query)
-  this._performFromCachedQuery()
+Search.prototype._getShard = function (shardId) {
+  if (!(shardId in this._shards)) {
+    this._shards[shardId] = this._fetchJson(new URL('shard/' + shardId + '.json', this._indexUrl))
+  }
+  return this._shards[shardId]
 }
 
-Search.prototype._performUncached = function (query) {
-  this._query = query
-  this.perform = this._performCacheQuery
+Search.prototype._getResult = function (index, resultIndex) {
+  var chunkId = Math.floor(resultIndex / index.resultsPerChunk)
+  if (!(chunkId in this._resultChunks)) {
+    this._resultChunks[chunkId] = this._fetchJson(new URL('result/' + chunkId + '.json', this._indexUrl))
+  }
+  return this._resultChunks[chunkId].then(function (chunk) {
+    return {
+      result: chunk[resultIndex % index.resultsPerChunk]
+    }
+  })
+}
+
+Search.prototype._tokenize = function (text) {
+  // Split text into lowercase words without diacritics, exactly like betty.search.tokenize() does.
+  return text.normalize('NFKD').replace(/\p{M}/gu, '').toLowerCase().match(/[\p{L}\p{N}]+/gu) || []
+}
+
+Search.prototype._getPrefix = function (word, length) {
+  // Split the word by code points, rather than UTF-16 code units, as the index does.
+  return Array.from(word).slice(0, length).join('')
+}
+
+Search.prototype._lookUp = function (index, word) {
+  // Find the indexes of the results with any word that starts with the given word.
   var _this = this
-  var indexRequest = new XMLHttpRequest()
-  indexRequest.open('GET', this._indexUrl)
-  indexRequest.addEventListener('load', function () {
-    var index = JSON.parse(indexRequest.response)
-    _this._index = index.index
-    _this._resultContainerTemplate = index.resultContainerTemplate
-    _this._resultsContainerTemplate = index.resultsContainerTemplate
-    _this.perform = _this._performCached
-    _this._performFromCachedQuery()
+  var prefix = this._getPrefix(word, index.prefixLength)
+  var remainder = word.slice(prefix.length)
+  var shardIds
+  if (prefix.length === index.prefixLength) {
+    shardIds = prefix in index.shards ? [index.shards[prefix]] : []
+  } else {
+    // Short words match all words in all shards whose prefixes start with them.
+    shardIds = Object.keys(index.shards).filter(function (shardPrefix) {
+      return _this._getPrefix(shardPrefix, prefix.length) === prefix
+    }).map(function (shardPrefix) {
+      return index.shards[shardPrefix]
+    })
+  }
+  return Promise.all(shardIds.map(function (shardId) {
+    return _this._getShard(shardId)
+  })).then(function (tries) {
+    var resultIndexes = {}
+    tries.forEach(function (trie) {
+      var node = _this._findTrieNode(trie, remainder)
+      if (node) {
+        _this._collectPostings(node, resultIndexes)
+      }
+    })
+    return resultIndexes
   })
-  indexRequest.send()
 }
 
-Search.prototype.perform = Search.prototype._performUncached
+Search.prototype._findTrieNode = function (node, word) {
+  // Trie nodes may be keyed by several characters at once. See betty.search._build_trie().
+  while (word.length) {
+    var child = null
+    for (var key in node) {
+      if (key === '') {
+        continue
+      }
+      if (word.indexOf(key) === 0) {
+        child = node[key]
+        word = word.slice(key.length)
+        break
+      }
+      // The word ends halfway this key, so all words in the child node start with it.
+      if (key.indexOf(word) === 0) {
+        return node[key]
+      }
+    }
+    if (!child) {
+      return null
+    }
+    node = child
+  }
+  return node
+}
 
-Search.prototype._match = function (query, haystack) {
-  var queryParts = query.toLowerCase().split(/\s/)
-  for (var i in queryParts) {
-    if (haystack.indexOf(queryParts[i]) === -1) {
-      return false
+Search.prototype._collectPostings = function (node, resultIndexes) {
+  for (var key in node) {
+    if (key === '') {
+      // Postings are delta-encoded.
+      var resultIndex = 0
+      node[key].forEach(function (delta) {
+        resultIndex += delta
+        resultIndexes[resultIndex] = true
+      })
+    } else {
+      this._collectPostings(node[key], resultIndexes)
     }
   }
-  return true
+}
+
+Search.prototype.perform = function (query) {
+  this._query = query
+  var words = this._tokenize(query)
+  var _this = this
+  var index
+  this._getIndex()
+    .then(function (loadedIndex) {
+      index = loadedIndex
+      return Promise.all(words.map(function (word) {
+        return _this._lookUp(index, word)
+      }))
+    })
+    .then(function (wordResultIndexes) {
+      // Ignore the results if another search was performed in the meantime.
+      if (query !== _this._query) {
+        return
+      }
+      // Results must match all words.
+      var matches = []
+      if (wordResultIndexes.length) {
+        matches = Object.keys(wordResultIndexes[0]).filter(function (resultIndex) {
+          return wordResultIndexes.every(function (resultIndexes) {
+            return resultIndex in resultIndexes
+          })
+        }).map(Number)
+      }
+      _this._matches = matches.sort(function (a, b) {
+        return a - b
+      })
+      _this._renderedMatchCount = 0
+      return _this._renderMoreResults(index, true)
+    })
+}
+
+Search.prototype._renderMoreResults = function (index, reset) {
+  var query = this._query
+  var matches = this._matches.slice(0, this._renderedMatchCount + _RESULTS_PER_PAGE)
+  if (!reset && matches.length === this._renderedMatchCount) {
+    return Promise.resolve()
+  }
+  // Claim the results before they are loaded, so they are rendered only once.
+  this._renderedMatchCount = matches.length
+  var _this = this
+  return Promise.all(matches.map(function (resultIndex) {
+    return _this._getResult(index, resultIndex)
+  })).then(function (results) {
+    if (query === _this._query) {
+      _this._setSearchResults(results, reset)
+    }
+  })
 }
 
 Search.prototype._renderResults = function (results) {
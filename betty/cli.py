@@ -15,6 +15,7 @@ from betty import generate, parse, serve
 from betty.config import from_file
 from betty.error import UserFacingError
 from betty.asyncio import sync
+from betty.image import ImageCache
 from betty.logging import CliHandler
 from betty.site import Site
 
@@ -127,11 +128,30 @@ def main(site):
 
 
 @click.command(help='Clear all caches.')
+@click.option('--images', 'images_only', is_flag=True, help='Only clear the image cache.')
+@click.option('--max-size', type=click.IntRange(min=0), help='Only remove the least recently used images until the image cache takes up at most this many megabytes. Implies --images.')
+@click.option('--unused-days', type=click.IntRange(min=0), help='Only remove the images that have not been used for this many days. Implies --images.')
 @global_command
-async def _clear_caches():
-    with suppress(FileNotFoundError):
-        shutil.rmtree(betty._CACHE_DIRECTORY_PATH)
-    logging.getLogger().info('All caches cleared.')
+async def _clear_caches(images_only: bool, max_size: Optional[int], unused_days: Optional[int]):
+    image_cache_directory_path = path.join(betty._CACHE_DIRECTORY_PATH, 'image')
+    if max_size is not None or unused_days is not None:
+        image_cache = ImageCache(image_cache_directory_path)
+        try:
+            removed_count = image_cache.prune(
+                None if max_size is None else max_size * 2 ** 20,
+                None if unused_days is None else time.time() - unused_days * 86400,
+            )
+        finally:
+            image_cache.close()
+        logging.getLogger().info('Removed %d images from the image cache.' % removed_count)
+    elif images_only:
+        with suppress(FileNotFoundError):
+            shutil.rmtree(image_cache_directory_path)
+        logging.getLogger().info('Image cache cleared.')
+    else:
+        with suppress(FileNotFoundError):
+            shutil.rmtree(betty._CACHE_DIRECTORY_PATH)
+        logging.getLogger().info('All caches cleared.')
 
 
 @click.command(help='Generate a static site.')
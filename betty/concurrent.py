@@ -1,20 +1,150 @@
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import Future
 from concurrent.futures._base import Executor
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
+
+class TaskTiming:
+    """
+    Aggregates how long the tasks that run the same callable took.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def add(self, duration: float) -> None:
+        self.count += 1
+        self.total += duration
+        self.maximum = max(self.maximum, duration)
 
 
 class ExceptionRaisingExecutor(Executor):
-    def __init__(self, executor: Executor):
+    """
+    Wraps another executor, and raises the first error of any of its tasks as soon as possible.
+
+    Once a task fails, the tasks that have not started yet are cancelled, and the error is raised by the next call to
+    submit() or shutdown(). Done tasks are forgotten immediately, except for how long they took to run.
+    """
+
+    # The minimum number of seconds between progress reports.
+    _PROGRESS_INTERVAL = 10
+
+    def __init__(self, executor: Executor, max_pending: Optional[int] = None):
+        """
+        :param max_pending: The maximum number of tasks that may be pending at any time. Once reached, submit() blocks
+            until an earlier task is done.
+        """
         self._executor = executor
-        self._futures = []
+        self._pending_semaphore = None if max_pending is None else threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pending: Set[Future] = set()
+        self._submitted_count = 0
+        self._done_count = 0
+        self._timings: Dict[str, TaskTiming] = {}
+        self._error = None
+        self._error_raised = False
+        self._progress_reported = time.monotonic()
+
+    @property
+    def submitted_count(self) -> int:
+        return self._submitted_count
+
+    @property
+    def done_count(self) -> int:
+        return self._done_count
+
+    @property
+    def timings(self) -> Dict[str, TaskTiming]:
+        """
+        The timings of the tasks that were done, keyed by the names of the callables they ran.
+        """
+        return self._timings
 
-    def submit(self, *args, **kwargs):
-        future = self._executor.submit(*args, **kwargs)
-        self._futures.append(future)
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        self._raise_error()
+        if self._pending_semaphore is not None:
+            self._pending_semaphore.acquire()
+        try:
+            task_future = self._executor.submit(_timed, fn, *args, **kwargs)
+        except BaseException:
+            if self._pending_semaphore is not None:
+                self._pending_semaphore.release()
+            raise
+        with self._lock:
+            self._pending.add(task_future)
+            self._submitted_count += 1
+        # Callers get a future of their own, so the task's future can be released as soon as the task is done.
+        future = Future()
+        task_future.add_done_callback(functools.partial(self._task_done, future, _name(fn)))
         return future
 
+    def _task_done(self, future: Future, name: str, task_future: Future) -> None:
+        with self._lock:
+            self._pending.discard(task_future)
+            self._done_count += 1
+        if self._pending_semaphore is not None:
+            self._pending_semaphore.release()
+
+        if task_future.cancelled():
+            future.cancel()
+            return
+
+        error = task_future.exception()
+        if error is not None:
+            with self._lock:
+                is_first_error = self._error is None
+                if is_first_error:
+                    self._error = error
+            if is_first_error:
+                self._cancel_pending()
+            future.set_exception(error)
+            return
+
+        result, duration = task_future.result()
+        with self._lock:
+            self._timings.setdefault(name, TaskTiming()).add(duration)
+            if time.monotonic() - self._progress_reported >= self._PROGRESS_INTERVAL:
+                self._progress_reported = time.monotonic()
+                logging.getLogger().info('Completed %d of %d tasks.' % (self._done_count, self._submitted_count))
+        future.set_result(result)
+
+    def _cancel_pending(self) -> None:
+        with self._lock:
+            pending = list(self._pending)
+        # Cancelling a future calls its done callbacks immediately, so this must be done without holding the lock.
+        for task_future in pending:
+            task_future.cancel()
+
+    def _raise_error(self) -> None:
+        with self._lock:
+            error = None if self._error_raised else self._error
+            self._error_raised = self._error is not None
+        if error is not None:
+            raise error
+
     def map(self, *args, **kwargs):
         return self._executor.map(*args, **kwargs)
 
     def shutdown(self, *args, **kwargs):
         self._executor.shutdown(*args, **kwargs)
-        for future in self._futures:
-            future.result()
+        logger = logging.getLogger()
+        for name, timing in sorted(self._timings.items(), key=lambda item: item[1].total, reverse=True):
+            logger.info('Ran %d %s tasks in %.2f seconds in total, and %.2f seconds at most.' % (timing.count, name, timing.total, timing.maximum))
+        self._raise_error()
+
+
+def _name(fn: Callable) -> str:
+    while isinstance(fn, functools.partial):
+        fn = fn.func
+    return '%s.%s' % (fn.__module__, getattr(fn, '__qualname__', type(fn).__qualname__))
+
+
+def _timed(fn: Callable, *args, **kwargs) -> Tuple[Any, float]:
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
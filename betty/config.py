@@ -9,7 +9,7 @@ from voluptuous import Schema, All, Required, Invalid, IsDir, Any, Range
 
 from betty import _CACHE_DIRECTORY_PATH, os
 from betty.error import ContextError, UserFacingError
-from betty.voluptuous import Path, Importable
+from betty.voluptuous import Path, Importable, ImageFormat
 
 
 class LocaleConfiguration:
@@ -84,6 +84,13 @@ class Configuration:
     assets_directory_path: Optional[str]
     theme: ThemeConfiguration
     lifetime_threshold: int
+    incremental: bool
+    processes: int
+    snapshot: bool
+    image_cache_size: Optional[int]
+    image_formats: List[str]
+    normalize_permissions: bool
+    sitemap_gzip: bool
 
     def __init__(self, output_directory_path: str, base_url: str):
         self.cache_directory_path = _CACHE_DIRECTORY_PATH
@@ -103,6 +110,13 @@ class Configuration:
         self.locales[default_locale] = LocaleConfiguration(default_locale)
         self.theme = ThemeConfiguration()
         self.lifetime_threshold = 125
+        self.incremental = False
+        self.processes = 1
+        self.snapshot = False
+        self.image_cache_size = None
+        self.image_formats = []
+        self.normalize_permissions = False
+        self.sitemap_gzip = False
 
     @property
     def www_directory_path(self) -> str:
@@ -180,6 +194,13 @@ _ConfigurationSchema = Schema(All({
         'background_image_id': str,
     }, _theme_configuration),
     'lifetime_threshold': All(int, Range(min=1)),
+    'incremental': bool,
+    'processes': All(int, Range(min=1)),
+    'snapshot': bool,
+    'image_cache_size': All(int, Range(min=1)),
+    'image_formats': [All(str, ImageFormat())],
+    'normalize_permissions': bool,
+    'sitemap_gzip': bool,
 }, _configuration))
 
 
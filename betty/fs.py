@@ -1,13 +1,21 @@
+import asyncio
 import hashlib
 import os
 import shutil
+import threading
 from collections import deque
+from concurrent.futures.thread import ThreadPoolExecutor
 from contextlib import suppress
 from os import walk, path
-from os.path import join, dirname, exists, relpath, getmtime
+from os.path import join, dirname, relpath, getmtime
 from shutil import copy2
 from tempfile import mkdtemp
-from typing import AsyncIterable
+from typing import AsyncIterable, Dict
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 
 async def iterfiles(path: str) -> AsyncIterable[str]:
@@ -27,6 +35,8 @@ def hashfile(path: str) -> str:
 class FileSystem:
     def __init__(self, *paths):
         self._paths = deque(paths)
+        # The most recent copy of each source file, so later copies can link to it rather than copy the file again.
+        self._copies: Dict[str, str] = {}
 
     @property
     def paths(self) -> deque:
@@ -48,15 +58,83 @@ class FileSystem:
                                 ', '.join(tried_paths))
 
     async def copytree(self, source_path: str, destination_path: str) -> str:
+        """
+        Copies a directory from all paths, with files in earlier paths overriding those in later paths.
+
+        Destination files that are copies of their sources already are left alone. Files that were copied before are
+        linked to from their earlier copies, so copying the same directory to several destinations costs little more
+        than copying it once.
+        """
+        source_file_paths = {}
         for fs_path in self._paths:
-            async for file_source_path in iterfiles(join(fs_path, source_path)):
-                file_destination_path = join(destination_path, relpath(
-                    file_source_path, join(fs_path, source_path)))
-                if not exists(file_destination_path):
-                    makedirs(dirname(file_destination_path))
-                    copy2(file_source_path, file_destination_path)
+            tree_path = join(fs_path, source_path)
+            async for source_file_path in iterfiles(tree_path):
+                source_file_paths.setdefault(relpath(source_file_path, tree_path), source_file_path)
+        loop = asyncio.get_event_loop()
+        with ThreadPoolExecutor() as executor:
+            await asyncio.gather(*[
+                loop.run_in_executor(executor, self._copy, source_file_path, join(destination_path, file_path))
+                for file_path, source_file_path in source_file_paths.items()
+            ])
         return destination_path
 
+    def _copy(self, source_file_path: str, destination_file_path: str) -> None:
+        source_stat = os.stat(source_file_path)
+        with suppress(FileNotFoundError):
+            if _is_copy(source_stat, os.stat(destination_file_path)):
+                return
+        makedirs(dirname(destination_file_path))
+        # Replace destinations rather than write to them, because they may be linked to from elsewhere.
+        tmp_destination_file_path = '%s.%d.%d' % (destination_file_path, os.getpid(), threading.get_ident())
+        if not self._link(source_file_path, source_stat, tmp_destination_file_path):
+            _clone(source_file_path, tmp_destination_file_path)
+            # Keep the permissions the copy was created with, and copy the source's times only.
+            os.utime(tmp_destination_file_path, ns=(source_stat.st_atime_ns, source_stat.st_mtime_ns))
+        os.replace(tmp_destination_file_path, destination_file_path)
+        self._copies[source_file_path] = destination_file_path
+
+    def _link(self, source_file_path: str, source_stat: os.stat_result, destination_file_path: str) -> bool:
+        # Only ever link to copies. Linking to sources directly would let changes to the copies, such as to their
+        # permissions, leak back into the sources.
+        try:
+            copy_file_path = self._copies[source_file_path]
+            if not _is_copy(source_stat, os.stat(copy_file_path)):
+                return False
+            os.link(copy_file_path, destination_file_path)
+        except (KeyError, OSError):
+            return False
+        return True
+
+
+def _is_copy(source_stat: os.stat_result, destination_stat: os.stat_result) -> bool:
+    # Copies get their sources' modification times, so these tell us whether the sources changed since.
+    return source_stat.st_size == destination_stat.st_size and source_stat.st_mtime_ns == destination_stat.st_mtime_ns
+
+
+# The Linux ioctl request to make a file share another file's data, on file systems that support copy-on-write.
+_FICLONE = 0x40049409
+
+
+def _clone(source_file_path: str, destination_file_path: str) -> None:
+    """
+    Copies a file's contents, and lets the file system share them rather than duplicate them, where it can.
+    """
+    with open(source_file_path, 'rb') as source_f, open(destination_file_path, 'wb') as destination_f:
+        if fcntl is not None:
+            with suppress(OSError):
+                fcntl.ioctl(destination_f.fileno(), _FICLONE, source_f.fileno())
+                return
+        if hasattr(os, 'copy_file_range'):
+            with suppress(OSError):
+                # Copy within the kernel, which may also share the contents on file systems that support it.
+                while os.copy_file_range(source_f.fileno(), destination_f.fileno(), 2 ** 30):
+                    pass
+                return
+            source_f.seek(0)
+            destination_f.seek(0)
+            destination_f.truncate()
+        shutil.copyfileobj(source_f, destination_f)
+
 
 class DirectoryBackup:
     def __init__(self, root_path: str, backup_path: str):
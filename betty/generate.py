@@ -1,18 +1,27 @@
+import asyncio
 import logging
+import math
+import multiprocessing
 import os
+import shutil
+import stat
+from concurrent.futures.thread import ThreadPoolExecutor
 from contextlib import suppress
-from json import dump
-from os import chmod
-from os.path import join
-from typing import Iterable, Any
+from json import dumps
+from os.path import join, exists
+from typing import Iterable, Any, List, Optional, Dict
 
 from babel import Locale
 from jinja2 import Environment, TemplateNotFound
 
+from betty.concurrent import ExceptionRaisingExecutor
 from betty.fs import makedirs
-from betty.json import JSONEncoder
+from betty.locale import Translations
+from betty.manifest import Manifest, Fingerprinter, fingerprint_site, manifest_file_path
 from betty.openapi import build_specification
+from betty.search import Index
 from betty.site import Site
+from betty.sitemap import Sitemap
 
 
 class PostStaticGenerator:
@@ -25,12 +34,68 @@ class PostGenerator:
         raise NotImplementedError
 
 
+_ENTITY_TYPES = [
+    ('file', 'files'),
+    ('person', 'people'),
+    ('place', 'places'),
+    ('event', 'events'),
+    ('citation', 'citations'),
+    ('source', 'sources'),
+]
+
+
 async def generate(site: Site) -> None:
+    # Create all files and directories with their final permissions, so they need not be changed afterwards. Processes
+    # forked from here on, such as the render workers, inherit the mask.
+    umask = os.umask(0o022)
+    try:
+        await _generate(site)
+    finally:
+        os.umask(umask)
+
+
+async def _generate(site: Site) -> None:
+    logger = logging.getLogger()
+    if site.configuration.incremental:
+        manifest = Manifest.load(manifest_file_path(site))
+        fingerprinter = Fingerprinter(fingerprint_site(site))
+    else:
+        # A full generation does not record fingerprints, so any existing manifest no longer describes the output.
+        with suppress(FileNotFoundError):
+            os.remove(manifest_file_path(site))
+        manifest = fingerprinter = None
+    render_pool = _RenderPool.for_site(site)
+    writer = _Writer()
+    try:
+        await _generate_resources(site, manifest, fingerprinter, render_pool, writer)
+    finally:
+        writer.close()
+    if render_pool is not None:
+        # Derive the images requested so far while the workers render the remaining pages.
+        if site.image_batch:
+            site.image_batch.submit(site.executor)
+        page_count = await render_pool.join()
+        logger.info('Generated %d scheduled pages in %d processes.' % (page_count, site.configuration.processes))
+    if site.configuration.normalize_permissions:
+        _normalize_permissions(site.configuration.www_directory_path)
+        logger.info('Normalized the permissions of the generated site.')
+    else:
+        # The output directory may predate this generation.
+        _chmod(site.configuration.www_directory_path, 0o755)
+    if manifest is not None:
+        manifest.save(manifest_file_path(site))
+    await site.dispatcher.dispatch(PostGenerator, 'post_generate')()
+
+
+async def _generate_resources(site: Site, manifest: Optional[Manifest], fingerprinter: Optional[Fingerprinter],
+                              render_pool: Optional['_RenderPool'], writer: '_Writer') -> None:
     logger = logging.getLogger()
     await site.assets.copytree(join('public', 'static'),
                                site.configuration.www_directory_path)
     await site.renderer.render_tree(site.configuration.www_directory_path)
     await site.dispatcher.dispatch(PostStaticGenerator, 'post_static_generate')()
+    Sitemap(site, site.configuration.sitemap_gzip).write(site.configuration.www_directory_path)
+    logger.info('Generated the sitemap.')
     for locale, locale_configuration in site.configuration.locales.items():
         async with site.with_locale(locale) as site:
             if site.configuration.multilingual:
@@ -43,119 +108,313 @@ async def generate(site: Site) -> None:
             await site.renderer.render_tree(www_directory_path)
 
             locale_label = Locale.parse(locale, '-').get_display_name()
-            await _generate_entity_type(www_directory_path, site.ancestry.files.values(
-            ), 'file', site, locale, site.jinja2_environment)
-            logger.info('Generated pages for %d files in %s.' %
-                        (len(site.ancestry.files), locale_label))
-            await _generate_entity_type(www_directory_path, site.ancestry.people.values(
-            ), 'person', site, locale, site.jinja2_environment)
-            logger.info('Generated pages for %d people in %s.' %
-                        (len(site.ancestry.people), locale_label))
-            await _generate_entity_type(www_directory_path, site.ancestry.places.values(
-            ), 'place', site, locale, site.jinja2_environment)
-            logger.info('Generated pages for %d places in %s.' %
-                        (len(site.ancestry.places), locale_label))
-            await _generate_entity_type(www_directory_path, site.ancestry.events.values(
-            ), 'event', site, locale, site.jinja2_environment)
-            logger.info('Generated pages for %d events in %s.' %
-                        (len(site.ancestry.events), locale_label))
-            await _generate_entity_type(www_directory_path, site.ancestry.citations.values(
-            ), 'citation', site, locale, site.jinja2_environment)
-            logger.info('Generated pages for %d citations in %s.' %
-                        (len(site.ancestry.citations), locale_label))
-            await _generate_entity_type(www_directory_path, site.ancestry.sources.values(
-            ), 'source', site, locale, site.jinja2_environment)
-            logger.info('Generated pages for %d sources in %s.' %
-                        (len(site.ancestry.sources), locale_label))
-            _generate_entity_type_list_json(www_directory_path, site.ancestry.notes.values(), 'note', site)
-            for note in site.ancestry.notes.values():
-                _generate_entity_json(www_directory_path, note, 'note', site, locale)
-            logger.info('Generated pages for %d notes in %s.' % (len(site.ancestry.notes), locale_label))
-            _generate_openapi(www_directory_path, site)
+            for entity_type_name, collection_name in _ENTITY_TYPES:
+                entities = getattr(site.ancestry, collection_name).values()
+                changed_entities = _select_changed_entities(www_directory_path, entities, entity_type_name, locale,
+                                                            manifest, fingerprinter)
+                writer.makedirs(_entity_type_directory_paths(www_directory_path, changed_entities, entity_type_name))
+                if render_pool is None:
+                    await _generate_entity_type(www_directory_path, entities, changed_entities, entity_type_name, site,
+                                                locale, site.jinja2_environment, writer)
+                    logger.info('Generated pages for %d %s in %s.' %
+                                (len(changed_entities), collection_name, locale_label))
+                else:
+                    await _generate_entity_type_lists(www_directory_path, entities, entity_type_name, site,
+                                                      site.jinja2_environment, writer)
+                    render_pool.render(www_directory_path, changed_entities, entity_type_name, collection_name, locale)
+                    logger.info('Scheduled pages for %d %s in %s.' %
+                                (len(changed_entities), collection_name, locale_label))
+            changed_notes = _select_changed_entities(www_directory_path, site.ancestry.notes.values(), 'note', locale,
+                                                     manifest, fingerprinter)
+            writer.makedirs(_entity_type_directory_paths(www_directory_path, changed_notes, 'note'))
+            _generate_entity_type_list_json(www_directory_path, site.ancestry.notes.values(), 'note', site, writer)
+            for note in changed_notes:
+                _generate_entity_json(www_directory_path, note, 'note', site, locale, writer)
+            logger.info('Generated pages for %d notes in %s.' % (len(changed_notes), locale_label))
+            _generate_openapi(www_directory_path, site, writer)
             logger.info('Generated OpenAPI documentation in %s.', locale_label)
-    chmod(site.configuration.www_directory_path, 0o755)
-    for directory_path, subdirectory_names, file_names in os.walk(site.configuration.www_directory_path):
-        for subdirectory_name in subdirectory_names:
-            chmod(join(directory_path, subdirectory_name), 0o755)
-        for file_name in file_names:
-            chmod(join(directory_path, file_name), 0o644)
-    await site.dispatcher.dispatch(PostGenerator, 'post_generate')()
+            await Index(site).write(join(www_directory_path, 'search'))
+            logger.info('Generated the search index in %s.', locale_label)
 
 
-def _create_file(path: str) -> object:
-    makedirs(os.path.dirname(path))
-    return open(path, 'w')
+def _normalize_permissions(directory_path: str) -> None:
+    """
+    Makes all files and directories in a directory readable by everyone, such as those put there by other tools.
+    """
+    with ExceptionRaisingExecutor(ThreadPoolExecutor(), 256) as executor:
+        for subdirectory_path, _, file_names in os.walk(directory_path):
+            executor.submit(_normalize_directory_permissions, subdirectory_path, file_names)
 
 
-def _create_html_resource(path: str) -> object:
-    return _create_file(os.path.join(path, 'index.html'))
+def _normalize_directory_permissions(directory_path: str, file_names: List[str]) -> None:
+    _chmod(directory_path, 0o755)
+    for file_name in file_names:
+        _chmod(join(directory_path, file_name), 0o644)
 
 
-def _create_json_resource(path: str) -> object:
-    return _create_file(os.path.join(path, 'index.json'))
+def _chmod(path: str, mode: int) -> None:
+    # Most paths have the right permissions already, and checking them is cheaper than changing them.
+    if stat.S_IMODE(os.stat(path).st_mode) != mode:
+        os.chmod(path, mode)
 
 
-async def _generate_entity_type(www_directory_path: str, entities: Iterable[Any], entity_type_name: str, site: Site,
-                                locale: str, environment: Environment) -> None:
-    await _generate_entity_type_list_html(
-        www_directory_path, entities, entity_type_name, environment)
-    _generate_entity_type_list_json(
-        www_directory_path, entities, entity_type_name, site)
+class _Writer:
+    """
+    Writes generated files on a thread pool, so pages can be rendered while earlier pages are written to disk.
+
+    Files are written to directories that exist already, in a single write each. See makedirs().
+    """
+
+    def __init__(self, max_pending: int = 256):
+        """
+        :param max_pending: The maximum number of files waiting to be written. This bounds the memory that their
+            contents take up, because write() blocks until earlier files are written.
+        """
+        self._executor = ExceptionRaisingExecutor(ThreadPoolExecutor(), max_pending)
+
+    def makedirs(self, directory_paths: Iterable[str]) -> None:
+        """
+        Creates the directories to write files to, in a single pass.
+        """
+        for directory_path in directory_paths:
+            makedirs(directory_path)
+
+    def write(self, file_path: str, contents: str) -> None:
+        self._executor.submit(_write, file_path, contents.encode('utf-8'))
+
+    def close(self) -> None:
+        """
+        Waits for all files to be written.
+        """
+        self._executor.shutdown()
+
+
+def _write(file_path: str, contents: bytes) -> None:
+    # Use the file descriptor directly, because the contents are written at once and need no buffering.
+    fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    try:
+        contents = memoryview(contents)
+        while contents:
+            contents = contents[os.write(fd, contents):]
+    finally:
+        os.close(fd)
+
+
+def _entity_type_directory_paths(www_directory_path: str, entities: Iterable[Any], entity_type_name: str) -> Iterable[str]:
+    entity_type_path = os.path.join(www_directory_path, entity_type_name)
+    yield entity_type_path
     for entity in entities:
+        yield os.path.join(entity_type_path, entity.id)
+
+
+def _select_changed_entities(www_directory_path: str, entities: Iterable[Any], entity_type_name: str, locale: str,
+                             manifest: Optional[Manifest], fingerprinter: Optional[Fingerprinter]) -> List[Any]:
+    """
+    Selects the entities whose pages must be (re)generated, and removes the pages of entities that no longer exist.
+    """
+    if manifest is None:
+        return list(entities)
+
+    previous_fingerprints = manifest.get(locale, entity_type_name)
+    fingerprints = {}
+    changed_entities = []
+    for entity in entities:
+        fingerprint = fingerprinter.fingerprint(entity)
+        fingerprints[entity.id] = fingerprint
+        entity_path = os.path.join(www_directory_path, entity_type_name, entity.id)
+        if previous_fingerprints.get(entity.id) != fingerprint or not exists(os.path.join(entity_path, 'index.json')):
+            changed_entities.append(entity)
+    for removed_entity_id in previous_fingerprints.keys() - fingerprints.keys():
+        shutil.rmtree(os.path.join(www_directory_path, entity_type_name, removed_entity_id), ignore_errors=True)
+    manifest.set(locale, entity_type_name, fingerprints)
+    return changed_entities
+
+
+class _RenderPool:
+    """
+    Renders resource pages in worker processes.
+
+    Workers are forked from the generating process, so each inherits the site and its ancestry exactly once, rather than
+    having them pickled along with every page. Each worker builds its own Jinja2 environment for every locale it renders
+    pages in, and only resource IDs are sent to the workers.
+    """
+
+    # Split each entity type into at least this many batches per process, so that workers that finish early can take on
+    # some of the remaining work.
+    _BATCHES_PER_PROCESS = 4
+    _MAX_BATCH_SIZE = 250
+
+    def __init__(self, site: Site):
+        self._site = site
+        self._pool = None
+        self._pending = []
+
+    @classmethod
+    def for_site(cls, site: Site) -> Optional['_RenderPool']:
+        if site.configuration.processes < 2:
+            return None
+        # Workers must inherit the site rather than unpickle it, which requires forking.
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            logging.getLogger().warning('Your platform cannot fork processes, so pages will be rendered in a single process.')
+            return None
+        return cls(site)
+
+    def render(self, www_directory_path: str, entities: List[Any], entity_type_name: str, collection_name: str,
+               locale: str) -> None:
+        if not entities:
+            return
+        if self._pool is None:
+            # Submit the images requested so far, so the workers do not inherit them and derive them again.
+            if self._site.image_batch:
+                self._site.image_batch.submit(self._site.executor)
+            # Fork lazily, so the workers inherit the site as it is once generation started.
+            self._pool = multiprocessing.get_context('fork').Pool(
+                self._site.configuration.processes, _init_render_worker, (self._site,))
+        loop = asyncio.get_event_loop()
+        batch_size = max(1, min(self._MAX_BATCH_SIZE, math.ceil(
+            len(entities) / (self._site.configuration.processes * self._BATCHES_PER_PROCESS))))
+        for i in range(0, len(entities), batch_size):
+            entity_ids = [entity.id for entity in entities[i:i + batch_size]]
+            future = loop.create_future()
+            self._pool.apply_async(
+                _render_worker_batch,
+                (www_directory_path, entity_ids, entity_type_name, collection_name, locale),
+                callback=lambda result, future=future: loop.call_soon_threadsafe(_resolve, future, result),
+                error_callback=lambda error, future=future: loop.call_soon_threadsafe(_reject, future, error),
+            )
+            self._pending.append(future)
+
+    async def join(self) -> int:
+        try:
+            return sum(await asyncio.gather(*self._pending))
+        finally:
+            self._pending = []
+            if self._pool is not None:
+                self._pool.terminate()
+                self._pool.join()
+                self._pool = None
+
+
+def _resolve(future: asyncio.Future, result: Any) -> None:
+    if not future.done():
+        future.set_result(result)
+
+
+def _reject(future: asyncio.Future, error: BaseException) -> None:
+    if not future.done():
+        future.set_exception(error)
+
+
+_render_worker_site = None
+_render_worker_locale_sites: Dict[str, Site] = {}
+
+
+def _init_render_worker(site: Site) -> None:
+    global _render_worker_site
+    _render_worker_site = site
+    _render_worker_locale_sites.clear()
+    # The generating process's event loop cannot be shared with its forks.
+    asyncio.set_event_loop(asyncio.new_event_loop())
+
+
+def _render_worker_batch(www_directory_path: str, entity_ids: List[str], entity_type_name: str, collection_name: str,
+                         locale: str) -> int:
+    try:
+        site = _render_worker_locale_sites[locale]
+    except KeyError:
+        site = _render_worker_locale_sites[locale] = _render_worker_site.with_locale(locale)
+    entities = getattr(site.ancestry, collection_name)
+    # The generating process's executor cannot be used from its forks, so give each batch an executor of its own, and
+    # wait for it to finish any work the batch submitted before reporting back.
+    site._executor = ExceptionRaisingExecutor(ThreadPoolExecutor())
+    # The generating process created the entities' directories already.
+    writer = _Writer()
+    try:
+        with Translations(site.translations[site.locale]):
+            asyncio.get_event_loop().run_until_complete(_generate_entities(
+                www_directory_path, [entities[entity_id] for entity_id in entity_ids], entity_type_name, site, writer))
+        site.image_batch.submit(site._executor)
+    finally:
+        try:
+            writer.close()
+        finally:
+            site._executor.shutdown()
+    return len(entity_ids)
+
+
+async def _generate_entities(www_directory_path: str, entities: Iterable[Any], entity_type_name: str, site: Site,
+                             writer: _Writer) -> None:
+    for entity in entities:
+        await _generate_entity(www_directory_path, entity, entity_type_name, site, site.locale, site.jinja2_environment,
+                               writer)
+
+
+async def _generate_entity_type(www_directory_path: str, entities: Iterable[Any], changed_entities: Iterable[Any],
+                                entity_type_name: str, site: Site, locale: str, environment: Environment,
+                                writer: _Writer) -> None:
+    await _generate_entity_type_lists(www_directory_path, entities, entity_type_name, site, environment, writer)
+    for entity in changed_entities:
         await _generate_entity(www_directory_path, entity,
-                               entity_type_name, site, locale, environment)
+                               entity_type_name, site, locale, environment, writer)
+
+
+async def _generate_entity_type_lists(www_directory_path: str, entities: Iterable[Any], entity_type_name: str,
+                                      site: Site, environment: Environment, writer: _Writer) -> None:
+    await _generate_entity_type_list_html(
+        www_directory_path, entities, entity_type_name, environment, writer)
+    _generate_entity_type_list_json(
+        www_directory_path, entities, entity_type_name, site, writer)
 
 
 async def _generate_entity_type_list_html(www_directory_path: str, entities: Iterable[Any], entity_type_name: str,
-                                          environment: Environment) -> None:
+                                          environment: Environment, writer: _Writer) -> None:
     entity_type_path = os.path.join(www_directory_path, entity_type_name)
     with suppress(TemplateNotFound):
         template = environment.get_template(
             'page/list-%s.html.j2' % entity_type_name)
-        with _create_html_resource(entity_type_path) as f:
-            f.write(await template.render_async({
-                'page_resource': '/%s/index.html' % entity_type_name,
-                'entity_type_name': entity_type_name,
-                'entities': entities,
-            }))
+        writer.write(os.path.join(entity_type_path, 'index.html'), await template.render_async({
+            'page_resource': '/%s/index.html' % entity_type_name,
+            'entity_type_name': entity_type_name,
+            'entities': entities,
+        }))
 
 
-def _generate_entity_type_list_json(www_directory_path: str, entities: Iterable[Any], entity_type_name: str, site: Site) -> None:
+def _generate_entity_type_list_json(www_directory_path: str, entities: Iterable[Any], entity_type_name: str, site: Site,
+                                    writer: _Writer) -> None:
     entity_type_path = os.path.join(www_directory_path, entity_type_name)
-    with _create_json_resource(entity_type_path) as f:
-        data = {
-            '$schema': site.static_url_generator.generate('schema.json#/definitions/%sCollection' % entity_type_name, absolute=True),
-            'collection': []
-        }
-        for entity in entities:
-            data['collection'].append(site.localized_url_generator.generate(
-                entity, 'application/json', absolute=True))
-        dump(data, f)
-
-
-async def _generate_entity(www_directory_path: str, entity: Any, entity_type_name: str, site: Site, locale: str, environment: Environment) -> None:
+    data = {
+        '$schema': site.static_url_generator.generate('schema.json#/definitions/%sCollection' % entity_type_name, absolute=True),
+        'collection': []
+    }
+    for entity in entities:
+        data['collection'].append(site.localized_url_generator.generate(
+            entity, 'application/json', absolute=True))
+    writer.write(os.path.join(entity_type_path, 'index.json'), site.json_encoder.encode(data))
+
+
+async def _generate_entity(www_directory_path: str, entity: Any, entity_type_name: str, site: Site, locale: str,
+                           environment: Environment, writer: _Writer) -> None:
     await _generate_entity_html(www_directory_path, entity,
-                                entity_type_name, environment)
+                                entity_type_name, environment, writer)
     _generate_entity_json(www_directory_path, entity,
-                          entity_type_name, site, locale)
+                          entity_type_name, site, locale, writer)
 
 
-async def _generate_entity_html(www_directory_path: str, entity: Any, entity_type_name: str, environment: Environment) -> None:
+async def _generate_entity_html(www_directory_path: str, entity: Any, entity_type_name: str, environment: Environment,
+                                writer: _Writer) -> None:
     entity_path = os.path.join(www_directory_path, entity_type_name, entity.id)
-    with _create_html_resource(entity_path) as f:
-        f.write(await environment.get_template('page/%s.html.j2' % entity_type_name).render_async({
-            'page_resource': entity,
-            'entity_type_name': entity_type_name,
-            entity_type_name: entity,
-        }))
+    writer.write(os.path.join(entity_path, 'index.html'), await environment.get_template('page/%s.html.j2' % entity_type_name).render_async({
+        'page_resource': entity,
+        'entity_type_name': entity_type_name,
+        entity_type_name: entity,
+    }))
 
 
-def _generate_entity_json(www_directory_path: str, entity: Any, entity_type_name: str, site: Site, locale: str) -> None:
+def _generate_entity_json(www_directory_path: str, entity: Any, entity_type_name: str, site: Site, locale: str,
+                          writer: _Writer) -> None:
     entity_path = os.path.join(www_directory_path, entity_type_name, entity.id)
-    with _create_json_resource(entity_path) as f:
-        dump(entity, f, cls=JSONEncoder.get_factory(site, locale))
+    writer.write(os.path.join(entity_path, 'index.json'), site.with_locale(locale).json_encoder.encode(entity))
 
 
-def _generate_openapi(www_directory_path: str, site: Site) -> None:
-    with open(join(www_directory_path, 'api', 'index.json'), 'w') as f:
-        dump(build_specification(site), f)
+def _generate_openapi(www_directory_path: str, site: Site, writer: _Writer) -> None:
+    writer.write(join(www_directory_path, 'api', 'index.json'), dumps(build_specification(site)))
@@ -1,4 +1,7 @@
-from typing import Iterable, Any, Tuple, Set, Dict
+from collections import Counter
+from heapq import heappop, heappush
+from itertools import chain, repeat
+from typing import Any, Tuple, Set, Dict, List
 
 Vertex = Any
 Edge = Tuple[Vertex, Vertex]
@@ -10,39 +13,71 @@ class GraphError(BaseException):
 
 
 class CyclicGraphError(GraphError):
-    pass  # pragma: no cover
+    def __init__(self, vertices: List[Vertex]):
+        """
+        :param vertices: The vertices that form the cycle, in the order of their edges.
+        """
+        super().__init__('The graph contains a cycle: %s.' % ' -> '.join(map(str, vertices + vertices[:1])))
+        self.vertices = vertices
+
+
+def tsort(graph: Graph) -> List[Vertex]:
+    """
+    Sorts a graph's vertices topologically, so each vertex comes before the vertices its edges point to.
 
+    Vertices that do not depend on each other keep the order in which the graph lists them, so the same graph is always
+    sorted the same way.
 
-def tsort(graph: Graph) -> Iterable[Vertex]:
-    edges = list(_graph_to_edges(graph))
+    :raises CyclicGraphError: Raised if the graph contains a cycle.
+    """
+    # Order vertices by their indexes, so they can be ordered even if the vertices themselves cannot.
+    vertices: List[Vertex] = list(graph)
+    indexes = {vertex: index for index, vertex in enumerate(vertices)}
+    vertex_indegrees = Counter(chain.from_iterable(graph.values()))
+    for vertex in vertex_indegrees:
+        # Vertices may be edge targets without being listed themselves.
+        if vertex not in indexes:
+            indexes[vertex] = len(vertices)
+            vertices.append(vertex)
+    indegrees = list(map(vertex_indegrees.get, vertices, repeat(0)))
+
+    # This list is sorted, which makes it a heap already.
+    sources = [index for index, indegree in enumerate(indegrees) if not indegree]
     sorted_vertices = []
-    outdegree_vertices = list(
-        [edge[0] for edge in edges if not _is_target(edge[0], edges)])
-    while outdegree_vertices:
-        outdegree_vertex = outdegree_vertices.pop()
-        if outdegree_vertex not in sorted_vertices:
-            sorted_vertices.append(outdegree_vertex)
-        outdegree_vertex_edges = list(
-            [edge for edge in edges if edge[0] == outdegree_vertex])
-        while outdegree_vertex_edges:
-            edge = outdegree_vertex_edges.pop()
-            edges.remove(edge)
-            if not _is_target(edge[1], edges):
-                outdegree_vertices.append(edge[1])
-    if edges:
-        raise CyclicGraphError
-    isolated_vertices = list(graph.keys() - sorted_vertices)
-    return sorted_vertices + isolated_vertices
-
-
-def _graph_to_edges(graph: Graph) -> Iterable[Edge]:
-    for from_vertex, to_vertices in graph.items():
-        for to_vertex in to_vertices:
-            yield from_vertex, to_vertex
-
-
-def _is_target(vertex: Vertex, edges: Iterable[Edge]) -> bool:
-    for edge in edges:
-        if vertex == edge[1]:
-            return True
-    return False
+    while sources:
+        vertex = vertices[heappop(sources)]
+        sorted_vertices.append(vertex)
+        for to_vertex in graph.get(vertex, ()):
+            to_index = indexes[to_vertex]
+            indegrees[to_index] -= 1
+            if not indegrees[to_index]:
+                heappush(sources, to_index)
+    if len(sorted_vertices) < len(vertices):
+        raise CyclicGraphError(_find_cycle(graph, vertices, indexes, indegrees))
+    return sorted_vertices
+
+
+def _find_cycle(graph: Graph, vertices: List[Vertex], indexes: Dict[Vertex, int], indegrees: List[int]) -> List[Vertex]:
+    """
+    Finds a cycle among the vertices that could not be sorted.
+    """
+    # Each of these vertices has an incoming edge from another one of them, so following those edges backwards must
+    # eventually lead to a vertex that was visited before.
+    unsorted_indexes = {index for index, indegree in enumerate(indegrees) if indegree}
+    predecessors = {}
+    for index in unsorted_indexes:
+        for to_vertex in graph.get(vertices[index], ()):
+            to_index = indexes[to_vertex]
+            if to_index in unsorted_indexes:
+                predecessors[to_index] = index
+    path = []
+    path_positions = {}
+    index = min(unsorted_indexes)
+    while index not in path_positions:
+        path_positions[index] = len(path)
+        path.append(index)
+        index = predecessors[index]
+    cycle = list(reversed(path[path_positions[index]:]))
+    # Start the cycle at the vertex the graph lists first.
+    start = cycle.index(min(cycle))
+    return [vertices[index] for index in cycle[start:] + cycle[:start]]
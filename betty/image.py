@@ -0,0 +1,183 @@
+import hashlib
+import os
+import sqlite3
+from concurrent.futures import Executor
+from contextlib import suppress
+from os.path import join, exists, getsize, splitext
+from time import time
+from typing import Callable, Optional, Any, Dict, Hashable, List, Tuple
+
+from PIL import Image
+
+from betty.fs import makedirs
+
+try:
+    # Older Pillow versions can only save AVIF images through this plugin, which registers itself when imported.
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pillow_avif = None
+
+# The additional formats images can be derived in, keyed by their file extensions.
+FORMAT_MEDIA_TYPES = {
+    'avif': 'image/avif',
+    'webp': 'image/webp',
+}
+
+
+def is_format_supported(image_format: str) -> bool:
+    """
+    Checks if Pillow can save images in one of the formats in FORMAT_MEDIA_TYPES.
+    """
+    Image.init()
+    return Image.registered_extensions().get('.%s' % image_format) in Image.SAVE
+
+
+class ImageCache:
+    """
+    Caches image derivatives, such as resized images, by the contents of their source images and the transformations
+    that derived them.
+
+    An index database records the source and size of every derivative, and when it was last used, so the cache can be
+    kept within a disk budget by removing the least recently used derivatives first.
+    """
+
+    def __init__(self, cache_directory_path: str, size: Optional[int] = None):
+        """
+        :param size: The maximum size of all derivatives together, in bytes, or None to let the cache grow indefinitely.
+        """
+        makedirs(cache_directory_path)
+        self._cache_directory_path = cache_directory_path
+        self._size = size
+        self._index_connection = None
+        self._index_connection_pid = None
+
+    def close(self) -> None:
+        if self._index_connection is not None:
+            self._index_connection.close()
+            self._index_connection = None
+
+    @property
+    def _index(self) -> sqlite3.Connection:
+        # SQLite connections cannot be shared with forked processes, so each process opens its own.
+        if self._index_connection is None or self._index_connection_pid != os.getpid():
+            self._index_connection = sqlite3.connect(join(self._cache_directory_path, 'index.sqlite'), timeout=60)
+            self._index_connection_pid = os.getpid()
+            with self._index_connection:
+                self._index_connection.execute('CREATE TABLE IF NOT EXISTS sources (path TEXT NOT NULL PRIMARY KEY, size INTEGER NOT NULL, mtime INTEGER NOT NULL, hash TEXT NOT NULL)')
+                self._index_connection.execute('CREATE TABLE IF NOT EXISTS derivatives (file_name TEXT NOT NULL PRIMARY KEY, source_hash TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)')
+                self._index_connection.execute('CREATE INDEX IF NOT EXISTS derivatives_last_used ON derivatives (last_used)')
+        return self._index_connection
+
+    def hash_source(self, source_file_path: str) -> str:
+        """
+        Hashes a source image by its contents.
+
+        Hashes are remembered for as long as the source's size and modification time remain the same, so unchanged
+        sources are read only once.
+        """
+        stat = os.stat(source_file_path)
+        row = self._index.execute('SELECT hash FROM sources WHERE path = ? AND size = ? AND mtime = ?', (source_file_path, stat.st_size, stat.st_mtime_ns)).fetchone()
+        if row is not None:
+            return row[0]
+        hasher = hashlib.sha256()
+        with open(source_file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(2 ** 20), b''):
+                hasher.update(chunk)
+        source_hash = hasher.hexdigest()
+        with self._index:
+            self._index.execute('INSERT OR REPLACE INTO sources (path, size, mtime, hash) VALUES (?, ?, ?, ?)', (source_file_path, stat.st_size, stat.st_mtime_ns, source_hash))
+        return source_hash
+
+    def publish(self, source_file_path: str, transformation: str, derive: Callable[[str], None], destination_file_path: str) -> None:
+        """
+        Publishes a derivative of a source image, and derives it first if it is not cached yet.
+
+        :param transformation: Describes the transformation that derives the image, and must be safe to use in file
+            names. It must end with the derivative's file extension.
+        :param derive: Derives the image, and saves it to the given file path.
+        """
+        source_hash = self.hash_source(source_file_path)
+        file_name = '%s-%s' % (source_hash, transformation)
+        file_path = join(self._cache_directory_path, file_name)
+        makedirs(os.path.dirname(destination_file_path))
+        while True:
+            derived = False
+            if not exists(file_path):
+                # Save to a process-specific path first, so concurrent processes never see partially written images.
+                file_path_root, file_path_extension = splitext(file_path)
+                tmp_file_path = '%s.%d%s' % (file_path_root, os.getpid(), file_path_extension)
+                derive(tmp_file_path)
+                os.replace(tmp_file_path, file_path)
+                derived = True
+            try:
+                os.link(file_path, destination_file_path)
+            except FileExistsError:
+                # Pages may be rendered by several processes, each of which may publish the same image.
+                pass
+            except FileNotFoundError:
+                # Another process removed the derivative from the cache in the meantime.
+                continue
+            break
+        with self._index:
+            self._index.execute('INSERT OR REPLACE INTO derivatives (file_name, source_hash, size, last_used) VALUES (?, ?, ?, ?)', (file_name, source_hash, getsize(file_path), time()))
+        # The cache only grows when new derivatives are added to it.
+        if derived and self._size is not None:
+            cache_size, = self._index.execute('SELECT COALESCE(SUM(size), 0) FROM derivatives').fetchone()
+            if cache_size > self._size:
+                self.prune(size=self._size)
+
+    def prune(self, size: Optional[int] = None, unused_since: Optional[float] = None) -> int:
+        """
+        Removes derivatives from the cache.
+
+        Published derivatives are linked to rather than copied, so they remain published after they are pruned.
+
+        :param size: Remove the least recently used derivatives until all derivatives together are at most this many
+            bytes.
+        :param unused_since: Remove the derivatives that were last used before this timestamp.
+        :return: The number of derivatives that were removed.
+        """
+        file_names = set()
+        if unused_since is not None:
+            file_names.update(file_name for file_name, in self._index.execute('SELECT file_name FROM derivatives WHERE last_used < ?', (unused_since,)))
+        if size is not None:
+            cache_size = 0
+            for file_name, file_size in self._index.execute('SELECT file_name, size FROM derivatives ORDER BY last_used DESC'):
+                cache_size += file_size
+                if cache_size > size:
+                    file_names.add(file_name)
+        with self._index:
+            self._index.executemany('DELETE FROM derivatives WHERE file_name = ?', [(file_name,) for file_name in file_names])
+        for file_name in file_names:
+            with suppress(FileNotFoundError):
+                os.remove(join(self._cache_directory_path, file_name))
+        return len(file_names)
+
+
+class ImageBatch:
+    """
+    Collects the derivatives requested of source images, so each source can be decoded once for all of them.
+    """
+
+    def __init__(self):
+        self._jobs: Dict[Tuple[Callable, Tuple[Hashable, ...]], List[Any]] = {}
+
+    def __len__(self) -> int:
+        return sum(map(len, self._jobs.values()))
+
+    def add(self, job: Callable, args: Tuple[Hashable, ...], derivative: Any) -> None:
+        """
+        Adds a derivative to the job for its source.
+
+        :param job: The job to derive the source's images with. It is called with args, and a list of derivatives.
+        :param args: The job's arguments that identify the source, such as its file path.
+        """
+        self._jobs.setdefault((job, args), []).append(derivative)
+
+    def submit(self, executor: Executor) -> None:
+        """
+        Submits a job for every source, for all derivatives that were requested of it since the previous submission.
+        """
+        jobs, self._jobs = self._jobs, {}
+        for (job, args), derivatives in jobs.items():
+            executor.submit(job, *args, derivatives)
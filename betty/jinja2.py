@@ -1,12 +1,16 @@
 import asyncio
 import datetime
-import json as stdjson
+import functools
+import hashlib
+import math
 import os
+import pickle
 import re
+import threading
 import warnings
 from contextlib import suppress
 from os.path import join
-from typing import Union, Dict, Type, Optional, Callable, Iterable, AsyncIterable, Any, Iterator
+from typing import Union, Dict, Type, Optional, Callable, Iterable, AsyncIterable, Any, Iterator, List, Tuple
 
 import pdf2image
 from PIL import Image
@@ -16,6 +20,7 @@ from geopy import units
 from geopy.format import DEGREES_FORMAT
 from jinja2 import Environment, select_autoescape, evalcontextfilter, escape, FileSystemLoader, contextfilter, Template
 from jinja2.asyncsupport import auto_await
+from jinja2.bccache import FileSystemBytecodeCache, Bucket
 from jinja2.filters import prepare_map, make_attrgetter
 from jinja2.nodes import EvalContext
 from jinja2.runtime import Macro, resolve_or_missing, StrictUndefined, Context
@@ -24,15 +29,17 @@ from markupsafe import Markup
 from resizeimage import resizeimage
 
 from betty.ancestry import File, Citation, Identifiable, Resource, HasLinks, HasFiles, Subject, Witness, Dated, \
-    RESOURCE_TYPES
+    RESOURCE_TYPES, Event, get_event_type_order
 from betty.config import Configuration
-from betty.fs import makedirs, hashfile, iterfiles
+from betty.fs import makedirs, iterfiles, _clone
 from betty.functools import walk
 from betty.html import HtmlProvider
+from betty.image import ImageCache, FORMAT_MEDIA_TYPES
 from betty.importlib import import_any
 from betty.json import JSONEncoder
 from betty.locale import negotiate_localizeds, Localized, format_datey, Datey, negotiate_locale, Date, DateRange
 from betty.lock import AcquiredError
+from betty.manifest import fingerprint_betty
 from betty.path import extension
 from betty.plugin import Plugin
 from betty.render import Renderer
@@ -90,6 +97,63 @@ class Jinja2Provider:
         return {}
 
 
+class _BytecodeCache(FileSystemBytecodeCache):
+    """
+    Caches compiled templates on disk, and in memory, so they are compiled once for all locales and processes.
+
+    Jinja2 identifies cached templates by their names and file paths, and ignores those of which the source changed.
+    """
+
+    def __init__(self, directory_path: str):
+        makedirs(directory_path)
+        FileSystemBytecodeCache.__init__(self, directory_path)
+        self._code = {}
+
+    def load_bytecode(self, bucket: Bucket) -> None:
+        with suppress(KeyError):
+            checksum, code = self._code[bucket.key]
+            if checksum == bucket.checksum:
+                bucket.code = code
+                return
+        try:
+            FileSystemBytecodeCache.load_bytecode(self, bucket)
+        except (EOFError, ValueError, pickle.UnpicklingError):
+            # Compile templates anew if their cached code cannot be read.
+            bucket.reset()
+        if bucket.code is not None:
+            self._code[bucket.key] = bucket.checksum, bucket.code
+
+    def dump_bytecode(self, bucket: Bucket) -> None:
+        self._code[bucket.key] = bucket.checksum, bucket.code
+        cache_file_path = self._get_cache_filename(bucket)
+        # Write the code to a temporary file first, so other processes never read incomplete code.
+        temporary_cache_file_path = '%s.%d' % (cache_file_path, os.getpid())
+        with open(temporary_cache_file_path, 'wb') as f:
+            bucket.write_bytecode(f)
+        os.replace(temporary_cache_file_path, cache_file_path)
+
+    def clear(self) -> None:
+        self._code.clear()
+        FileSystemBytecodeCache.clear(self)
+
+
+_bytecode_caches: Dict[str, _BytecodeCache] = {}
+
+
+def _get_bytecode_cache(site: Site, template_directory_paths: List[str]) -> _BytecodeCache:
+    # Templates compile differently depending on the environment and Betty's own code, so keep separate caches for each.
+    directory_path = join(site.configuration.cache_directory_path, 'jinja2', hashlib.md5(repr((
+        site.configuration.mode,
+        template_directory_paths,
+        fingerprint_betty(),
+    )).encode('utf-8')).hexdigest())
+    try:
+        return _bytecode_caches[directory_path]
+    except KeyError:
+        bytecode_cache = _bytecode_caches[directory_path] = _BytecodeCache(directory_path)
+        return bytecode_cache
+
+
 class BettyEnvironment(Environment):
     site: Site
 
@@ -99,6 +163,7 @@ class BettyEnvironment(Environment):
         Environment.__init__(self,
                              enable_async=True,
                              loader=FileSystemLoader(template_directory_paths),
+                             bytecode_cache=_get_bytecode_cache(site, template_directory_paths),
                              undefined=StrictUndefined,
                              autoescape=select_autoescape(['html']),
                              trim_blocks=True,
@@ -148,6 +213,7 @@ class BettyEnvironment(Environment):
             locale, '-')
         self.filters['negotiate_localizeds'] = _filter_negotiate_localizeds
         self.filters['sort_localizeds'] = _filter_sort_localizeds
+        self.filters['sort_events'] = _filter_sort_events
         self.filters['select_localizeds'] = _filter_select_localizeds
         self.filters['negotiate_dateds'] = _filter_negotiate_dateds
         self.filters['select_dateds'] = _filter_select_dateds
@@ -160,6 +226,7 @@ class BettyEnvironment(Environment):
         self.filters['static_url'] = self.site.static_url_generator.generate
         self.filters['file'] = lambda *args: _filter_file(self.site, *args)
         self.filters['image'] = lambda *args, **kwargs: _filter_image(self.site, *args, **kwargs)
+        self.filters['image_sources'] = lambda *args, **kwargs: _filter_image_sources(self.site, *args, **kwargs)
 
     def _init_tests(self) -> None:
         self.tests['resource'] = lambda x: isinstance(x, Resource)
@@ -230,8 +297,11 @@ def _filter_json(context: Context, data: Any, indent: Optional[int] = None) -> s
     """
     Converts a value to a JSON string.
     """
-    return stdjson.dumps(data, indent=indent,
-                         cls=JSONEncoder.get_factory(context.environment.site, resolve_or_missing(context, 'locale')))
+    site = context.environment.site
+    locale = resolve_or_missing(context, 'locale')
+    if indent is None and locale == site.locale:
+        return site.json_encoder.encode(data)
+    return JSONEncoder(site, locale, indent=indent).encode(data)
 
 
 @contextfilter
@@ -316,20 +386,26 @@ async def _filter_file(site: Site, file: File) -> str:
 def _do_filter_file(file_path: str, destination_directory_path: str, destination_name: str) -> None:
     makedirs(destination_directory_path)
     destination_file_path = os.path.join(destination_directory_path, destination_name)
-    os.link(file_path, destination_file_path)
+    # Pages may be rendered by several processes, each of which may publish the same file.
+    if os.path.exists(destination_file_path):
+        return
+    # Copy rather than link the file, so it is published with the permissions the output is created with, and changing
+    # the published file can never change the original.
+    tmp_destination_file_path = '%s.%d.%d' % (destination_file_path, os.getpid(), threading.get_ident())
+    _clone(file_path, tmp_destination_file_path)
+    os.replace(tmp_destination_file_path, destination_file_path)
 
 
-async def _filter_image(site: Site, file: File, width: Optional[int] = None, height: Optional[int] = None) -> str:
+async def _filter_image(site: Site, file: File, width: Optional[int] = None, height: Optional[int] = None, format: Optional[str] = None) -> str:
     if width is None and height is None:
         raise ValueError('At least the width or height must be given.')
 
-    destination_name = '%s-' % file.id
     if width is None:
-        destination_name += '-x%d' % height
+        transformation = '-x%d' % height
     elif height is None:
-        destination_name += '%dx-' % width
+        transformation = '%dx-' % width
     else:
-        destination_name += '%dx%d' % (width, height)
+        transformation = '%dx%d' % (width, height)
 
     file_directory_path = os.path.join(
         site.configuration.www_directory_path, 'file')
@@ -337,68 +413,136 @@ async def _filter_image(site: Site, file: File, width: Optional[int] = None, hei
     if file.media_type:
         if file.media_type.type == 'image':
             task = _execute_filter_image_image
-            destination_name += '.' + extension(file.path)
+            file_extension = extension(file.path)
         elif file.media_type.type == 'application' and file.media_type.subtype == 'pdf':
             task = _execute_filter_image_application_pdf
-            destination_name += '.' + 'jpg'
+            file_extension = 'jpg'
         else:
             raise ValueError('Cannot convert a file of media type "%s" to an image.' % file.media_type)
     else:
         raise ValueError('Cannot convert a file without a media type to an image.')
 
+    if format is not None:
+        if format not in FORMAT_MEDIA_TYPES:
+            raise ValueError('Cannot convert a file to an image of unknown format "%s".' % format)
+        file_extension = format
+    transformation += '.' + file_extension
+
+    destination_name = '%s-%s' % (file.id, transformation)
+
     with suppress(AcquiredError):
-        site.locks.acquire((_filter_image, file, width, height))
+        site.locks.acquire((_filter_image, file, width, height, format))
         cache_directory_path = join(site.configuration.cache_directory_path, 'image')
-        site.executor.submit(task, file.path, cache_directory_path, file_directory_path, destination_name, width, height)
+        cache_size = site.configuration.image_cache_size
+        if cache_size is not None:
+            cache_size *= 2 ** 20
+        # Collect the derivatives of each file, so the file is decoded once for all of them.
+        site.image_batch.add(_execute_filter_image, (task, file.path, cache_directory_path, cache_size, file_directory_path), (destination_name, transformation, width, height))
 
     destination_public_path = '/file/%s' % destination_name
 
     return destination_public_path
 
 
-def _execute_filter_image_image(file_path: str, *args, **kwargs) -> None:
+async def _filter_image_sources(site: Site, file: File, widths: Iterable[int], aspect_ratio: Optional[float] = None) -> Dict:
+    """
+    Derives an image at several widths, in its own format and in every configured format.
+
+    This returns a dictionary with the following keys, for use in <img> and <picture> elements:
+    - src: The URL to the widest image in the file's own format.
+    - srcset: The srcset of the images in the file's own format.
+    - sources: A list of dictionaries, one per configured format, each with the format's media type as 'type', and the
+      srcset of the images in that format as 'srcset'.
+    """
+    widths = sorted(set(widths))
+    if not widths:
+        raise ValueError('At least one width must be given.')
+
+    async def _derive(image_format: Optional[str]) -> List[Tuple[str, int]]:
+        candidates = []
+        for width in widths:
+            height = None if aspect_ratio is None else round(width / aspect_ratio)
+            public_path = await _filter_image(site, file, width, height, image_format)
+            candidates.append((site.static_url_generator.generate(public_path), width))
+        return candidates
+
+    def _build_srcset(candidates: List[Tuple[str, int]]) -> str:
+        return ', '.join('%s %dw' % candidate for candidate in candidates)
+
+    candidates = await _derive(None)
+    return {
+        'src': candidates[-1][0],
+        'srcset': _build_srcset(candidates),
+        'sources': [{
+            'type': FORMAT_MEDIA_TYPES[image_format],
+            'srcset': _build_srcset(await _derive(image_format)),
+        } for image_format in site.configuration.image_formats],
+    }
+
+
+def _execute_filter_image_image(file_path: str) -> Image:
     with warnings.catch_warnings():
         # Ignore warnings about decompression bombs, because we know where the files come from.
         warnings.simplefilter('ignore', category=DecompressionBombWarning)
-        image = Image.open(file_path)
-    _execute_filter_image(image, file_path, *args, **kwargs)
+        return Image.open(file_path)
 
 
-def _execute_filter_image_application_pdf(file_path: str, *args, **kwargs) -> None:
+def _execute_filter_image_application_pdf(file_path: str) -> Image:
     with warnings.catch_warnings():
         # Ignore warnings about decompression bombs, because we know where the files come from.
         warnings.simplefilter('ignore', category=DecompressionBombWarning)
-        image = pdf2image.convert_from_path(file_path, fmt='jpeg')[0]
-    _execute_filter_image(image, file_path, *args, **kwargs)
+        # We only ever show the first page.
+        return pdf2image.convert_from_path(file_path, fmt='jpeg', first_page=1, last_page=1)[0]
+
+
+def _execute_filter_image(open_image: Callable[[str], Image], file_path: str, cache_directory_path: str, cache_size: Optional[int], destination_directory_path: str, derivatives: List[Tuple[str, str, Optional[int], Optional[int]]]) -> None:
+    image_cache = ImageCache(cache_directory_path, cache_size)
+    image = None
+
+    def _derive(width: Optional[int], height: Optional[int], derivative_file_path: str) -> None:
+        nonlocal image
+        # Only decode the file if any of its derivatives are not cached yet.
+        if image is None:
+            image = open_image(file_path)
+            _draft_image(image, [(width, height) for _, _, width, height in derivatives])
+        if width is None:
+            size = min(height, image.height)
+            convert = resizeimage.resize_height
+        elif height is None:
+            size = min(width, image.width)
+            convert = resizeimage.resize_width
+        else:
+            size = (min(width, image.width), min(height, image.height))
+            convert = resizeimage.resize_cover
+        convert(image, size).save(derivative_file_path)
 
+    try:
+        for destination_name, transformation, width, height in derivatives:
+            image_cache.publish(file_path, transformation, functools.partial(_derive, width, height), join(destination_directory_path, destination_name))
+    finally:
+        if image is not None:
+            image.close()
+        image_cache.close()
 
-def _execute_filter_image(image: Image, file_path: str, cache_directory_path: str, destination_directory_path: str, destination_name: str, width: int, height: int) -> None:
-    makedirs(destination_directory_path)
-    cache_file_path = join(cache_directory_path, '%s-%s' % (hashfile(file_path), destination_name))
-    destination_file_path = join(destination_directory_path, destination_name)
 
-    try:
-        os.link(cache_file_path, destination_file_path)
-    except FileNotFoundError:
-        makedirs(cache_directory_path)
-        with image:
-            if width is not None:
-                width = min(width, image.width)
-            if height is not None:
-                height = min(height, image.height)
-
-            if width is None:
-                size = height
-                convert = resizeimage.resize_height
-            elif height is None:
-                size = width
-                convert = resizeimage.resize_width
-            else:
-                size = (width, height)
-                convert = resizeimage.resize_cover
-            convert(image, size).save(cache_file_path)
-        makedirs(destination_directory_path)
-        os.link(cache_file_path, destination_file_path)
+def _draft_image(image: Image, sizes: Iterable[Tuple[Optional[int], Optional[int]]]) -> None:
+    """
+    Lets JPEG images decode at a fraction of their size, if that leaves enough detail for all derivatives.
+    """
+    if image.format != 'JPEG':
+        return
+    scale = 0
+    for width, height in sizes:
+        if width is None:
+            scale = max(scale, height / image.height)
+        elif height is None:
+            scale = max(scale, width / image.width)
+        else:
+            scale = max(scale, width / image.width, height / image.height)
+    # Decode at least twice the size of the largest derivative, so resizing still has enough detail to resample from.
+    # Decoders scale down by halves at most three times, and never below the requested size, so small downscales decode
+    # the image in full.
+    image.draft(image.mode, (math.ceil(image.width * scale * 2), math.ceil(image.height * scale * 2)))
 
 
 @contextfilter
@@ -434,6 +578,17 @@ def _filter_negotiate_dateds(context: Context, dateds: Iterable[Dated], date: Op
         return next(_filter_select_dateds(context, dateds, date))
 
 
+def _filter_sort_events(events: Iterable[Event]) -> List[Event]:
+    """
+    Sorts events by their dates, and events with equal dates by their types.
+    """
+    event_type_order = get_event_type_order()
+    # Python's sort is stable, so sorting by type first leaves events with equal dates in the order of their types.
+    events = sorted(events, key=lambda event: event_type_order.rank(type(event.type)))
+    events.sort(key=lambda event: event.date)
+    return events
+
+
 @contextfilter
 def _filter_select_dateds(context: Context, dateds: Iterable[Dated], date: Optional[Datey]) -> Iterator[Dated]:
     if date is None:
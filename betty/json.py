@@ -1,6 +1,7 @@
 import json as stdjson
+from contextlib import suppress
 from os import path
-from typing import Dict, Any, Union
+from typing import Dict, Any, Union, Callable, Optional, Type, TextIO
 
 import jsonschema
 from geopy import Point
@@ -14,6 +15,11 @@ from betty.media_type import MediaType
 from betty.plugin.deriver import DerivedEvent
 from betty.site import Site
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 def validate(data: Any, schema_definition: str, site: Site) -> None:
     with open(path.join(path.dirname(__file__), 'assets', 'public', 'static', 'schema.json')) as f:
@@ -26,11 +32,96 @@ def validate(data: Any, schema_definition: str, site: Site) -> None:
         data, schema['definitions'][schema_definition], resolver=ref_resolver)
 
 
+class JSONBackend:
+    """
+    Serializes data for a JSON encoder, which converts any values the backend cannot serialize by itself.
+    """
+
+    def dumps(self, data: Any, encoder: 'JSONEncoder') -> str:
+        raise NotImplementedError
+
+    def dump(self, data: Any, encoder: 'JSONEncoder', f: TextIO) -> None:
+        f.write(self.dumps(data, encoder))
+
+
+class StdlibJSONBackend(JSONBackend):
+    def dumps(self, data: Any, encoder: 'JSONEncoder') -> str:
+        return stdjson.JSONEncoder.encode(encoder, data)
+
+    def dump(self, data: Any, encoder: 'JSONEncoder', f: TextIO) -> None:
+        # Unlike json.dump(), this uses the much faster C encoder whenever it is available, and writes the encoded chunks
+        # to the file directly rather than joining them into a single string first.
+        f.writelines(encoder.iterencode(data, _one_shot=True))
+
+
+class OrjsonJSONBackend(JSONBackend):
+    """
+    Serializes data using orjson.
+
+    orjson only supports compact, non-ASCII-escaped JSON, so encoders with other options use the standard library instead.
+    """
+
+    def __init__(self):
+        self._fallback = StdlibJSONBackend()
+
+    def dumps(self, data: Any, encoder: 'JSONEncoder') -> str:
+        if not self._supports(encoder):
+            return self._fallback.dumps(data, encoder)
+        try:
+            return orjson.dumps(data, default=encoder.default, option=self._get_options(encoder)).decode('utf-8')
+        except TypeError:
+            # orjson cannot serialize some values the standard library can, such as very large integers, and it raises
+            # its own errors instead of those raised while converting values. Let the standard library try again, so it
+            # succeeds or raises the original error.
+            return self._fallback.dumps(data, encoder)
+
+    def dump(self, data: Any, encoder: 'JSONEncoder', f: TextIO) -> None:
+        if self._supports(encoder):
+            f.write(self.dumps(data, encoder))
+        else:
+            self._fallback.dump(data, encoder, f)
+
+    def _get_options(self, encoder: 'JSONEncoder') -> int:
+        # Like the standard library, convert non-string keys to strings.
+        options = orjson.OPT_NON_STR_KEYS
+        if encoder.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        return options
+
+    def _supports(self, encoder: 'JSONEncoder') -> bool:
+        return encoder.indent is None \
+            and not encoder.ensure_ascii \
+            and not encoder.skipkeys \
+            and encoder.item_separator == ',' \
+            and encoder.key_separator == ':'
+
+
+def default_backend() -> JSONBackend:
+    """
+    Gets the fastest JSON backend that is available.
+    """
+    if orjson is not None:
+        return OrjsonJSONBackend()
+    return StdlibJSONBackend()
+
+
 class JSONEncoder(stdjson.JSONEncoder):
-    def __init__(self, site: Site, locale: str, *args, **kwargs):
+    """
+    Encodes Betty's resources to JSON.
+
+    Unless other options are given, values are encoded to compact JSON without escaping non-ASCII characters, which lets
+    fast backends such as orjson do most of the work. These backends serialize all plain values themselves, and have the
+    encoder convert resources to plain values.
+    """
+
+    def __init__(self, site: Site, locale: str, *args, backend: Optional[JSONBackend] = None, **kwargs):
+        kwargs.setdefault('ensure_ascii', False)
+        if kwargs.get('indent') is None:
+            kwargs.setdefault('separators', (',', ':'))
         stdjson.JSONEncoder.__init__(self, *args, **kwargs)
         self._site = site
         self._locale = locale
+        self._backend = default_backend() if backend is None else backend
         self._mappers = {
             PlaceName: self._encode_localized_name,
             Place: self._encode_place,
@@ -50,16 +141,37 @@ class JSONEncoder(stdjson.JSONEncoder):
             Note: self._encode_note,
             MediaType: self._encode_media_type,
         }
+        # Map the exact types of the values we encode to their mappers, so each type is resolved only once.
+        self._resolved_mappers = {}
 
     @classmethod
     def get_factory(cls, site: Site, locale: str):
         return lambda *args, **kwargs: cls(site, locale, *args, **kwargs)
 
+    def encode(self, o: Any) -> str:
+        return self._backend.dumps(o, self)
+
+    def dump(self, o: Any, f: TextIO) -> None:
+        """
+        Encodes a value and writes it to a file.
+        """
+        self._backend.dump(o, self, f)
+
     def default(self, o):
-        for mapper_type in self._mappers:
-            if isinstance(o, mapper_type):
-                return self._mappers[mapper_type](o)
-        stdjson.JSONEncoder.default(self, o)
+        o_type = type(o)
+        try:
+            mapper = self._resolved_mappers[o_type]
+        except KeyError:
+            mapper = self._resolved_mappers[o_type] = self._resolve_mapper(o_type)
+        if mapper is None:
+            stdjson.JSONEncoder.default(self, o)
+        return mapper(o)
+
+    def _resolve_mapper(self, o_type: Type) -> Optional[Callable[[Any], Any]]:
+        for mapper_type in o_type.__mro__:
+            with suppress(KeyError):
+                return self._mappers[mapper_type]
+        return None
 
     def _generate_url(self, resource: Any, media_type='application/json', locale=None):
         locale = self._locale if locale is None else locale
@@ -24,6 +24,8 @@ class IncompleteDateError(ValueError):
 
 @total_ordering
 class Date:
+    __slots__ = ('year', 'month', 'day', 'fuzzy')
+
     year: Optional[int]
     month: Optional[int]
     day: Optional[int]
@@ -106,6 +108,8 @@ class Date:
 
 @total_ordering
 class DateRange:
+    __slots__ = ('start', 'start_is_boundary', 'end', 'end_is_boundary')
+
     start: Optional[Date]
     start_is_boundary: bool
     end: Optional[Date]
@@ -0,0 +1,194 @@
+import hashlib
+import json
+from contextlib import suppress
+from os import path, walk
+from os.path import dirname, getmtime, getsize, join, relpath
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from betty.ancestry import EventHandlingSetList, Identifiable, Resource, File
+from betty.site import Site
+
+_MANIFEST_VERSION = 1
+
+_SCALAR_TYPES = (str, int, float, bool, type(None))
+
+
+class Manifest:
+    """
+    Records the fingerprints of the resources rendered by a previous site generation.
+    """
+
+    def __init__(self, fingerprints: Optional[Dict[str, Dict[str, Dict[str, str]]]] = None):
+        self._fingerprints = {} if fingerprints is None else fingerprints
+
+    @classmethod
+    def load(cls, file_path: str) -> 'Manifest':
+        with suppress(FileNotFoundError, ValueError, KeyError):
+            with open(file_path) as f:
+                data = json.load(f)
+            if data['version'] == _MANIFEST_VERSION:
+                return cls(data['fingerprints'])
+        return cls()
+
+    def save(self, file_path: str) -> None:
+        with open(file_path, 'w') as f:
+            json.dump({
+                'version': _MANIFEST_VERSION,
+                'fingerprints': self._fingerprints,
+            }, f)
+
+    def get(self, locale: str, entity_type_name: str) -> Dict[str, str]:
+        with suppress(KeyError):
+            return self._fingerprints[locale][entity_type_name]
+        return {}
+
+    def set(self, locale: str, entity_type_name: str, fingerprints: Dict[str, str]) -> None:
+        self._fingerprints.setdefault(locale, {})[entity_type_name] = fingerprints
+
+
+def manifest_file_path(site: Site) -> str:
+    return join(site.configuration.output_directory_path, 'manifest.json')
+
+
+def fingerprint_site(site: Site) -> str:
+    """
+    Fingerprints everything that affects all pages alike: the configuration, the assets, and Betty itself.
+    """
+    configuration = site.configuration
+    hasher = hashlib.sha256()
+    hasher.update(repr((
+        configuration.base_url,
+        configuration.root_path,
+        configuration.clean_urls,
+        configuration.content_negotiation,
+        configuration.title,
+        configuration.author,
+        configuration.mode,
+        configuration.lifetime_threshold,
+        [(locale_configuration.locale, locale_configuration.alias) for locale_configuration in configuration.locales.values()],
+        [(plugin_type.name(), plugin_configuration) for plugin_type, plugin_configuration in configuration.plugins],
+        sorted(vars(configuration.theme).items()),
+    )).encode('utf-8'))
+    for assets_path in site.assets.paths:
+        for file_path in _iterfiles(assets_path):
+            hasher.update(relpath(file_path, assets_path).encode('utf-8'))
+            with open(file_path, 'rb') as f:
+                hasher.update(f.read())
+    hasher.update(fingerprint_betty().encode('utf-8'))
+    return hasher.hexdigest()
+
+
+def fingerprint_betty() -> str:
+    """
+    Fingerprints Betty's own code.
+    """
+    hasher = hashlib.sha256()
+    # Betty's own code is too large to hash by content on every run, but its modification times tell us just as well
+    # whether it was changed or upgraded.
+    for file_path in _iterfiles(dirname(__file__)):
+        if file_path.endswith('.py'):
+            hasher.update(('%s:%d:%f' % (file_path, getsize(file_path), getmtime(file_path))).encode('utf-8'))
+    return hasher.hexdigest()
+
+
+def _iterfiles(directory_path: str) -> Iterable[str]:
+    for dir_path, dir_names, file_names in walk(directory_path):
+        # Walk the tree in a stable order, so the resulting fingerprints are stable too.
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            yield path.join(dir_path, file_name)
+
+
+class Fingerprinter:
+    """
+    Fingerprints resources by their own state, and the state of the resources they reference up to two levels deep.
+
+    A resource's state consists of all its attributes. References to other identifiable resources are recorded by ID,
+    and the referenced resources' states are included in the fingerprint as dependencies, because pages commonly show
+    details about related resources, such as the names of a person's parents, or the places of a person's events.
+    """
+
+    def __init__(self, site_fingerprint: str):
+        self._site_fingerprint = site_fingerprint
+        self._digests = {}
+        self._references = {}
+
+    def fingerprint(self, resource: Resource) -> str:
+        hasher = hashlib.sha256()
+        hasher.update(self._site_fingerprint.encode('utf-8'))
+        hasher.update(self._digest(resource).encode('utf-8'))
+        for reference in self._get_references(resource):
+            hasher.update(self._digest(reference).encode('utf-8'))
+            for indirect_reference in self._get_references(reference):
+                hasher.update(self._digest(indirect_reference).encode('utf-8'))
+        return hasher.hexdigest()
+
+    def _digest(self, resource: Resource) -> str:
+        try:
+            return self._digests[id(resource)][1]
+        except KeyError:
+            references = []
+            state = _encode_state(resource, references, set(), True)
+            if isinstance(resource, File):
+                # Files are published alongside their pages, so their pages must be regenerated if the files change.
+                with suppress(OSError):
+                    state = state, getmtime(resource.path)
+            digest = hashlib.sha256(repr(state).encode('utf-8')).hexdigest()
+            # Keep a reference to the resource itself, so its ID cannot be reused while we cache its digest.
+            self._digests[id(resource)] = resource, digest
+            self._references[id(resource)] = references
+            return digest
+
+    def _get_references(self, resource: Resource) -> List[Resource]:
+        self._digest(resource)
+        return self._references[id(resource)]
+
+
+def _encode_state(value: Any, references: List[Resource], ancestors: set, is_root: bool = False) -> Any:
+    if isinstance(value, _SCALAR_TYPES):
+        return value
+
+    if isinstance(value, Identifiable) and not is_root:
+        references.append(value)
+        return 'ref', _type_name(value), value.id
+
+    if id(value) in ancestors:
+        return 'cycle', _type_name(value)
+    ancestors.add(id(value))
+    try:
+        if isinstance(value, (list, tuple, EventHandlingSetList)):
+            return [_encode_state(item, references, ancestors) for item in value]
+        if isinstance(value, (set, frozenset)):
+            # Sets have no stable order, so sort their items by their encoded representations instead.
+            return sorted((_encode_state(item, references, ancestors) for item in value), key=repr)
+        if isinstance(value, dict):
+            return [(_encode_state(key, references, ancestors), _encode_state(item, references, ancestors)) for key, item in value.items()]
+        attributes = _get_attributes(value)
+        if attributes is None:
+            return _type_name(value), repr(value)
+        return _type_name(value), [(name, _encode_state(attribute, references, ancestors)) for name, attribute in attributes if not callable(attribute) and not _is_unset(attribute)]
+    finally:
+        ancestors.discard(id(value))
+
+
+def _get_attributes(value: Any) -> Optional[List[Tuple[str, Any]]]:
+    slot_names = [slot_name for value_type in type(value).__mro__ for slot_name in value_type.__dict__.get('__slots__', ())]
+    if not slot_names and not hasattr(value, '__dict__'):
+        return None
+    attributes = []
+    for slot_name in slot_names:
+        with suppress(AttributeError):
+            attributes.append((slot_name, getattr(value, slot_name)))
+    with suppress(TypeError):
+        attributes.extend(vars(value).items())
+    return attributes
+
+
+def _is_unset(value: Any) -> bool:
+    # Resources create their associations when first used, and leave other attributes unset until they are given a
+    # value, so these states must be indistinguishable from attributes that are set but empty.
+    return value is None or isinstance(value, EventHandlingSetList) and not len(value)
+
+
+def _type_name(value: Any) -> str:
+    return '%s.%s' % (type(value).__module__, type(value).__qualname__)
@@ -1,3 +1,6 @@
+import logging
+
+from betty import snapshot
 from betty.site import Site
 
 
@@ -12,5 +15,18 @@ class PostParser:
 
 
 async def parse(site: Site) -> None:
+    # Snapshots only ever contain what the plugins parsed, so they cannot be used for ancestries that already contain
+    # resources from elsewhere.
+    use_snapshot = site.configuration.snapshot and next(iter(site.ancestry.resources), None) is None
+    if use_snapshot:
+        snapshot_file_path = snapshot.snapshot_file_path(site)
+        fingerprint = snapshot.fingerprint_sources(site)
+        if snapshot.load(site.ancestry, snapshot_file_path, fingerprint):
+            logging.getLogger().info('Loaded the ancestry from its snapshot.')
+            return
+
     await site.dispatcher.dispatch(Parser, 'parse')()
     await site.dispatcher.dispatch(PostParser, 'post_parse')()
+
+    if use_snapshot:
+        snapshot.dump(site.ancestry, snapshot_file_path, fingerprint)
@@ -16,6 +16,12 @@ class AnonymousSource(Source):
     def name(self) -> str:
         return _('Private')
 
+    @name.setter
+    def name(self, name: str) -> None:
+        # Anonymous sources are named in whichever locale they are shown in, but they must accept names like other
+        # sources do, so they can be copied and unpickled.
+        pass
+
     def replace(self, other: Source) -> None:
         self.citations.append(*other.citations)
         self.contains.append(*other.contains)
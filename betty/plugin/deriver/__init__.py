@@ -1,8 +1,9 @@
 import logging
-from typing import List, Tuple, Set, Type, Iterable, Any
+from functools import lru_cache
+from typing import List, Tuple, Set, Type, Iterable, Any, Dict
 
 from betty.ancestry import Person, Presence, Event, Subject, EventType, EVENT_TYPE_TYPES, DerivableEventType, \
-    CreatableDerivableEventType, Ancestry
+    CreatableDerivableEventType, Ancestry, get_event_type_order
 from betty.locale import DateRange, Date
 from betty.parse import PostParser
 from betty.plugin import Plugin, NO_CONFIGURATION
@@ -11,10 +12,12 @@ from betty.site import Site
 
 
 class DerivedEvent(Event):
-    pass  # pragma: no cover
+    __slots__ = ()
 
 
 class DerivedDate(Date):
+    __slots__ = ()
+
     @classmethod
     def derive(cls, date: Date) -> 'DerivedDate':
         return cls(date.year, date.month, date.day, fuzzy=date.fuzzy)
@@ -32,40 +35,108 @@ class Deriver(Plugin, PostParser):
         await self.derive(self._ancestry)
 
     async def derive(self, ancestry: Ancestry) -> None:
+        # Derive event types in their chronological order, so the dates of events that are derived first are known by the
+        # time events that come after them are derived.
+        event_type_orders = [_get_event_type_order(event_type_type) for event_type_type in get_event_type_order().event_type_types if issubclass(event_type_type, DerivableEventType)]
+        created_derivations = [0] * len(event_type_orders)
+        updated_derivations = [0] * len(event_type_orders)
+        # Visit each person once, and derive all event types from their events in one go.
+        for person in ancestry.people.values():
+            events = _PersonEvents(person)
+            for i, event_type_order in enumerate(event_type_orders):
+                created, updated = _derive(person, events, event_type_order)
+                created_derivations[i] += created
+                updated_derivations[i] += updated
         logger = logging.getLogger()
-        for event_type_type in EVENT_TYPE_TYPES:
-            event_type = event_type_type()
-            if isinstance(event_type, DerivableEventType):
-                created_derivations = 0
-                updated_derivations = 0
-                for person in ancestry.people.values():
-                    created, updated = derive(person, event_type_type)
-                    created_derivations += created
-                    updated_derivations += updated
-                logger.info('Updated %d %s events based on existing information.' % (updated_derivations, event_type.label))
-                if isinstance(event_type, CreatableDerivableEventType):
-                    logger.info('Created %d additional %s events based on existing information.' % (created_derivations, event_type.label))
+        for i, event_type_order in enumerate(event_type_orders):
+            event_type = event_type_order.event_type_type()
+            logger.info('Updated %d %s events based on existing information.' % (updated_derivations[i], event_type.label))
+            if isinstance(event_type, CreatableDerivableEventType):
+                logger.info('Created %d additional %s events based on existing information.' % (created_derivations[i], event_type.label))
 
     @classmethod
     def comes_before(cls) -> Set[Type[Plugin]]:
         return {Privatizer}
 
 
+class _EventTypeOrder:
+    """
+    The event types a derivable event type comes before and after, including those that declare it the other way around.
+    """
+
+    def __init__(self, event_type_type: Type[DerivableEventType]):
+        self.event_type_type = event_type_type
+        comes_before_event_type_types = event_type_type.comes_before()
+        comes_after_event_type_types = event_type_type.comes_after()
+        for other_event_type_type in EVENT_TYPE_TYPES:
+            if event_type_type in other_event_type_type.comes_before():
+                comes_after_event_type_types.add(other_event_type_type)
+            if event_type_type in other_event_type_type.comes_after():
+                comes_before_event_type_types.add(other_event_type_type)
+        self.comes_before_event_type_types = tuple(comes_before_event_type_types)
+        self.comes_after_event_type_types = tuple(comes_after_event_type_types)
+
+
+@lru_cache(maxsize=None)
+def _get_event_type_order(event_type_type: Type[DerivableEventType]) -> _EventTypeOrder:
+    return _EventTypeOrder(event_type_type)
+
+
+class _PersonEvents:
+    """
+    A person's events, grouped by their types, so each derivation only looks at the events of the types it needs.
+    """
+
+    def __init__(self, person: Person):
+        self._events: List[Tuple[Type[EventType], Event]] = []
+        self._events_by_type: Dict[Type[EventType], List[Event]] = {}
+        self._selections: Dict[Tuple[Type[EventType], ...], List[Event]] = {}
+        for presence in person.presences:
+            self.add(presence.event)
+
+    def add(self, event: Event) -> None:
+        event_type_type = type(event.type)
+        self._events.append((event_type_type, event))
+        self._events_by_type.setdefault(event_type_type, []).append(event)
+        self._selections.clear()
+
+    def get(self, event_type_types: Tuple[Type[EventType], ...]) -> List[Event]:
+        """
+        Gets the events of any of the given types, in the order of the person's presences.
+        """
+        try:
+            return self._selections[event_type_types]
+        except KeyError:
+            pass
+        selected_event_type_types = {event_type_type for event_type_type in self._events_by_type if _is_subclass(event_type_type, event_type_types)}
+        if not selected_event_type_types:
+            events = []
+        elif len(selected_event_type_types) == 1:
+            events = self._events_by_type[next(iter(selected_event_type_types))]
+        else:
+            events = [event for event_type_type, event in self._events if event_type_type in selected_event_type_types]
+        self._selections[event_type_types] = events
+        return events
+
+
+@lru_cache(maxsize=None)
+def _is_subclass(event_type_type: Type[EventType], event_type_types: Tuple[Type[EventType], ...]) -> bool:
+    return issubclass(event_type_type, event_type_types)
+
+
 class _DateDeriver:
     @classmethod
-    def derive(cls, person: Person, derivable_event: Event, reference_event_type_types: Set[Type[EventType]]) -> bool:
-        if not reference_event_type_types:
+    def derive(cls, derivable_event: Event, reference_events: List[Event]) -> bool:
+        if not reference_events:
             return False
 
-        reference_events = _get_reference_events(person, reference_event_type_types)
         reference_events_dates = cls._get_events_dates(reference_events)
         reference_events_dates = filter(lambda x: x[1].comparable, reference_events_dates)
         if derivable_event.date is not None:
             reference_events_dates = filter(lambda x: cls._compare(derivable_event.date, x[1]), reference_events_dates)
-        reference_events_dates = cls._sort(reference_events_dates)
         try:
-            reference_event, reference_date = reference_events_dates[0]
-        except IndexError:
+            reference_event, reference_date = cls._select(reference_events_dates)
+        except ValueError:
             return False
 
         if derivable_event.date is None:
@@ -93,7 +164,12 @@ class _DateDeriver:
         raise NotImplementedError
 
     @staticmethod
-    def _sort(events_dates: Iterable[Tuple[Event, Date]]) -> List[Tuple[Event, Date]]:
+    def _select(events_dates: Iterable[Tuple[Event, Date]]) -> Tuple[Event, Date]:
+        """
+        Selects the reference event and date closest to the derivable event.
+
+        :raises ValueError: Raised if there are no reference events and dates to select from.
+        """
         raise NotImplementedError
 
     @staticmethod
@@ -114,8 +190,8 @@ class _ComesBeforeDateDeriver(_DateDeriver):
         return derivable_date < reference_date
 
     @staticmethod
-    def _sort(events_dates: Iterable[Tuple[Event, Date]]) -> List[Tuple[Event, Date]]:
-        return sorted(events_dates, key=lambda x: x[1])
+    def _select(events_dates: Iterable[Tuple[Event, Date]]) -> Tuple[Event, Date]:
+        return min(events_dates, key=lambda x: x[1])
 
     @staticmethod
     def _set(derivable_event: Event, date: DerivedDate) -> None:
@@ -136,8 +212,8 @@ class _ComesAfterDateDeriver(_DateDeriver):
         return derivable_date > reference_date
 
     @staticmethod
-    def _sort(events_dates: Iterable[Tuple[Event, Date]]) -> List[Tuple[Event, Date]]:
-        return sorted(events_dates, key=lambda x: x[1], reverse=True)
+    def _select(events_dates: Iterable[Tuple[Event, Date]]) -> Tuple[Event, Date]:
+        return max(events_dates, key=lambda x: x[1])
 
     @staticmethod
     def _set(derivable_event: Event, date: DerivedDate) -> None:
@@ -146,25 +222,22 @@ class _ComesAfterDateDeriver(_DateDeriver):
 
 
 def derive(person: Person, event_type_type: Type[DerivableEventType]) -> Tuple[int, int]:
+    return _derive(person, _PersonEvents(person), _get_event_type_order(event_type_type))
+
+
+def _derive(person: Person, events: _PersonEvents, event_type_order: _EventTypeOrder) -> Tuple[int, int]:
+    event_type_type = event_type_order.event_type_type
     # Gather any existing events that could be derived, or create a new derived event if needed.
-    derivable_events = list(_get_derivable_events(person, event_type_type))
+    event_type_events = events.get((event_type_type,))
+    derivable_events = list(filter(_is_derivable, event_type_events))
     if not derivable_events:
-        if list(filter(lambda x: isinstance(x.event.type, event_type_type), person.presences)):
+        if event_type_events:
             return 0, 0
         if issubclass(event_type_type, CreatableDerivableEventType):
             derivable_events = [DerivedEvent(event_type_type())]
         else:
             return 0, 0
 
-    # Aggregate event type order from references and backreferences.
-    comes_before_event_type_types = event_type_type.comes_before()
-    comes_after_event_type_types = event_type_type.comes_after()
-    for other_event_type_type in EVENT_TYPE_TYPES:
-        if event_type_type in other_event_type_type.comes_before():
-            comes_after_event_type_types.add(other_event_type_type)
-        if event_type_type in other_event_type_type.comes_after():
-            comes_before_event_type_types.add(other_event_type_type)
-
     created_derivations = 0
     updated_derivations = 0
 
@@ -172,52 +245,38 @@ def derive(person: Person, event_type_type: Type[DerivableEventType]) -> Tuple[i
         dates_derived = False
 
         if derivable_event.date is None or derivable_event.date.end is None:
-            dates_derived = dates_derived or _ComesBeforeDateDeriver.derive(person, derivable_event, comes_before_event_type_types)
+            dates_derived = dates_derived or _ComesBeforeDateDeriver.derive(derivable_event, _get_reference_events(events, event_type_order.comes_before_event_type_types))
 
         if derivable_event.date is None or derivable_event.date.start is None:
-            dates_derived = dates_derived or _ComesAfterDateDeriver.derive(person, derivable_event, comes_after_event_type_types)
+            dates_derived = dates_derived or _ComesAfterDateDeriver.derive(derivable_event, _get_reference_events(events, event_type_order.comes_after_event_type_types))
 
         if dates_derived:
             if isinstance(derivable_event, DerivedEvent):
                 created_derivations += 1
                 Presence(person, Subject(), derivable_event)
+                events.add(derivable_event)
             else:
                 updated_derivations += 1
 
     return created_derivations, updated_derivations
 
 
-def _get_derivable_events(person: Person, derivable_event_type_type: Type[EventType]) -> Iterable[Event]:
-    for presence in person.presences:
-        event = presence.event
-
-        # Ignore events that have been derived already.
-        if isinstance(event, DerivedEvent):
-            continue
-
-        # Ignore events of the wrong type.
-        if not isinstance(event.type, derivable_event_type_type):
-            continue
-
-        # Ignore events with enough date information that nothing more can be derived.
-        if isinstance(event.date, Date):
-            continue
-        if isinstance(event.date, DateRange) and (not event.type.comes_after() or event.date.start is not None) and (not event.type.comes_before() or event.date.end is not None):
-            continue
-
-        yield presence.event
+def _is_derivable(event: Event) -> bool:
+    # Ignore events that have been derived already.
+    if isinstance(event, DerivedEvent):
+        return False
 
+    # Ignore events with enough date information that nothing more can be derived.
+    if isinstance(event.date, Date):
+        return False
+    if isinstance(event.date, DateRange) and (not event.type.comes_after() or event.date.start is not None) and (not event.type.comes_before() or event.date.end is not None):
+        return False
 
-def _get_reference_events(person: Person, reference_event_type_types: Set[Type[EventType]]) -> Iterable[Event]:
-    for reference_event in [presence.event for presence in person.presences]:
-        # We cannot reliably determine dates based on reference events with calculated date ranges, as those events
-        # would start or end *sometime* during the date range, but to derive dates we need reference events' exact
-        # start and end dates.
-        if isinstance(reference_event, DerivedEvent):
-            continue
+    return True
 
-        # Ignore reference events of the wrong type.
-        if not isinstance(reference_event.type, tuple(reference_event_type_types)):
-            continue
 
-        yield reference_event
+def _get_reference_events(events: _PersonEvents, reference_event_type_types: Tuple[Type[EventType], ...]) -> List[Event]:
+    # We cannot reliably determine dates based on reference events with calculated date ranges, as those events would
+    # start or end *sometime* during the date range, but to derive dates we need reference events' exact start and end
+    # dates.
+    return [reference_event for reference_event in events.get(reference_event_type_types) if not isinstance(reference_event, DerivedEvent)]
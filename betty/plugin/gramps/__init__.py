@@ -3,9 +3,11 @@ import hashlib
 import logging
 import re
 import tarfile
+from collections import defaultdict
 from contextlib import suppress
+from functools import lru_cache
 from os import path
-from typing import Tuple, Optional, List, Any
+from typing import Tuple, Optional, List, Any, BinaryIO
 
 from geopy import Point
 from lxml import etree
@@ -31,11 +33,15 @@ class _IntermediateAncestry:
     def __init__(self):
         self.notes = {}
         self.files = {}
+        self.repositories = {}
         self.places = {}
         self.events = {}
         self.people = {}
         self.sources = {}
         self.citations = {}
+        # Elements may reference elements that appear later in the XML document, so references are resolved once all
+        # elements have been parsed. These are the functions that do so, per XML section.
+        self.reference_resolvers = defaultdict(list)
 
     def populate(self, ancestry: Ancestry):
         ancestry.files = {
@@ -51,28 +57,42 @@ class _IntermediateAncestry:
         ancestry.notes = {note.id: note for note in self.notes.values()}
 
 
-class _IntermediatePlace:
-    def __init__(self, place: Place, enclosed_by_handles: List[str]):
-        self.place = place
-        self.enclosed_by_handles = enclosed_by_handles
-
-
 _NS = {
     'ns': 'http://gramps-project.org/xml/1.7.1/',
 }
 
 
+def _tag(name: str) -> str:
+    return '{%s}%s' % (_NS['ns'], name)
+
+
+@lru_cache(maxsize=None)
+def _compile_xpath(selector: str) -> etree.XPath:
+    return etree.XPath(selector, namespaces=_NS)
+
+
 def _xpath(element, selector: str) -> []:
-    return element.xpath(selector, namespaces=_NS)
+    return _compile_xpath(selector)(element)
 
 
 def _xpath1(element, selector: str) -> Optional:
-    elements = element.xpath(selector, namespaces=_NS)
+    elements = _xpath(element, selector)
     if elements:
         return elements[0]
     return None
 
 
+def _child_text(element: Element, tag: str) -> Optional[str]:
+    child = element.find(_tag(tag))
+    if child is None:
+        return None
+    return child.text
+
+
+def _child_attributes(element: Element, tag: str, attribute_name: str) -> List[str]:
+    return [child.get(attribute_name) for child in element.iterchildren(_tag(tag))]
+
+
 def parse_xml(site: Site, gramps_file_path: str) -> None:
     cache_directory_path = path.join(site.configuration.cache_directory_path, Gramps.name(),
                                      hashlib.md5(gramps_file_path.encode('utf-8')).hexdigest())
@@ -89,37 +109,63 @@ def parse_xml(site: Site, gramps_file_path: str) -> None:
                 cache_directory_path)
             gramps_file_path = path.join(cache_directory_path, 'data.gramps')
             # Treat the file as a tar archive (*.gpkg) with media and a gzipped XML file (./data.gz/data).
-            _parse_tree(site.ancestry, etree.parse(gramps_file_path), cache_directory_path)
+            with gzip.open(gramps_file_path) as xml_file:
+                _parse_xml_file(site.ancestry, xml_file, cache_directory_path)
         except tarfile.ReadError:
             # Treat the file as a gzipped XML file (*.gramps).
-            _parse_tree(site.ancestry, etree.parse(gramps_file), rootname(gramps_file_path))
+            gramps_file.seek(0)
+            _parse_xml_file(site.ancestry, gramps_file, rootname(gramps_file_path))
     except OSError:
         # Treat the file as plain XML (*.gramps).
-        _parse_tree(site.ancestry, etree.parse(gramps_file_path), rootname(gramps_file_path))
+        with open(gramps_file_path, 'rb') as xml_file:
+            _parse_xml_file(site.ancestry, xml_file, rootname(gramps_file_path))
 
 
-def _parse_tree(ancestry: Ancestry, tree: etree.ElementTree(), tree_directory_path: str) -> None:
+def _parse_xml_file(ancestry: Ancestry, xml_file: BinaryIO, tree_directory_path: str) -> None:
+    """
+    Parses a Gramps XML document element by element, so that it never has to be loaded into memory in its entirety.
+    """
     logger = logging.getLogger()
-    database = tree.getroot()
     intermediate_ancestry = _IntermediateAncestry()
-    _parse_notes(intermediate_ancestry, database)
+    element_parsers = {
+        _tag('note'): (_tag('notes'), _parse_note),
+        _tag('object'): (_tag('objects'), lambda ancestry, element: _parse_object(ancestry, element, tree_directory_path)),
+        _tag('repository'): (_tag('repositories'), _parse_repository),
+        _tag('source'): (_tag('sources'), _parse_source),
+        _tag('citation'): (_tag('citations'), _parse_citation),
+        _tag('placeobj'): (_tag('places'), _parse_place),
+        _tag('event'): (_tag('events'), _parse_event),
+        _tag('person'): (_tag('people'), _parse_person),
+        _tag('family'): (_tag('families'), _parse_family),
+    }
+    for _, element in etree.iterparse(xml_file, events=('end',), tag=list(element_parsers.keys())):
+        section_tag, parse_element = element_parsers[element.tag]
+        parent = element.getparent()
+        if parent is None or parent.tag != section_tag:
+            continue
+        parse_element(intermediate_ancestry, element)
+        # Free the parsed element and its preceding siblings, which have been parsed already.
+        element.clear()
+        while element.getprevious() is not None:
+            del parent[0]
+
+    # Resolve references in the order that lets each section reference the sections before it.
+    for section_tag in ('notes', 'objects', 'repositories', 'sources', 'citations', 'places', 'events', 'people',
+                        'families'):
+        if section_tag == 'sources':
+            intermediate_ancestry.sources = {**intermediate_ancestry.repositories, **intermediate_ancestry.sources}
+        for resolve_references in intermediate_ancestry.reference_resolvers.pop(section_tag, []):
+            resolve_references()
+
     logger.info('Parsed %d notes.' % len(intermediate_ancestry.notes))
-    _parse_objects(intermediate_ancestry, database, tree_directory_path)
     logger.info('Parsed %d files.' % len(intermediate_ancestry.files))
-    _parse_repositories(intermediate_ancestry, database)
-    repository_count = len(intermediate_ancestry.sources)
+    repository_count = len(intermediate_ancestry.repositories)
     logger.info('Parsed %d repositories as sources.' % repository_count)
-    _parse_sources(intermediate_ancestry, database)
     logger.info('Parsed %d sources.' % (len(intermediate_ancestry.sources) - repository_count))
-    _parse_citations(intermediate_ancestry, database)
     logger.info('Parsed %d citations.' % len(intermediate_ancestry.citations))
-    _parse_places(intermediate_ancestry, database)
     logger.info('Parsed %d places.' % len(intermediate_ancestry.places))
-    _parse_events(intermediate_ancestry, database)
     logger.info('Parsed %d events.' % len(intermediate_ancestry.events))
-    _parse_people(intermediate_ancestry, database)
     logger.info('Parsed %d people.' % len(intermediate_ancestry.people))
-    _parse_families(intermediate_ancestry, database)
     intermediate_ancestry.populate(ancestry)
 
 
@@ -130,10 +176,9 @@ _DATE_PART_PATTERN = re.compile(r'^\d+$')
 def _parse_date(element: Element) -> Optional[Datey]:
     dateval_element = _xpath1(element, './ns:dateval[not(@cformat)]')
     if dateval_element is not None:
-        dateval_type = _xpath1(dateval_element, './@type')
+        dateval_type = dateval_element.get('type')
         if dateval_type is None:
             return _parse_dateval(dateval_element, 'val')
-        dateval_type = str(dateval_type)
         if dateval_type == 'about':
             date = _parse_dateval(dateval_element, 'val')
             if date is None:
@@ -154,83 +199,73 @@ def _parse_date(element: Element) -> Optional[Datey]:
 
 
 def _parse_dateval(element: Element, value_attribute_name: str) -> Optional[Date]:
-    dateval = str(_xpath1(element, './@%s' % value_attribute_name))
+    dateval = str(element.get(value_attribute_name))
     if _DATE_PATTERN.fullmatch(dateval):
         date_parts = [int(part) if _DATE_PART_PATTERN.fullmatch(
             part) and int(part) > 0 else None for part in dateval.split('-')]
         date = Date(*date_parts)
-        dateval_quality = _xpath1(element, './@quality')
+        dateval_quality = element.get('quality')
         if dateval_quality == 'estimated':
             date.fuzzy = True
         return date
     return None
 
 
-def _parse_notes(ancestry: _IntermediateAncestry, database: Element):
-    for element in _xpath(database, './ns:notes/ns:note'):
-        _parse_note(ancestry, element)
-
-
 def _parse_note(ancestry: _IntermediateAncestry, element: Element):
-    handle = _xpath1(element, './@handle')
-    note_id = str(_xpath1(element, './@id'))
-    text = _xpath1(element, './ns:text/text()')
+    handle = element.get('handle')
+    note_id = element.get('id')
+    text = _child_text(element, 'text')
     ancestry.notes[handle] = Note(note_id, text)
 
 
-def _parse_objects(ancestry: _IntermediateAncestry, database: Element, gramps_file_path: str):
-    for element in _xpath(database, './ns:objects/ns:object'):
-        _parse_object(ancestry, element, gramps_file_path)
-
-
 def _parse_object(ancestry: _IntermediateAncestry, element: Element, gramps_directory_path):
-    handle = _xpath1(element, './@handle')
-    entity_id = str(_xpath1(element, './@id'))
-    file_element = _xpath1(element, './ns:file')
-    file_path = path.join(gramps_directory_path, str(_xpath1(file_element, './@src')))
+    handle = element.get('handle')
+    entity_id = element.get('id')
+    file_element = element.find(_tag('file'))
+    file_path = path.join(gramps_directory_path, str(file_element.get('src')))
     file = File(entity_id, file_path)
-    file.media_type = MediaType(str(_xpath1(file_element, './@mime')))
-    description = str(_xpath1(file_element, './@description'))
+    file.media_type = MediaType(str(file_element.get('mime')))
+    description = str(file_element.get('description'))
     if description:
         file.description = description
-    note_handles = _xpath(element, './ns:noteref/@hlink')
-    for note_handle in note_handles:
-        file.notes.append(ancestry.notes[note_handle])
-    _parse_attribute_privacy(file, element, 'attribute')
-    ancestry.files[handle] = file
+    note_handles = _child_attributes(element, 'noteref', 'hlink')
 
+    def _resolve_references():
+        for note_handle in note_handles:
+            file.notes.append(ancestry.notes[note_handle])
+    ancestry.reference_resolvers['objects'].append(_resolve_references)
 
-def _parse_people(ancestry: _IntermediateAncestry, database: Element):
-    for element in database.xpath('.//*[local-name()="person"]'):
-        _parse_person(ancestry, element)
+    _parse_attribute_privacy(file, element, 'attribute')
+    ancestry.files[handle] = file
 
 
 def _parse_person(ancestry: _IntermediateAncestry, element: Element):
-    handle = _xpath1(element, './@handle')
-    person = Person(str(_xpath1(element, './@id')))
+    handle = element.get('handle')
+    person = Person(element.get('id'))
 
     names = []
-    for name_element in _xpath(element, './ns:name'):
-        is_alternative = _xpath1(name_element, './@alt') == '1'
-        individual_name_element = _xpath1(name_element, './ns:first')
-        individual_name = None if individual_name_element is None else individual_name_element.text
-        surname_elements = [surname_element for surname_element in _xpath(
-            name_element, './ns:surname') if surname_element.text is not None]
+    name_citation_handles = []
+    for name_element in element.iterchildren(_tag('name')):
+        is_alternative = name_element.get('alt') == '1'
+        individual_name = _child_text(name_element, 'first')
+        surname_elements = [surname_element for surname_element in name_element.iterchildren(_tag('surname'))
+                            if surname_element.text is not None]
+        citation_handles = _child_attributes(name_element, 'citationref', 'hlink')
         if surname_elements:
             for surname_element in surname_elements:
                 if not is_alternative:
-                    is_alternative = _xpath1(surname_element, './@prim') == '0'
+                    is_alternative = surname_element.get('prim') == '0'
                 affiliation_name = surname_element.text
-                surname_prefix = _xpath1(surname_element, './@prefix')
+                surname_prefix = surname_element.get('prefix')
                 if surname_prefix is not None:
                     affiliation_name = '%s %s' % (
                         surname_prefix, affiliation_name)
                 name = PersonName(individual_name, affiliation_name)
-                _parse_citationref(ancestry, name, name_element)
+                name_citation_handles.append((name, citation_handles))
                 names.append((name, is_alternative))
         elif individual_name is not None:
             name = PersonName(individual_name)
-            _parse_citationref(ancestry, name, name_element)
+            name_citation_handles.append((name, citation_handles))
             names.append((name, is_alternative))
     for name, is_alternative in names:
         if is_alternative:
@@ -238,51 +273,62 @@ def _parse_person(ancestry: _IntermediateAncestry, element: Element):
         else:
             person.names.prepend(name)
 
-    _parse_eventrefs(ancestry, person, element)
-    if str(_xpath1(element, './@priv')) == '1':
+    eventrefs = _parse_eventrefs(element)
+    if element.get('priv') == '1':
         person.private = True
 
-    _parse_citationref(ancestry, person, element)
-    _parse_objref(ancestry, person, element)
+    citation_handles = _child_attributes(element, 'citationref', 'hlink')
+    file_handles = _child_attributes(element, 'objref', 'hlink')
+
+    def _resolve_references():
+        for name, handles in name_citation_handles:
+            _resolve_citationref(ancestry, name, handles)
+        _resolve_eventrefs(ancestry, person, eventrefs)
+        _resolve_citationref(ancestry, person, citation_handles)
+        _resolve_objref(ancestry, person, file_handles)
+    ancestry.reference_resolvers['people'].append(_resolve_references)
+
     _parse_urls(person, element)
     _parse_attribute_privacy(person, element, 'attribute')
     ancestry.people[handle] = person
 
 
-def _parse_families(ancestry: _IntermediateAncestry, database: Element):
-    for element in database.xpath('.//*[local-name()="family"]'):
-        _parse_family(ancestry, element)
+def _parse_family(ancestry: _IntermediateAncestry, element: Element):
+    father_handle = _xpath1(element, './ns:father/@hlink')
+    mother_handle = _xpath1(element, './ns:mother/@hlink')
+    eventrefs = _parse_eventrefs(element)
+    child_handles = _child_attributes(element, 'childref', 'hlink')
 
+    def _resolve_references():
+        parents = []
 
-def _parse_family(ancestry: _IntermediateAncestry, element: Element):
-    parents = []
+        # Resolve the father.
+        if father_handle:
+            father = ancestry.people[father_handle]
+            _resolve_eventrefs(ancestry, father, eventrefs)
+            parents.append(father)
 
-    # Parse the father.
-    father_handle = _xpath1(element, './ns:father/@hlink')
-    if father_handle:
-        father = ancestry.people[father_handle]
-        _parse_eventrefs(ancestry, father, element)
-        parents.append(father)
+        # Resolve the mother.
+        if mother_handle:
+            mother = ancestry.people[mother_handle]
+            _resolve_eventrefs(ancestry, mother, eventrefs)
+            parents.append(mother)
+
+        # Resolve the children.
+        for child_handle in child_handles:
+            child = ancestry.people[child_handle]
+            for parent in parents:
+                parent.children.append(child)
+    ancestry.reference_resolvers['families'].append(_resolve_references)
 
-    # Parse the mother.
-    mother_handle = _xpath1(element, './ns:mother/@hlink')
-    if mother_handle:
-        mother = ancestry.people[mother_handle]
-        _parse_eventrefs(ancestry, mother, element)
-        parents.append(mother)
 
-    # Parse the children.
-    child_handles = _xpath(element, './ns:childref/@hlink')
-    for child_handle in child_handles:
-        child = ancestry.people[child_handle]
-        for parent in parents:
-            parent.children.append(child)
+def _parse_eventrefs(element: Element) -> List[Tuple[str, Optional[str]]]:
+    return [(eventref.get('hlink'), eventref.get('role')) for eventref in element.iterchildren(_tag('eventref'))]
 
 
-def _parse_eventrefs(ancestry: _IntermediateAncestry, person: Person, element: Element) -> None:
-    eventrefs = _xpath(element, './ns:eventref')
-    for eventref in eventrefs:
-        _parse_eventref(ancestry, person, eventref)
+def _resolve_eventrefs(ancestry: _IntermediateAncestry, person: Person, eventrefs: List[Tuple[str, Optional[str]]]) -> None:
+    for event_handle, gramps_presence_role in eventrefs:
+        _resolve_eventref(ancestry, person, event_handle, gramps_presence_role)
 
 
 _PRESENCE_ROLE_MAP = {
@@ -294,54 +340,47 @@ _PRESENCE_ROLE_MAP = {
 }
 
 
-def _parse_eventref(ancestry: _IntermediateAncestry, person: Person, eventref: Element) -> None:
-    event_handle = _xpath1(eventref, './@hlink')
-    gramps_presence_role = _xpath1(eventref, './@role')
+def _resolve_eventref(ancestry: _IntermediateAncestry, person: Person, event_handle: str, gramps_presence_role: Optional[str]) -> None:
     role = _PRESENCE_ROLE_MAP[gramps_presence_role] if gramps_presence_role in _PRESENCE_ROLE_MAP else Attendee()
     Presence(person, role, ancestry.events[event_handle])
 
 
-def _parse_places(ancestry: _IntermediateAncestry, database: Element):
-    intermediate_places = {handle: intermediate_place for handle, intermediate_place in
-                           [_parse_place(element) for element in database.xpath('.//*[local-name()="placeobj"]')]}
-    for intermediate_place in intermediate_places.values():
-        for enclosed_by_handle in intermediate_place.enclosed_by_handles:
-            Enclosure(intermediate_place.place, intermediate_places[enclosed_by_handle].place)
-    ancestry.places = {handle: intermediate_place.place for handle, intermediate_place in
-                       intermediate_places.items()}
-
-
-def _parse_place(element: Element) -> Tuple[str, _IntermediatePlace]:
-    handle = _xpath1(element, './@handle')
+def _parse_place(ancestry: _IntermediateAncestry, element: Element) -> None:
+    handle = element.get('handle')
     names = []
-    for name_element in _xpath(element, './ns:pname'):
+    for name_element in element.iterchildren(_tag('pname')):
         # The Gramps language is a single ISO language code, which is a valid BCP 47 locale.
-        language = _xpath1(name_element, './@lang')
+        language = name_element.get('lang')
         date = _parse_date(name_element)
-        name = PlaceName(str(_xpath1(name_element, './@value')), locale=language, date=date)
+        name = PlaceName(str(name_element.get('value')), locale=language, date=date)
         names.append(name)
 
-    place = Place(_xpath1(element, './@id'), names)
+    place = Place(element.get('id'), names)
 
     coordinates = _parse_coordinates(element)
     if coordinates:
         place.coordinates = coordinates
 
-    enclosed_by_handles = _xpath(element, './ns:placeref/@hlink')
+    enclosed_by_handles = _child_attributes(element, 'placeref', 'hlink')
+
+    def _resolve_references():
+        for enclosed_by_handle in enclosed_by_handles:
+            Enclosure(place, ancestry.places[enclosed_by_handle])
+    ancestry.reference_resolvers['places'].append(_resolve_references)
 
     _parse_urls(place, element)
 
-    return handle, _IntermediatePlace(place, enclosed_by_handles)
+    ancestry.places[handle] = place
 
 
 def _parse_coordinates(element: Element) -> Optional[Point]:
-    coord_element = _xpath1(element, './ns:coord')
+    coord_element = element.find(_tag('coord'))
 
     if coord_element is None:
         return None
 
-    latitudeval = _xpath1(coord_element, './@lat')
-    longitudeval = _xpath1(coord_element, './@long')
+    latitudeval = coord_element.get('lat')
+    longitudeval = coord_element.get('long')
 
     # We could not parse/validate the Gramps coordinates, because they are too freeform.
     with suppress(BaseException):
@@ -349,11 +388,6 @@ def _parse_coordinates(element: Element) -> Optional[Point]:
     return None
 
 
-def _parse_events(ancestry: _IntermediateAncestry, database: Element):
-    for element in database.xpath('.//*[local-name()="event"]'):
-        _parse_event(ancestry, element)
-
-
 _EVENT_TYPE_MAP = {
     'Birth': Birth(),
     'Baptism': Baptism(),
@@ -380,9 +414,9 @@ _EVENT_TYPE_MAP = {
 
 
 def _parse_event(ancestry: _IntermediateAncestry, element: Element):
-    handle = str(_xpath1(element, './@handle'))
-    event_id = _xpath1(element, './@id')
-    gramps_type = _xpath1(element, './ns:type')
+    handle = str(element.get('handle'))
+    event_id = element.get('id')
+    gramps_type = element.find(_tag('type'))
 
     try:
         event_type = _EVENT_TYPE_MAP[gramps_type.text]
@@ -395,112 +429,109 @@ def _parse_event(ancestry: _IntermediateAncestry, element: Element):
 
     event.date = _parse_date(element)
 
-    # Parse the event place.
     place_handle = _xpath1(element, './ns:place/@hlink')
-    if place_handle:
-        event.place = ancestry.places[place_handle]
 
     # Parse the description.
-    description_element = _xpath1(element, './ns:description')
+    description_element = element.find(_tag('description'))
     if description_element is not None:
         event.description = description_element.text
 
-    _parse_objref(ancestry, event, element)
-    _parse_citationref(ancestry, event, element)
-    _parse_attribute_privacy(event, element, 'attribute')
-    ancestry.events[handle] = event
+    file_handles = _child_attributes(element, 'objref', 'hlink')
+    citation_handles = _child_attributes(element, 'citationref', 'hlink')
 
+    def _resolve_references():
+        if place_handle:
+            event.place = ancestry.places[place_handle]
+        _resolve_objref(ancestry, event, file_handles)
+        _resolve_citationref(ancestry, event, citation_handles)
+    ancestry.reference_resolvers['events'].append(_resolve_references)
 
-def _parse_repositories(ancestry: _IntermediateAncestry, database: Element) -> None:
-    for element in database.xpath('.//*[local-name()="repository"]'):
-        _parse_repository(ancestry, element)
+    _parse_attribute_privacy(event, element, 'attribute')
+    ancestry.events[handle] = event
 
 
 def _parse_repository(ancestry: _IntermediateAncestry, element: Element) -> None:
-    handle = _xpath1(element, './@handle')
+    handle = element.get('handle')
 
-    source = IdentifiableSource(_xpath1(element, './@id'),
-                                _xpath1(element, './ns:rname').text)
+    source = IdentifiableSource(element.get('id'),
+                                _child_text(element, 'rname'))
 
     _parse_urls(source, element)
 
-    ancestry.sources[handle] = source
-
-
-def _parse_sources(ancestry: _IntermediateAncestry, database: Element):
-    for element in database.xpath('.//*[local-name()="source"]'):
-        _parse_source(ancestry, element)
+    ancestry.repositories[handle] = source
 
 
 def _parse_source(ancestry: _IntermediateAncestry, element: Element) -> None:
-    handle = _xpath1(element, './@handle')
+    handle = element.get('handle')
 
-    source = IdentifiableSource(_xpath1(element, './@id'),
-                                _xpath1(element, './ns:stitle').text)
+    source = IdentifiableSource(element.get('id'),
+                                _child_text(element, 'stitle'))
 
     repository_source_handle = _xpath1(element, './ns:reporef/@hlink')
-    if repository_source_handle is not None:
-        source.contained_by = ancestry.sources[repository_source_handle]
 
     # Parse the author.
-    sauthor_element = _xpath1(element, './ns:sauthor')
+    sauthor_element = element.find(_tag('sauthor'))
     if sauthor_element is not None:
         source.author = sauthor_element.text
 
     # Parse the publication info.
-    spubinfo_element = _xpath1(element, './ns:spubinfo')
+    spubinfo_element = element.find(_tag('spubinfo'))
     if spubinfo_element is not None:
         source.publisher = spubinfo_element.text
 
-    _parse_objref(ancestry, source, element)
-    _parse_attribute_privacy(source, element, 'srcattribute')
+    file_handles = _child_attributes(element, 'objref', 'hlink')
 
-    ancestry.sources[handle] = source
+    def _resolve_references():
+        if repository_source_handle is not None:
+            source.contained_by = ancestry.sources[repository_source_handle]
+        _resolve_objref(ancestry, source, file_handles)
+    ancestry.reference_resolvers['sources'].append(_resolve_references)
 
+    _parse_attribute_privacy(source, element, 'srcattribute')
 
-def _parse_citations(ancestry: _IntermediateAncestry, database: Element) -> None:
-    for element in database.xpath('.//*[local-name()="citation"]'):
-        _parse_citation(ancestry, element)
+    ancestry.sources[handle] = source
 
 
 def _parse_citation(ancestry: _IntermediateAncestry, element: Element) -> None:
-    handle = _xpath1(element, './@handle')
+    handle = element.get('handle')
     source_handle = _xpath1(element, './ns:sourceref/@hlink')
 
-    citation = IdentifiableCitation(_xpath1(element, './@id'),
-                                    ancestry.sources[source_handle])
+    citation = IdentifiableCitation(element.get('id'), None)
 
     citation.date = _parse_date(element)
-    _parse_objref(ancestry, citation, element)
+    file_handles = _child_attributes(element, 'objref', 'hlink')
+
+    def _resolve_references():
+        citation.source = ancestry.sources[source_handle]
+        _resolve_objref(ancestry, citation, file_handles)
+    ancestry.reference_resolvers['citations'].append(_resolve_references)
+
     _parse_attribute_privacy(citation, element, 'srcattribute')
 
-    page = _xpath1(element, './ns:page')
+    page = element.find(_tag('page'))
     if page is not None:
         citation.location = page.text
 
     ancestry.citations[handle] = citation
 
 
-def _parse_citationref(ancestry: _IntermediateAncestry, fact: HasCitations, element: Element):
-    citation_handles = _xpath(element, './ns:citationref/@hlink')
+def _resolve_citationref(ancestry: _IntermediateAncestry, fact: HasCitations, citation_handles: List[str]):
     for citation_handle in citation_handles:
         fact.citations.append(ancestry.citations[citation_handle])
 
 
-def _parse_objref(ancestry: _IntermediateAncestry, owner: HasFiles, element: Element):
-    file_handles = _xpath(element, './ns:objref/@hlink')
+def _resolve_objref(ancestry: _IntermediateAncestry, owner: HasFiles, file_handles: List[str]):
     for file_handle in file_handles:
         owner.files.append(ancestry.files[file_handle])
 
 
 def _parse_urls(owner: HasLinks, element: Element):
-    url_elements = _xpath(element, './ns:url')
-    for url_element in url_elements:
-        link = Link(str(_xpath1(url_element, './@href')))
+    for url_element in element.iterchildren(_tag('url')):
+        link = Link(str(url_element.get('href')))
         link.relationship = 'external'
-        description_element = _xpath1(url_element, './@description')
-        if description_element is not None:
-            link.label = str(description_element)
+        description = url_element.get('description')
+        if description is not None:
+            link.label = description
         owner.links.add(link)
 
 
@@ -1,9 +1,9 @@
 import logging
+from contextlib import suppress
 from datetime import datetime
-from typing import Any, Optional
+from typing import Any, Optional, Dict, Callable, List
 
 from betty.ancestry import Ancestry, Person, Event, Citation, Source, HasPrivacy, Subject
-from betty.functools import walk
 from betty.locale import DateRange, Date
 from betty.parse import PostParser
 from betty.plugin import Plugin, NO_CONFIGURATION
@@ -24,9 +24,10 @@ class Privatizer(Plugin, PostParser):
 
     def privatize(self, ancestry: Ancestry) -> None:
         privatized = 0
+        lineage = Lineage(self._lifetime_threshold)
         for person in ancestry.people.values():
             private = person.private
-            privatize_person(person, self._lifetime_threshold)
+            privatize_person(person, self._lifetime_threshold, lineage)
             if private is None and person.private is True:
                 privatized += 1
         logger = logging.getLogger()
@@ -45,10 +46,111 @@ def _mark_private(has_privacy: HasPrivacy) -> None:
         has_privacy.private = True
 
 
-def privatize_person(person: Person, lifetime_threshold: int) -> None:
+class Lineage:
+    """
+    Determines which of people's ancestors and descendants have expired.
+
+    Each person's ancestors and descendants are traversed once, no matter how many relatives they share with others,
+    so this can be shared between all people in an ancestry.
+    """
+
+    def __init__(self, lifetime_threshold: int):
+        self._lifetime_threshold = lifetime_threshold
+        # People are remembered by their identities, because different people may be equal if they share IDs.
+        self._expirations: Dict[int, int] = {}
+        self._ancestral_expirations: Dict[int, int] = {}
+        self._descendant_expirations: Dict[int, bool] = {}
+
+    def has_expired_ancestor(self, person: Person) -> bool:
+        """
+        Checks if any of a person's ancestors has expired, given how many generations ago they lived.
+        """
+        return any(self._ancestral_expiration(parent) > 1 for parent in person.parents)
+
+    def has_expired_descendant(self, person: Person) -> bool:
+        return any(self._descendant_expiration(child) for child in person.children)
+
+    def _expiration(self, person: Person) -> int:
+        """
+        Gets the highest multiplier of the lifetime threshold with which a person has expired, or -1.
+        """
+        try:
+            return self._expirations[id(person)]
+        except KeyError:
+            pass
+        expiration = -1
+        if _person_has_expired(person, self._lifetime_threshold, 0):
+            # Expiring with a multiplier implies expiring with all lower multipliers, so find the highest one by doubling
+            # the multiplier until the person no longer expires, and then bisecting.
+            low, high = 0, 1
+            while high <= _MAX_GENERATIONS and _person_has_expired(person, self._lifetime_threshold, high):
+                low, high = high, high * 2
+            while high - low > 1:
+                middle = (low + high) // 2
+                if _person_has_expired(person, self._lifetime_threshold, middle):
+                    low = middle
+                else:
+                    high = middle
+            expiration = low
+        self._expirations[id(person)] = expiration
+        return expiration
+
+    def _ancestral_expiration(self, person: Person) -> int:
+        """
+        Gets the highest expiration of a person and their ancestors, minus the number of generations between them.
+
+        An ancestor n generations removed from someone has expired if it expires with a multiplier of n + 1, so someone
+        has an expired ancestor if the ancestral expiration of any of their parents is higher than 1.
+        """
+        return _traverse(person, 'parents', self._ancestral_expirations, lambda person, parent_expirations: max(
+            [self._expiration(person)] + [parent_expiration - 1 for parent_expiration in parent_expirations]))
+
+    def _descendant_expiration(self, person: Person) -> bool:
+        """
+        Checks if a person or any of their descendants has expired.
+        """
+        return _traverse(person, 'children', self._descendant_expirations, lambda person, child_expirations: any(
+            child_expirations) or _person_has_expired(person, self._lifetime_threshold, 1))
+
+
+# Expirations are only compared to the number of generations between people, which never comes near this.
+_MAX_GENERATIONS = 2 ** 16
+
+
+def _traverse(person: Person, relatives_attribute_name: str, results: Dict[int, Any],
+              compute: Callable[[Person, List[Any]], Any]) -> Any:
+    """
+    Computes a result for a person from the results for their relatives, and remembers the results for all of them.
+
+    Relatives are traversed depth-first, without recursion. A relative that is also a relative of itself is ignored the
+    second time it is found, so cycles in the data do not cause infinite loops.
+    """
+    with suppress(KeyError):
+        return results[id(person)]
+    in_progress = {id(person)}
+    stack = [(person, iter(getattr(person, relatives_attribute_name)))]
+    while stack:
+        current, relatives = stack[-1]
+        for relative in relatives:
+            if id(relative) not in results and id(relative) not in in_progress:
+                in_progress.add(id(relative))
+                stack.append((relative, iter(getattr(relative, relatives_attribute_name))))
+                break
+        else:
+            stack.pop()
+            in_progress.discard(id(current))
+            results[id(current)] = compute(current, [results[id(relative)] for relative in getattr(current, relatives_attribute_name) if id(relative) in results])
+    return results[id(person)]
+
+
+def privatize_person(person: Person, lifetime_threshold: int, lineage: Optional[Lineage] = None) -> None:
+    """
+    :param lineage: The lineage to share between all people, so relatives' expirations are determined only once.
+    """
     # Do not change existing explicit privacy declarations.
     if person.private is None:
-        person.private = _person_is_private(person, lifetime_threshold)
+        person.private = _person_is_private(person, lifetime_threshold,
+                                            Lineage(lifetime_threshold) if lineage is None else lineage)
 
     if not person.private:
         return
@@ -93,7 +195,7 @@ def privatize_source(source: Source) -> None:
         _mark_private(file)
 
 
-def _person_is_private(person: Person, lifetime_threshold: int) -> bool:
+def _person_is_private(person: Person, lifetime_threshold: int, lineage: Lineage) -> bool:
     # A dead person is not private, regardless of when they died.
     if person.end is not None:
         if person.end.date is None:
@@ -104,19 +206,12 @@ def _person_is_private(person: Person, lifetime_threshold: int) -> bool:
     if _person_has_expired(person, lifetime_threshold, 1):
         return False
 
-    def ancestors(person: Person, generation: int = -1):
-        for parent in person.parents:
-            yield generation, parent
-            yield from ancestors(parent, generation - 1)
-
-    for generation, ancestor in ancestors(person):
-        if _person_has_expired(ancestor, lifetime_threshold, abs(generation) + 1):
-            return False
+    if lineage.has_expired_ancestor(person):
+        return False
 
     # If any descendant has any expired event, the person is considered not private.
-    for descendant in walk(person, 'children'):
-        if _person_has_expired(descendant, lifetime_threshold, 1):
-            return False
+    if lineage.has_expired_descendant(person):
+        return False
 
     return True
 
@@ -1,12 +1,14 @@
 import asyncio
-import hashlib
 import logging
+import os
 import re
+import sqlite3
 from contextlib import suppress
-from json import load
-from os.path import dirname, join, getmtime
+from json import dumps, loads
+from os.path import dirname, join
 from time import time
-from typing import Optional, Dict, Callable, Tuple, Iterable, Set, Any
+from typing import Optional, Dict, Callable, Tuple, Iterable, Set, Any, List
+from urllib.parse import quote, unquote
 
 import aiohttp
 from babel import parse_locale
@@ -70,54 +72,191 @@ class Entry(Localized):
 
 
 class Retriever:
-    def __init__(self, session: aiohttp.ClientSession, cache_directory_path: str, ttl: int = 86400):
-        self._cache_directory_path = join(cache_directory_path, 'wikipedia')
-        makedirs(self._cache_directory_path)
+    """
+    Retrieves Wikipedia entries and their translations.
+
+    Requests for pages in the same language are combined into multi-title API queries, and the same page is never
+    requested more than once at a time. Responses are cached on disk. Cached pages that are older than the TTL are
+    used as-is while they are being retrieved again in the background, until they are older than the TTL and the
+    stale-while-revalidate period combined.
+    """
+
+    _API_URL = 'https://%s.wikipedia.org/w/api.php'
+
+    # The maximum number of titles the API accepts per query for each property.
+    _TITLES_PER_QUERY = {
+        'extracts': 20,
+        'langlinks': 50,
+    }
+
+    _QUERY_PARAMETERS = {
+        'extracts': 'prop=extracts&exintro&exlimit=max',
+        'langlinks': 'prop=langlinks&lllimit=max',
+    }
+
+    def __init__(self, session: aiohttp.ClientSession, cache_directory_path: str, ttl: int = 86400,
+                 stale_while_revalidate: int = 86400 * 30, api_url: str = _API_URL):
+        makedirs(cache_directory_path)
+        self._cache_file_path = join(cache_directory_path, 'wikipedia.sqlite')
+        self._cache_connection = None
+        self._cache_connection_pid = None
         self._ttl = ttl
+        self._stale_while_revalidate = stale_while_revalidate
         self._session = session
+        self._api_url = api_url
+        # Pages that will be included in the next query for their language and property, keyed by their names.
+        self._batches: Dict[Tuple[str, str], Dict[str, asyncio.Future]] = {}
+        # Pages that have been requested, but for which no response has been received yet.
+        self._requests: Dict[Tuple[str, str, str], asyncio.Future] = {}
+        self._revalidations: Set[asyncio.Future] = set()
+
+    async def close(self) -> None:
+        """
+        Waits for stale pages that are being retrieved again, and closes the cache.
+        """
+        await asyncio.gather(*self._revalidations)
+        if self._cache_connection is not None:
+            self._cache_connection.close()
+            self._cache_connection = None
 
-    async def _request(self, url: str) -> Dict:
-        cache_file_path = join(self._cache_directory_path,
-                               hashlib.md5(url.encode('utf-8')).hexdigest())
-
-        response_data = None
-        with suppress(FileNotFoundError):
-            if getmtime(cache_file_path) + self._ttl > time():
-                with open(cache_file_path) as f:
-                    response_data = load(f)
+    @property
+    def _cache(self) -> sqlite3.Connection:
+        # SQLite connections cannot be shared with forked processes, so each process opens its own.
+        if self._cache_connection is None or self._cache_connection_pid != os.getpid():
+            self._cache_connection = sqlite3.connect(self._cache_file_path, timeout=60)
+            self._cache_connection_pid = os.getpid()
+            with self._cache_connection:
+                self._cache_connection.execute('CREATE TABLE IF NOT EXISTS pages (prop TEXT NOT NULL, language TEXT NOT NULL, name TEXT NOT NULL, data TEXT NOT NULL, retrieved REAL NOT NULL, PRIMARY KEY (prop, language, name))')
+        return self._cache_connection
+
+    def _get_cached_page_data(self, prop: str, language: str, name: str) -> Optional[Tuple[Dict, float]]:
+        row = self._cache.execute('SELECT data, retrieved FROM pages WHERE prop = ? AND language = ? AND name = ?', (prop, language, name)).fetchone()
+        if row is None:
+            return None
+        data, retrieved = row
+        return loads(data), retrieved
+
+    def _set_cached_page_data(self, prop: str, language: str, pages_data: Dict[str, Dict]) -> None:
+        retrieved = time()
+        with self._cache:
+            self._cache.executemany('INSERT OR REPLACE INTO pages (prop, language, name, data, retrieved) VALUES (?, ?, ?, ?, ?)', [
+                (prop, language, name, dumps(page_data), retrieved) for name, page_data in pages_data.items()
+            ])
+
+    async def _get_page_data(self, prop: str, language: str, name: str) -> Dict:
+        cached_page_data = self._get_cached_page_data(prop, language, name)
+        if cached_page_data is not None:
+            page_data, retrieved = cached_page_data
+            age = time() - retrieved
+            if age < self._ttl:
+                return page_data
+            if age < self._ttl + self._stale_while_revalidate:
+                self._revalidate(prop, language, name)
+                return page_data
 
-        if response_data is None:
-            logger = logging.getLogger()
+        try:
+            # Other tasks may be waiting for the same request, so it must not be cancelled along with this task.
+            return await asyncio.shield(self._request(prop, language, name))
+        except RetrievalError:
+            if cached_page_data is None:
+                raise
+            return cached_page_data[0]
+
+    def _revalidate(self, prop: str, language: str, name: str) -> None:
+        async def _revalidate() -> None:
+            with suppress(RetrievalError):
+                await request
+
+        request = self._request(prop, language, name)
+        revalidation = asyncio.ensure_future(_revalidate())
+        self._revalidations.add(revalidation)
+        revalidation.add_done_callback(self._revalidations.discard)
+
+    def _request(self, prop: str, language: str, name: str) -> asyncio.Future:
+        with suppress(KeyError):
+            return self._requests[(prop, language, name)]
+
+        loop = asyncio.get_event_loop()
+        request = self._requests[(prop, language, name)] = loop.create_future()
+        batch_key = prop, language
+        try:
+            batch = self._batches[batch_key]
+        except KeyError:
+            batch = self._batches[batch_key] = {}
+            # Wait for other pending tasks to add their pages to the batch, before sending it.
+            loop.call_soon(self._send, batch_key)
+        batch[name] = request
+        if len(batch) >= self._TITLES_PER_QUERY[prop]:
+            self._send(batch_key)
+        return request
+
+    def _send(self, batch_key: Tuple[str, str]) -> None:
+        with suppress(KeyError):
+            asyncio.ensure_future(self._query(*batch_key, self._batches.pop(batch_key)))
+
+    async def _query(self, prop: str, language: str, requests: Dict[str, asyncio.Future]) -> None:
+        try:
+            pages_data = await self._query_pages(prop, language, list(requests))
+            self._set_cached_page_data(prop, language, pages_data)
+            for name, request in requests.items():
+                if not request.done():
+                    request.set_result(pages_data[name])
+        except BaseException as e:
+            for request in requests.values():
+                if not request.done():
+                    request.set_exception(e)
+        finally:
+            for name in requests:
+                del self._requests[(prop, language, name)]
+
+    async def _query_pages(self, prop: str, language: str, names: List[str]) -> Dict[str, Dict]:
+        url = '%s?action=query&titles=%s&%s&format=json&formatversion=2' % (
+            self._api_url % language, '|'.join(names), self._QUERY_PARAMETERS[prop])
+        pages_data = {}
+        normalized_titles = {}
+        continuation = {}
+        while True:
+            response_data = await self._request_json(url + ''.join('&%s=%s' % (key, quote(str(value))) for key, value in continuation.items()))
             try:
-                async with self._session.get(url) as response:
-                    response_data = await response.json()
-                    with open(cache_file_path, 'w') as f:
-                        f.write(await response.text())
-            except aiohttp.ClientError as e:
-                logger.warning('Could not successfully connect to Wikipedia at %s: %s' % (url, e))
-            except ValueError as e:
-                logger.warning('Could not parse JSON content from Wikipedia at %s: %s' % (url, e))
-
-        if response_data is None:
+                for normalized_title in response_data['query'].get('normalized', []):
+                    normalized_titles[normalized_title['from']] = normalized_title['to']
+                for page_data in response_data['query']['pages']:
+                    # Large properties may be spread over several responses, which must be merged.
+                    merged_page_data = pages_data.setdefault(page_data['title'], {})
+                    for key, value in page_data.items():
+                        if isinstance(value, list):
+                            merged_page_data.setdefault(key, []).extend(value)
+                        else:
+                            merged_page_data[key] = value
+                continuation = response_data.get('continue')
+            except (LookupError, TypeError, AttributeError) as e:
+                raise RetrievalError('Could not successfully parse the JSON format returned by %s: %s' % (url, e))
+            if not continuation:
+                break
+
+        names_pages_data = {}
+        for name in names:
+            title = unquote(name)
+            title = normalized_titles.get(title, title)
             try:
-                with open(cache_file_path) as f:
-                    response_data = load(f)
-            except FileNotFoundError:
-                raise RetrievalError('Could neither fetch %s, nor find an old version in the cache.' % url)
+                names_pages_data[name] = pages_data[title]
+            except KeyError:
+                raise RetrievalError('Could not find "%s" in the JSON content returned by %s.' % (title, url))
+        return names_pages_data
 
-        return response_data
-
-    async def _get_page_data(self, url: str) -> Dict:
-        response_data = await self._request(url)
+    async def _request_json(self, url: str) -> Dict:
         try:
-            return response_data['query']['pages'][0]
-        except (LookupError, TypeError) as e:
-            raise RetrievalError('Could not successfully parse the JSON format returned by %s: %s' % (url, e))
+            async with self._session.get(url) as response:
+                return await response.json()
+        except aiohttp.ClientError as e:
+            logging.getLogger().warning('Could not successfully connect to Wikipedia at %s: %s' % (url, e))
+            raise RetrievalError('Could not fetch %s: %s' % (url, e))
+        except ValueError as e:
+            logging.getLogger().warning('Could not parse JSON content from Wikipedia at %s: %s' % (url, e))
+            raise RetrievalError('Could not parse JSON content from %s: %s' % (url, e))
 
     async def get_translations(self, entry_language: str, entry_name: str) -> Dict[str, str]:
-        url = 'https://%s.wikipedia.org/w/api.php?action=query&titles=%s&prop=langlinks&lllimit=500&format=json&formatversion=2' % (
-            entry_language, entry_name)
-        page_data = await self._get_page_data(url)
+        page_data = await self._get_page_data('langlinks', entry_language, entry_name)
         try:
             translations_data = page_data['langlinks']
         except KeyError:
@@ -126,13 +265,11 @@ class Retriever:
         return {translation_data['lang']: translation_data['title'] for translation_data in translations_data}
 
     async def get_entry(self, language: str, name: str) -> Entry:
-        url = 'https://%s.wikipedia.org/w/api.php?action=query&titles=%s&prop=extracts&exintro&format=json&formatversion=2' % (
-            language, name)
-        page_data = await self._get_page_data(url)
+        page_data = await self._get_page_data('extracts', language, name)
         try:
             return Entry(language, name, page_data['title'], page_data['extract'])
         except KeyError as e:
-            raise RetrievalError('Could not successfully parse the JSON content returned by %s: %s' % (url, e))
+            raise RetrievalError('Could not successfully parse the JSON content for %s:%s: %s' % (language, name, e))
 
 
 class _Populator:
@@ -148,22 +285,22 @@ class _Populator:
         if not isinstance(resource, HasLinks):
             return
 
+        # Retrieve all entries for a resource at once, so they can be retrieved with those of other resources.
         entry_links = set()
+        links = []
         for link in resource.links:
             try:
                 entry_language, entry_name = parse_url(link.url)
-                entry_links.add((entry_language, entry_name))
             except NotAnEntryError:
                 continue
-
-            entry = None
-            if link.label is None:
-                with suppress(RetrievalError):
-                    entry = await self._retriever.get_entry(entry_language, entry_name)
-            await self.populate_link(link, entry_language, entry)
-
-        for entry_language, entry_name in list(entry_links):
-            entry_translations = await self._retriever.get_translations(entry_language, entry_name)
+            entry_links.add((entry_language, entry_name))
+            links.append((link, entry_language, entry_name))
+        await asyncio.gather(*[self._populate_entry_link(link, entry_language, entry_name) for link, entry_language, entry_name in links])
+
+        translated_entry_links = list(entry_links)
+        entries_translations = await asyncio.gather(*[self._retriever.get_translations(entry_language, entry_name) for entry_language, entry_name in translated_entry_links])
+        added_entry_links = []
+        for (entry_language, _), entry_translations in zip(translated_entry_links, entries_translations):
             if len(entry_translations) == 0:
                 continue
             entry_languages = list(entry_translations.keys())
@@ -174,14 +311,27 @@ class _Populator:
                 added_entry_name = entry_translations[added_entry_language]
                 if (added_entry_language, added_entry_name) in entry_links:
                     continue
-                try:
-                    added_entry = await self._retriever.get_entry(added_entry_language, added_entry_name)
-                except RetrievalError:
-                    continue
-                added_link = Link(added_entry.url)
-                await self.populate_link(added_link, added_entry_language, added_entry)
-                resource.links.add(added_link)
+                added_entry_links.append((added_entry_language, added_entry_name))
                 entry_links.add((added_entry_language, added_entry_name))
+        added_entries = await asyncio.gather(*[self._get_entry(added_entry_language, added_entry_name) for added_entry_language, added_entry_name in added_entry_links])
+        for (added_entry_language, _), added_entry in zip(added_entry_links, added_entries):
+            if added_entry is None:
+                continue
+            added_link = Link(added_entry.url)
+            await self.populate_link(added_link, added_entry_language, added_entry)
+            resource.links.add(added_link)
+
+    async def _populate_entry_link(self, link: Link, entry_language: str, entry_name: str) -> None:
+        entry = None
+        if link.label is None:
+            entry = await self._get_entry(entry_language, entry_name)
+        await self.populate_link(link, entry_language, entry)
+
+    async def _get_entry(self, entry_language: str, entry_name: str) -> Optional[Entry]:
+        try:
+            return await self._retriever.get_entry(entry_language, entry_name)
+        except RetrievalError:
+            return None
 
     async def populate_link(self, link: Link, entry_language: str, entry: Optional[Entry] = None) -> None:
         if link.url.startswith('http:'):
@@ -212,6 +362,7 @@ class Wikipedia(Plugin, Jinja2Provider, PostParser):
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self._retriever.close()
         await self._session.close()
 
     @classmethod
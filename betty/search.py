@@ -1,29 +1,117 @@
 import asyncio
-from typing import Dict, Iterable, Optional
+import gzip
+import re
+import shutil
+import unicodedata
+from os.path import join
+from typing import Dict, Iterable, Optional, Any, List, Iterator, Tuple
 
 from betty.ancestry import Person, Place, File, Resource
+from betty.fs import makedirs
 from betty.site import Site
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 
 class Index:
-    def __init__(self, site: Site):
+    # Each shard contains the words that start with the shard's prefix.
+    _PREFIX_LENGTH = 2
+    _RESULTS_PER_CHUNK = 100
+
+    def __init__(self, site: Site, concurrency: int = 8):
+        """
+        :param concurrency: The maximum number of results to render at the same time.
+        """
         self._site = site
+        self._concurrency = concurrency
 
     async def build(self) -> Iterable[Dict]:
-        return filter(None, await asyncio.gather(*[
-            *[self._build_person(person) for person in self._site.ancestry.people.values()],
-            *[self._build_place(place) for place in self._site.ancestry.places.values()],
-            *[self._build_file(file) for file in self._site.ancestry.files.values()],
-        ]))
+        entries = list(self._build_texts())
+        results = []
+        for i in range(0, len(entries), self._RESULTS_PER_CHUNK):
+            results.extend(await self._render_results([resource for resource, _ in entries[i:i + self._RESULTS_PER_CHUNK]]))
+        return [{
+            'text': text,
+            'result': result,
+        } for (_, text), result in zip(entries, results)]
+
+    async def write(self, directory_path: str) -> None:
+        """
+        Writes the index to a directory, for search.js to load only those parts it needs.
+
+        The index consists of:
+        - index.json: the result templates, and the shards by their prefixes.
+        - shard/*.json: each a trie of the words that start with the shard's prefix (see _build_trie()).
+        - result/*.json: each a list of up to _RESULTS_PER_CHUNK rendered results.
+
+        Every file is also precompressed, so web servers can serve it without compressing it on every request.
+        """
+        # Order the entries by their texts, so results are listed in that order, and results for the same query are
+        # likely to be found in the same chunks.
+        entries = sorted(self._build_texts(), key=lambda entry: entry[1])
+        postings = {}
+        for result_index, (_, text) in enumerate(entries):
+            for word in set(tokenize(text)):
+                postings.setdefault(word, []).append(result_index)
+        shards = {}
+        for word, word_postings in postings.items():
+            shards.setdefault(word[:self._PREFIX_LENGTH], {})[word[self._PREFIX_LENGTH:]] = word_postings
+        prefixes = sorted(shards)
+
+        shutil.rmtree(directory_path, ignore_errors=True)
+        makedirs(join(directory_path, 'shard'))
+        makedirs(join(directory_path, 'result'))
+        environment = self._site.jinja2_environment
+        self._write_json(join(directory_path, 'index.json'), {
+            'resultContainerTemplate': await environment.get_template('search/result.html.j2').render_async(),
+            'resultsContainerTemplate': await environment.get_template('search/results.html.j2').render_async(),
+            'prefixLength': self._PREFIX_LENGTH,
+            'resultsPerChunk': self._RESULTS_PER_CHUNK,
+            'shards': {prefix: shard_index for shard_index, prefix in enumerate(prefixes)},
+        })
+        for shard_index, prefix in enumerate(prefixes):
+            self._write_json(join(directory_path, 'shard', '%d.json' % shard_index), _build_trie(shards[prefix]))
+        # Render the results one chunk at a time, so we never keep more than a single chunk's results in memory.
+        for chunk_index, i in enumerate(range(0, len(entries), self._RESULTS_PER_CHUNK)):
+            self._write_json(join(directory_path, 'result', '%d.json' % chunk_index),
+                             await self._render_results([resource for resource, _ in entries[i:i + self._RESULTS_PER_CHUNK]]))
 
-    async def _render_resource(self, resource: Resource):
+    def _write_json(self, file_path: str, data: Any) -> None:
+        _write_precompressed(file_path, self._site.json_encoder.encode(data).encode('utf-8'))
+
+    async def _render_results(self, resources: List[Resource]) -> List[str]:
+        semaphore = asyncio.Semaphore(self._concurrency)
+
+        async def _render_result(resource: Resource) -> str:
+            async with semaphore:
+                return await self._render_resource(resource)
+        return await asyncio.gather(*[_render_result(resource) for resource in resources])
+
+    async def _render_resource(self, resource: Resource) -> str:
         return await self._site.jinja2_environment.get_template('search/result-%s.html.j2' % resource.resource_type_name()).render_async({
             resource.resource_type_name(): resource,
         })
 
-    async def _build_person(self, person: Person) -> Optional[Dict]:
+    def _build_texts(self) -> Iterator[Tuple[Resource, str]]:
+        """
+        Builds the searchable texts for all resources that can be found.
+        """
+        for builder, resources in [
+            (self._build_person_text, self._site.ancestry.people.values()),
+            (self._build_place_text, self._site.ancestry.places.values()),
+            (self._build_file_text, self._site.ancestry.files.values()),
+        ]:
+            for resource in resources:
+                text = builder(resource)
+                if text is not None:
+                    yield resource, text
+
+    def _build_person_text(self, person: Person) -> Optional[str]:
         if person.private:
-            return
+            return None
         names = []
         for name in person.names:
             if name.individual is not None:
@@ -31,20 +119,80 @@ class Index:
             if name.affiliation is not None:
                 names.append(name.affiliation.lower())
         if names:
-            return {
-                'text': ' '.join(names),
-                'result': await self._render_resource(person),
-            }
-
-    async def _build_place(self, place: Place) -> Optional[Dict]:
-        return {
-            'text': ' '.join(map(lambda x: x.name.lower(), place.names)),
-            'result': await self._render_resource(place),
-        }
-
-    async def _build_file(self, file: File) -> Optional[Dict]:
+            return ' '.join(names)
+        return None
+
+    def _build_place_text(self, place: Place) -> Optional[str]:
+        return ' '.join(map(lambda x: x.name.lower(), place.names))
+
+    def _build_file_text(self, file: File) -> Optional[str]:
         if file.description is not None:
-            return {
-                'text': file.description.lower(),
-                'result': await self._render_resource(file),
-            }
+            return file.description.lower()
+        return None
+
+
+_WORD_PATTERN = re.compile(r'[^\W_]+', re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits text into lowercase words without diacritics, exactly like search.js does.
+    """
+    # Decompose characters, so we can remove their diacritics (Unicode marks) and keep the base characters.
+    decomposed = unicodedata.normalize('NFKD', text)
+    folded = ''.join(character for character in decomposed if not unicodedata.category(character).startswith('M'))
+    return _WORD_PATTERN.findall(folded.lower())
+
+
+def _build_trie(postings: Dict[str, List[int]]) -> Dict:
+    """
+    Builds a compact prefix trie from words and the result indexes they occur in.
+
+    Each node is a dictionary. Its empty key holds the postings of the word that ends at the node, and its other keys are
+    the word parts leading to its child nodes. Chains of nodes with single children are merged into one node, so a key
+    may hold several characters. Postings are sorted and delta-encoded, so most of them are small numbers.
+    """
+    trie = {}
+    for word, word_postings in postings.items():
+        node = trie
+        for character in word:
+            node = node.setdefault(character, {})
+        node[''] = _delta_encode(word_postings)
+    return _compress_trie(trie)
+
+
+def _compress_trie(node: Dict) -> Dict:
+    compressed = {}
+    for key, child in node.items():
+        if key == '':
+            compressed[key] = child
+            continue
+        while len(child) == 1 and '' not in child:
+            (child_key, child), = child.items()
+            key += child_key
+        compressed[key] = _compress_trie(child)
+    return compressed
+
+
+def _delta_encode(values: Iterable[int]) -> List[int]:
+    encoded = []
+    previous_value = 0
+    for value in sorted(values):
+        encoded.append(value - previous_value)
+        previous_value = value
+    return encoded
+
+
+def _write_precompressed(file_path: str, data: bytes) -> None:
+    """
+    Writes a file, along with its gzip and, if available, Brotli compressed variants.
+    """
+    with open(file_path, 'wb') as f:
+        f.write(data)
+    # Leave out the modification time, so unchanged files compress to unchanged output.
+    with open('%s.gz' % file_path, 'wb') as f:
+        with gzip.GzipFile(fileobj=f, mode='wb', compresslevel=9, mtime=0) as gzip_file:
+            gzip_file.write(data)
+    if brotli is not None:
+        with open('%s.br' % file_path, 'wb') as f:
+            f.write(brotli.compress(data, brotli.MODE_TEXT))
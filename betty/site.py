@@ -1,4 +1,5 @@
 import gettext
+import os
 from collections import defaultdict, OrderedDict
 from concurrent.futures._base import Executor
 from concurrent.futures.process import ProcessPoolExecutor
@@ -23,6 +24,7 @@ from betty.ancestry import Ancestry
 from betty.config import Configuration
 from betty.fs import FileSystem
 from betty.graph import tsort, Graph
+from betty.image import ImageBatch
 from betty.locale import open_translations, Translations, negotiate_locale
 from betty.url import SiteUrlGenerator, StaticPathUrlGenerator, LocalizedUrlGenerator, StaticUrlGenerator
 
@@ -48,8 +50,10 @@ class Site:
         self._init_translations()
         self._jinja2_environment = None
         self._renderer = None
+        self._json_encoder = None
         self._executor = None
         self._locks = Locks()
+        self._image_batch = ImageBatch()
 
     async def __aenter__(self):
         if not self._site_stack:
@@ -60,7 +64,8 @@ class Site:
         self._default_translations.install()
 
         if self._executor is None:
-            self._executor = ExceptionRaisingExecutor(ProcessPoolExecutor())
+            # Bound the number of pending tasks, so tasks cannot be submitted much faster than they can be done.
+            self._executor = ExceptionRaisingExecutor(ProcessPoolExecutor(), (os.cpu_count() or 1) * 8)
 
         self._site_stack.append(self)
 
@@ -72,6 +77,7 @@ class Site:
         self._default_translations.uninstall()
 
         if not self._site_stack:
+            self._image_batch.submit(self._executor)
             self._executor.shutdown()
             self._executor = None
             await self._plugin_exit_stack.aclose()
@@ -188,6 +194,14 @@ class Site:
 
         return self._renderer
 
+    @property
+    def json_encoder(self) -> 'JSONEncoder':
+        if not self._json_encoder:
+            from betty.json import JSONEncoder
+            self._json_encoder = JSONEncoder(self, self.locale)
+
+        return self._json_encoder
+
     @property
     def executor(self) -> Executor:
         if self._executor is None:
@@ -198,6 +212,10 @@ class Site:
     def locks(self) -> Locks:
         return self._locks
 
+    @property
+    def image_batch(self) -> ImageBatch:
+        return self._image_batch
+
     def with_locale(self, locale: str) -> 'Site':
         locale = negotiate_locale(locale, list(self.configuration.locales.keys()))
         if locale is None:
@@ -211,5 +229,6 @@ class Site:
         # Clear all locale-dependent lazy-loaded attributes.
         site._jinja2_environment = None
         site._renderer = None
+        site._json_encoder = None
 
         return site
@@ -0,0 +1,82 @@
+import gzip
+import os
+from contextlib import suppress
+from glob import glob
+from os.path import join
+from typing import Iterator, BinaryIO
+from xml.sax.saxutils import escape
+
+from betty.site import Site
+
+_NAMESPACE = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+
+class Sitemap:
+    # The sitemap protocol allows at most this many URLs per sitemap.
+    MAX_URLS_PER_SHARD = 50000
+
+    def __init__(self, site: Site, compress: bool = False, urls_per_shard: int = MAX_URLS_PER_SHARD):
+        """
+        :param compress: Whether to gzip the shards.
+        """
+        self._site = site
+        self._compress = compress
+        self._urls_per_shard = urls_per_shard
+
+    def write(self, directory_path: str) -> None:
+        """
+        Writes the sitemap to a directory.
+
+        The sitemap consists of:
+        - sitemap.xml: a sitemap index of the shards.
+        - sitemap-*.xml (or sitemap-*.xml.gz): each a sitemap of up to urls_per_shard URLs.
+
+        Sitemaps may only list URLs in their own directories, so the shards are written next to the index, at the root of
+        the site. URLs are written as they are generated, so the sitemap is never held in memory as a whole.
+        """
+        for shard_file_path in glob(join(directory_path, 'sitemap-*.xml')) + glob(join(directory_path, 'sitemap-*.xml.gz')):
+            with suppress(FileNotFoundError):
+                os.remove(shard_file_path)
+
+        shard_file_names = []
+        urls = self._build_urls()
+        # The protocol requires every sitemap index to list at least one sitemap, so an empty site gets an empty shard.
+        url = next(urls, None)
+        while True:
+            shard_file_name = 'sitemap-%d.xml%s' % (len(shard_file_names), '.gz' if self._compress else '')
+            shard_file_names.append(shard_file_name)
+            with self._open(join(directory_path, shard_file_name)) as f:
+                f.write(('<?xml version="1.0" encoding="utf-8"?>\n<urlset xmlns="%s">\n' % _NAMESPACE).encode('utf-8'))
+                shard_url_count = 0
+                while url is not None and shard_url_count < self._urls_per_shard:
+                    f.write(('<url><loc>%s</loc></url>\n' % escape(url)).encode('utf-8'))
+                    shard_url_count += 1
+                    url = next(urls, None)
+                f.write(b'</urlset>\n')
+            if url is None:
+                break
+
+        with open(join(directory_path, 'sitemap.xml'), 'wb') as f:
+            f.write(('<?xml version="1.0" encoding="utf-8"?>\n<sitemapindex xmlns="%s">\n' % _NAMESPACE).encode('utf-8'))
+            for shard_file_name in shard_file_names:
+                shard_url = self._site.static_url_generator.generate('/%s' % shard_file_name, absolute=True)
+                f.write(('<sitemap><loc>%s</loc></sitemap>\n' % escape(shard_url)).encode('utf-8'))
+            f.write(b'</sitemapindex>\n')
+
+    def _open(self, file_path: str) -> BinaryIO:
+        if self._compress:
+            # Leave out the modification time, so unchanged shards compress to unchanged output.
+            return gzip.GzipFile(file_path, 'wb', mtime=0)
+        return open(file_path, 'wb')
+
+    def _build_urls(self) -> Iterator[str]:
+        """
+        Builds the URLs of all resource pages, in all locales.
+        """
+        ancestry = self._site.ancestry
+        url_generator = self._site.localized_url_generator
+        for locale in self._site.configuration.locales:
+            for resources in (ancestry.people, ancestry.events, ancestry.places, ancestry.files, ancestry.sources,
+                              ancestry.citations):
+                for resource in resources.values():
+                    yield url_generator.generate(resource, 'text/html', absolute=True, locale=locale)
@@ -0,0 +1,149 @@
+import gc
+import hashlib
+import os
+import pickle
+from contextlib import suppress, contextmanager
+from os import path
+from os.path import join
+from typing import Any, Iterable, Iterator
+
+from betty.ancestry import Ancestry
+from betty.fs import makedirs
+from betty.manifest import fingerprint_betty
+from betty.site import Site
+
+_SNAPSHOT_VERSION = 1
+
+# Snapshots that cannot be read for any of these reasons are ignored, and replaced after the ancestry was parsed anew.
+_LOAD_ERRORS = (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, IndexError, KeyError, TypeError,
+                ValueError)
+
+
+def snapshot_file_path(site: Site) -> str:
+    # Sites may share a cache directory, so give each output directory a snapshot of its own.
+    return join(site.configuration.cache_directory_path, 'snapshot', '%s.pickle' % hashlib.md5(
+        site.configuration.output_directory_path.encode('utf-8')).hexdigest())
+
+
+def fingerprint_sources(site: Site) -> str:
+    """
+    Fingerprints everything that affects the parsed ancestry: the plugins, their configuration and the files they parse,
+    and Betty itself.
+    """
+    configuration = site.configuration
+    hasher = hashlib.sha256()
+    hasher.update(repr((
+        configuration.lifetime_threshold,
+        [(plugin_type.name(), plugin_configuration) for plugin_type, plugin_configuration in configuration.plugins],
+    )).encode('utf-8'))
+    source_file_paths = set()
+    for _, plugin_configuration in configuration.plugins:
+        source_file_paths.update(_iterfilepaths(plugin_configuration))
+    for source_file_path in sorted(source_file_paths):
+        hasher.update(source_file_path.encode('utf-8'))
+        with open(source_file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(2 ** 20), b''):
+                hasher.update(chunk)
+    hasher.update(fingerprint_betty().encode('utf-8'))
+    return hasher.hexdigest()
+
+
+def _iterfilepaths(plugin_configuration: Any) -> Iterable[str]:
+    """
+    Finds the paths to existing files in a plugin's configuration, such as the ancestries it parses.
+    """
+    if isinstance(plugin_configuration, str):
+        if path.isfile(plugin_configuration):
+            yield plugin_configuration
+    elif isinstance(plugin_configuration, dict):
+        for value in plugin_configuration.values():
+            yield from _iterfilepaths(value)
+    elif isinstance(plugin_configuration, (list, tuple)):
+        for value in plugin_configuration:
+            yield from _iterfilepaths(value)
+
+
+def dump(ancestry: Ancestry, file_path: str, fingerprint: str) -> None:
+    """
+    Dumps an ancestry to a snapshot.
+
+    The ancestry's resources reference each other in every direction, so pickling any one of them the usual way would
+    recurse through the entire ancestry. Instead, the snapshot first records the type and ID of every resource, after
+    which each resource's state is pickled on its own, with references to other resources replaced by their indexes.
+    """
+    collections = vars(ancestry)
+    resource_indexes = {}
+    for resources in collections.values():
+        for resource in resources.values():
+            resource_indexes[id(resource)] = len(resource_indexes)
+    makedirs(path.dirname(file_path))
+    # Write the snapshot to a temporary file first, so we never leave incomplete snapshots behind.
+    temporary_file_path = '%s.%d' % (file_path, os.getpid())
+    with _without_gc(), open(temporary_file_path, 'wb') as f:
+        pickler = pickle.Pickler(f, pickle.HIGHEST_PROTOCOL)
+        pickler.persistent_id = lambda value: resource_indexes.get(id(value))
+        pickler.dump((_SNAPSHOT_VERSION, fingerprint))
+        pickler.dump({collection_name: [(resource_key, type(resource), resource.id) for resource_key, resource in resources.items()] for collection_name, resources in collections.items()})
+        # The pickler's memo is kept between dumps, so resources may share any of their other values.
+        for resources in collections.values():
+            for resource in resources.values():
+                pickler.dump(resource.__reduce_ex__(pickle.HIGHEST_PROTOCOL)[2])
+    os.replace(temporary_file_path, file_path)
+
+
+def load(ancestry: Ancestry, file_path: str, fingerprint: str) -> bool:
+    """
+    Loads an ancestry from a snapshot, if the snapshot exists and was made from sources with the given fingerprint.
+    """
+    with suppress(*_LOAD_ERRORS):
+        with _without_gc(), open(file_path, 'rb') as f:
+            unpickler = pickle.Unpickler(f)
+            if unpickler.load() != (_SNAPSHOT_VERSION, fingerprint):
+                return False
+            collections = {}
+            indexed_resources = []
+            for collection_name, resource_types in unpickler.load().items():
+                resources = collections[collection_name] = {}
+                for resource_key, resource_type, resource_id in resource_types:
+                    resource = resource_type.__new__(resource_type)
+                    # Resources must be hashable before their state is loaded, because they are used as dictionary keys
+                    # in each other's states, and resources are hashed by their IDs.
+                    resource._id = resource_id
+                    resources[resource_key] = resource
+                    indexed_resources.append(resource)
+            unpickler.persistent_load = indexed_resources.__getitem__
+            for resource in indexed_resources:
+                _set_state(resource, unpickler.load())
+        for collection_name, resources in collections.items():
+            setattr(ancestry, collection_name, resources)
+        return True
+    return False
+
+
+@contextmanager
+def _without_gc() -> Iterator[None]:
+    # Snapshots consist of many small objects, which would otherwise trigger the cyclic garbage collector very often,
+    # while none of them can be collected.
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def _set_state(resource: Any, state: Any) -> None:
+    """
+    Sets a resource's state the same way unpickling it would.
+    """
+    if state is None:
+        return
+    slot_state = None
+    if isinstance(state, tuple):
+        state, slot_state = state
+    if state:
+        vars(resource).update(state)
+    if slot_state:
+        for name, value in slot_state.items():
+            setattr(resource, name, value)
@@ -81,5 +81,6 @@ class TemplateTestCase(TestCase):
                 rendered = await template_factory(site.jinja2_environment, template).render_async(**data)
                 # We want to keep the site around, but we must make sure all dispatched tasks are done, so we shut down
                 # the executor. Crude, but effective.
+                site.image_batch.submit(site.executor)
                 site.executor.shutdown()
                 yield rendered, site
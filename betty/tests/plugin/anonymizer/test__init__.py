@@ -1,4 +1,5 @@
 import gettext
+import pickle
 from tempfile import TemporaryDirectory
 from unittest.mock import patch, ANY, Mock
 
@@ -17,6 +18,10 @@ class AnonymousSourceTest(TestCase):
     def test_name(self):
         self.assertIsInstance(AnonymousSource().name, str)
 
+    def test_pickle(self):
+        sut = pickle.loads(pickle.dumps(AnonymousSource()))
+        self.assertIsInstance(sut.name, str)
+
     def test_replace(self):
         citations = [Citation(Source())]
         contains = [Source()]
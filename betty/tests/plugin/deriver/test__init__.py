@@ -1,12 +1,14 @@
+import gettext
+import logging
 from tempfile import TemporaryDirectory
 from typing import Optional, Set, Type
 from parameterized import parameterized
 
 from betty.ancestry import Person, Presence, Subject, EventType, CreatableDerivableEventType, \
-    DerivableEventType, Event, Residence
+    DerivableEventType, Event, Residence, Ancestry, Birth
 from betty.config import Configuration
 from betty.asyncio import sync
-from betty.locale import DateRange, Date, Datey
+from betty.locale import DateRange, Date, Datey, Translations
 from betty.parse import parse
 from betty.plugin.deriver import derive, Deriver
 from betty.site import Site
@@ -78,6 +80,30 @@ class DeriverTest(TestCase):
         self.assertEquals(DateRange(None, Date(1970, 1, 1), end_is_boundary=True), person.start.date)
         self.assertEquals(DateRange(Date(1970, 1, 1), start_is_boundary=True), person.end.date)
 
+    @sync
+    async def test_derive_should_log_derivations(self):
+        ancestry = Ancestry()
+        for person_id in ('P0', 'P1'):
+            person = Person(person_id)
+            Presence(person, Subject(), Event(Residence(), Date(1970, 1, 1)))
+            ancestry.people[person.id] = person
+        person = Person('P2')
+        Presence(person, Subject(), Event(Birth()))
+        Presence(person, Subject(), Event(Residence(), Date(1970, 1, 1)))
+        ancestry.people[person.id] = person
+
+        # The test case disables logging for all tests.
+        logging.disable(logging.NOTSET)
+        try:
+            with self.assertLogs() as logs:
+                with Translations(gettext.NullTranslations()):
+                    await Deriver(ancestry).derive(ancestry)
+        finally:
+            logging.disable(logging.CRITICAL)
+        self.assertIn('INFO:root:Updated 1 Birth events based on existing information.', logs.output)
+        self.assertIn('INFO:root:Created 2 additional Birth events based on existing information.', logs.output)
+        self.assertIn('INFO:root:Created 3 additional Death events based on existing information.', logs.output)
+
 
 class DeriveTest(TestCase):
     @parameterized.expand([
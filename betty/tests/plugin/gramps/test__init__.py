@@ -490,6 +490,38 @@ class ParseXmlTest(TestCase):
         note = ancestry.notes['N0000']
         self.assertEquals('I left this for you.', note.text)
 
+    def test_should_resolve_references_regardless_of_section_order(self) -> None:
+        ancestry = self._parse_partial("""
+<families>
+    <family handle="_F0000" id="F0000">
+        <father hlink="_I0000"/>
+        <childref hlink="_I0001"/>
+    </family>
+</families>
+<people>
+    <person handle="_I0000" id="I0000">
+        <eventref hlink="_E0000" role="Primary"/>
+    </person>
+    <person handle="_I0001" id="I0001">
+    </person>
+</people>
+<events>
+    <event handle="_E0000" id="E0000">
+        <type>Birth</type>
+        <place hlink="_P0000"/>
+    </event>
+</events>
+<places>
+    <placeobj handle="_P0000" id="P0000" type="City">
+        <pname value="Amsterdam"/>
+    </placeobj>
+</places>
+""")
+        person = ancestry.people['I0000']
+        self.assertEquals([ancestry.people['I0001']], list(person.children))
+        self.assertEquals(ancestry.events['E0000'], person.presences[0].event)
+        self.assertEquals(ancestry.places['P0000'], ancestry.events['E0000'].place)
+
 
 class GrampsTest(TestCase):
     @sync
@@ -46,6 +46,7 @@ server {
     gzip_disable "msie6";
     gzip_vary on;
     gzip_types text/css application/javascript application/json application/xml;
+    gzip_static on;
 
     set $media_type_extension html;
     index index.$media_type_extension;
@@ -82,6 +83,7 @@ server {
     gzip_disable "msie6";
     gzip_vary on;
     gzip_types text/css application/javascript application/json application/xml;
+    gzip_static on;
 
     set $media_type_extension html;
     index index.$media_type_extension;
@@ -120,6 +122,7 @@ server {
     gzip_disable "msie6";
     gzip_vary on;
     gzip_types text/css application/javascript application/json application/xml;
+    gzip_static on;
 
     set $media_type_extension html;
     index index.$media_type_extension;
@@ -170,6 +173,7 @@ server {
     gzip_disable "msie6";
     gzip_vary on;
     gzip_types text/css application/javascript application/json application/xml;
+    gzip_static on;
 
     set_by_lua_block $media_type_extension {
         local available_media_types = {'text/html', 'application/json'}
@@ -231,6 +235,7 @@ server {
     gzip_disable "msie6";
     gzip_vary on;
     gzip_types text/css application/javascript application/json application/xml;
+    gzip_static on;
 
     set_by_lua_block $media_type_extension {
         local available_media_types = {'text/html', 'application/json'}
@@ -278,6 +283,7 @@ server {
     gzip_disable "msie6";
     gzip_vary on;
     gzip_types text/css application/javascript application/json application/xml;
+    gzip_static on;
 
     set $media_type_extension html;
     index index.$media_type_extension;
@@ -249,6 +249,36 @@ class PrivatizerTest(TestCase):
         privatize_person(person, 125)
         self.assertEquals(expected, person.private)
 
+    def test_privatize_person_with_collapsed_pedigree_should_use_nearest_generation(self):
+        person = Person('P0')
+        parent = Person('P1')
+        person.parents.append(parent)
+        # The ancestor is both a parent and a grandparent, but only expired as a parent.
+        ancestor = Person('P2')
+        Presence(ancestor, Subject(), Event(Birth(), date=Date(datetime.now().year - 125 * 2 - 1, 1, 1)))
+        person.parents.append(ancestor)
+        parent.parents.append(ancestor)
+        privatize_person(person, 125)
+        self.assertFalse(person.private)
+
+    def test_privatize_person_with_cyclic_ancestry(self):
+        person = Person('P0')
+        parent = Person('P1')
+        person.parents.append(parent)
+        parent.parents.append(person)
+        privatize_person(person, 125)
+        self.assertTrue(person.private)
+
+    def test_privatize_person_with_deep_ancestry(self):
+        person = Person('P0')
+        descendant = person
+        for generation in range(1, 5000):
+            ancestor = Person('P%d' % generation)
+            descendant.parents.append(ancestor)
+            descendant = ancestor
+        privatize_person(person, 125)
+        self.assertTrue(person.private)
+
     def test_privatize_event_should_not_privatize_if_public(self):
         source_file = File('F0', __file__)
         source = Source('The Source')
@@ -1,6 +1,7 @@
+import asyncio
+from copy import deepcopy
 from tempfile import TemporaryDirectory
-from time import sleep
-from typing import Tuple, Optional
+from typing import Tuple, Optional, Dict
 from unittest.mock import patch, call
 
 from betty.media_type import MediaType
@@ -11,7 +12,14 @@ try:
 except ImportError:
     from mock.mock import AsyncMock
 
+try:
+    from contextlib import asynccontextmanager
+except ImportError:
+    from async_generator import asynccontextmanager
+
 import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
 from aioresponses import aioresponses
 from parameterized import parameterized
 
@@ -62,167 +70,273 @@ class EntryTest(TestCase):
         self.assertEquals(content, sut.content)
 
 
-class RetrieverTest(TestCase):
-    @parameterized.expand([
-        ({}, {},),
-        ({
-            'nl': 'Amsterdam',
-            'uk': 'Амстердам',
-        }, {
-            'langlinks': [
-                {
-                    'lang': 'nl',
-                    'title': 'Amsterdam',
-                },
-                {
-                    'lang': 'uk',
-                    'title': 'Амстердам',
-                },
-            ],
-        },),
-    ])
-    @aioresponses()
-    @patch('sys.stderr')
-    @sync
-    async def test_get_translations_should_return(self, expected, response_pages_json, m_stderr, m_aioresponses) -> None:
-        entry_language = 'en'
-        entry_name = 'Amsterdam'
-        api_url = 'https://%s.wikipedia.org/w/api.php?action=query&titles=%s&prop=langlinks&lllimit=500&format=json&formatversion=2' % (entry_language, entry_name)
-        api_response_body = {
+class _WikipediaApi:
+    """
+    Stubs the MediaWiki API for the languages and pages it is given.
+    """
+
+    def __init__(self, pages: Dict[str, Dict[str, Dict]], langlinks_per_response: int = 500):
+        self.pages = pages
+        self.langlinks_per_response = langlinks_per_response
+        self.requests = []
+        self.available = True
+        self.response_body = None
+        self._server = None
+
+    async def __aenter__(self) -> '_WikipediaApi':
+        app = web.Application()
+        app.router.add_get('/{language}/api.php', self._handle)
+        self._server = TestServer(app)
+        await self._server.start_server()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self._server.close()
+
+    @property
+    def url(self) -> str:
+        return '%s%%s/api.php' % self._server.make_url('/')
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        language = request.match_info['language']
+        titles = request.query['titles'].split('|')
+        self.requests.append((language, request.query['prop'], titles))
+        if not self.available:
+            return web.Response(status=503, text='Service Unavailable')
+        if self.response_body is not None:
+            return web.Response(text=self.response_body, content_type='application/json')
+        normalized = []
+        pages = []
+        llcontinue = int(request.query.get('llcontinue', 0))
+        continuation = None
+        for title in titles:
+            normalized_title = title.replace('_', ' ')
+            if normalized_title != title:
+                normalized.append({
+                    'from': title,
+                    'to': normalized_title,
+                })
+            try:
+                page = dict(self.pages[language][normalized_title])
+            except KeyError:
+                pages.append({
+                    'title': normalized_title,
+                    'missing': True,
+                })
+                continue
+            page['title'] = normalized_title
+            if request.query['prop'] == 'langlinks' and 'langlinks' in page:
+                page['langlinks'] = page['langlinks'][llcontinue:llcontinue + self.langlinks_per_response]
+                if len(self.pages[language][normalized_title]['langlinks']) > llcontinue + self.langlinks_per_response:
+                    continuation = {
+                        'llcontinue': llcontinue + self.langlinks_per_response,
+                        'continue': '||',
+                    }
+            else:
+                page.pop('langlinks', None)
+            pages.append(page)
+        response_data = {
             'query': {
-                'pages': [response_pages_json],
+                'normalized': normalized,
+                'pages': pages,
             },
         }
-        m_aioresponses.get(api_url, payload=api_response_body)
-        with TemporaryDirectory() as cache_directory_path:
-            async with aiohttp.ClientSession() as session:
-                translations = await Retriever(session, cache_directory_path).get_translations(entry_language, entry_name)
-        self.assertEqual(expected, translations)
+        if continuation is not None:
+            response_data['continue'] = continuation
+        return web.json_response(response_data)
+
+
+class RetrieverTest(TestCase):
+    _PAGES = {
+        'en': {
+            'Amsterdam': {
+                'extract': 'The capital of the Netherlands.',
+                'langlinks': [
+                    {
+                        'lang': 'nl',
+                        'title': 'Amsterdam',
+                    },
+                    {
+                        'lang': 'uk',
+                        'title': 'Амстердам',
+                    },
+                ],
+            },
+            'Amsterdam city': {
+                'extract': 'The city of Amsterdam.',
+            },
+            'Rotterdam': {
+                'extract': 'A port in the Netherlands.',
+            },
+        },
+        'nl': {
+            'Amsterdam': {
+                'extract': 'De hoofdstad van Nederland.',
+            },
+        },
+    }
+
+    def setUp(self) -> None:
+        self._cache_directory = TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self._cache_directory.cleanup()
+
+    @asynccontextmanager
+    async def _retriever(self, api: _WikipediaApi, **kwargs) -> Retriever:
+        async with aiohttp.ClientSession() as session:
+            retriever = Retriever(session, self._cache_directory.name, api_url=api.url, **kwargs)
+            try:
+                yield retriever
+            finally:
+                await retriever.close()
 
-    @aioresponses()
-    @patch('sys.stderr')
     @sync
-    async def test_get_translations_with_client_error_should_raise_retrieval_error(self, m_aioresponses, m_stderr) -> None:
-        entry_language = 'en'
-        entry_name = 'Amsterdam'
-        api_url = 'https://%s.wikipedia.org/w/api.php?action=query&titles=%s&prop=langlinks&lllimit=500&format=json&formatversion=2' % (entry_language, entry_name)
-        m_aioresponses.get(api_url, exception=aiohttp.ClientError())
-        with TemporaryDirectory() as cache_directory_path:
-            with self.assertRaises(RetrievalError):
-                async with aiohttp.ClientSession() as session:
-                    await Retriever(session, cache_directory_path).get_translations(entry_language, entry_name)
+    async def test_get_entry_should_return(self) -> None:
+        async with _WikipediaApi(self._PAGES) as api:
+            async with self._retriever(api) as retriever:
+                entry = await retriever.get_entry('en', 'Amsterdam')
+        self.assertEquals('https://en.wikipedia.org/wiki/Amsterdam', entry.url)
+        self.assertEquals('Amsterdam', entry.title)
+        self.assertEquals('The capital of the Netherlands.', entry.content)
 
-    @aioresponses()
-    @patch('sys.stderr')
     @sync
-    async def test_get_translations_with_invalid_json_response_should_raise_retrieval_error(self, m_aioresponses, m_stderr) -> None:
-        entry_language = 'en'
-        entry_name = 'Amsterdam'
-        api_url = 'https://%s.wikipedia.org/w/api.php?action=query&titles=%s&prop=langlinks&lllimit=500&format=json&formatversion=2' % (entry_language, entry_name)
-        m_aioresponses.get(api_url, body='{Haha Im not rly JSON}')
-        with TemporaryDirectory() as cache_directory_path:
-            with self.assertRaises(RetrievalError):
-                async with aiohttp.ClientSession() as session:
-                    await Retriever(session, cache_directory_path).get_translations(entry_language, entry_name)
+    async def test_get_entry_should_return_normalized_entry(self) -> None:
+        async with _WikipediaApi(self._PAGES) as api:
+            async with self._retriever(api) as retriever:
+                entry = await retriever.get_entry('en', 'Amsterdam_city')
+        self.assertEquals('https://en.wikipedia.org/wiki/Amsterdam_city', entry.url)
+        self.assertEquals('Amsterdam city', entry.title)
+
+    @sync
+    async def test_get_entry_with_missing_page_should_raise_retrieval_error(self) -> None:
+        async with _WikipediaApi(self._PAGES) as api:
+            async with self._retriever(api) as retriever:
+                with self.assertRaises(RetrievalError):
+                    await retriever.get_entry('en', 'Atlantis')
 
-    @parameterized.expand([
-        ({},),
-        ({
-            'query': {}
-        },),
-        ({
-            'query': {
-                'pages': {}
-            }
-        },),
-        ({
-            'query': {
-                'pages': []
-            }
-        },),
-    ])
-    @aioresponses()
     @patch('sys.stderr')
     @sync
-    async def test_get_translations_with_unexpected_json_response_should_raise_retrieval_error(self, response_json, m_stderr, m_aioresponses) -> None:
-        entry_language = 'en'
-        entry_name = 'Amsterdam'
-        api_url = 'https://%s.wikipedia.org/w/api.php?action=query&titles=%s&prop=langlinks&lllimit=500&format=json&formatversion=2' % (entry_language, entry_name)
-        m_aioresponses.get(api_url, payload=response_json)
-        with TemporaryDirectory() as cache_directory_path:
-            with self.assertRaises(RetrievalError):
-                async with aiohttp.ClientSession() as session:
-                    await Retriever(session, cache_directory_path).get_translations(entry_language, entry_name)
+    async def test_get_entry_with_unavailable_api_should_raise_retrieval_error(self, m_stderr) -> None:
+        async with _WikipediaApi(self._PAGES) as api:
+            api.available = False
+            async with self._retriever(api) as retriever:
+                with self.assertRaises(RetrievalError):
+                    await retriever.get_entry('en', 'Amsterdam')
 
-    @aioresponses()
     @sync
-    async def test_get_entry_should_return(self, m_aioresponses) -> None:
-        entry_language = 'en'
-        entry_name = 'Amsterdam'
-        api_url = 'https://en.wikipedia.org/w/api.php?action=query&titles=Amsterdam&prop=extracts&exintro&format=json&formatversion=2'
-        entry_url = 'https://en.wikipedia.org/wiki/Amsterdam'
-        title = 'Amstelredam'
-        extract_1 = 'De hoofdstad van Nederland.'
-        extract_4 = 'Niet de hoofdstad van Holland.'
-        api_response_body_1 = {
-            'query': {
-                'pages': [
-                    {
-                        'title': title,
-                        'extract': extract_1,
-                    },
-                ],
-            }
-        }
-        api_response_body_4 = {
-            'query': {
-                'pages': [
-                    {
-                        'title': title,
-                        'extract': extract_4,
-                    },
-                ],
-            }
-        }
-        m_aioresponses.get(api_url, payload=api_response_body_1)
-        m_aioresponses.get(api_url, exception=aiohttp.ClientError())
-        m_aioresponses.get(api_url, payload=api_response_body_4)
-        with TemporaryDirectory() as cache_directory_path:
-            async with aiohttp.ClientSession() as session:
-                retriever = Retriever(session, cache_directory_path, 1)
-                # The first retrieval should make a successful request and set the cache.
-                entry_1 = await retriever.get_entry(entry_language, entry_name)
-                # The second retrieval should hit the cache from the first request.
-                entry_2 = await retriever.get_entry(entry_language, entry_name)
-                # The third retrieval should result in a failed request, and hit the cache from the first request.
-                sleep(2)
-                entry_3 = await retriever.get_entry(entry_language, entry_name)
-                # The fourth retrieval should make a successful request and set the cache again.
-                entry_4 = await retriever.get_entry(entry_language, entry_name)
-                # The fifth retrieval should hit the cache from the fourth request.
-                entry_5 = await retriever.get_entry(entry_language, entry_name)
-        for entry in [entry_1, entry_2, entry_3]:
-            self.assertEquals(entry_url, entry.url)
-            self.assertEquals(title, entry.title)
-            self.assertEquals(extract_1, entry.content)
-        for entry in [entry_4, entry_5]:
-            self.assertEquals(entry_url, entry.url)
-            self.assertEquals(title, entry.title)
-            self.assertEquals(extract_4, entry.content)
+    async def test_get_entries_should_batch_requests(self) -> None:
+        async with _WikipediaApi(self._PAGES) as api:
+            async with self._retriever(api) as retriever:
+                entries = await asyncio.gather(
+                    retriever.get_entry('en', 'Amsterdam'),
+                    retriever.get_entry('nl', 'Amsterdam'),
+                    retriever.get_entry('en', 'Rotterdam'),
+                )
+        self.assertEquals(['The capital of the Netherlands.', 'De hoofdstad van Nederland.', 'A port in the Netherlands.'], [entry.content for entry in entries])
+        self.assertCountEqual([
+            ('en', 'extracts', ['Amsterdam', 'Rotterdam']),
+            ('nl', 'extracts', ['Amsterdam']),
+        ], api.requests)
 
-    @aioresponses()
+    @sync
+    async def test_get_entries_should_limit_batch_size(self) -> None:
+        names = ['Entry_%d' % i for i in range(25)]
+        async with _WikipediaApi({}) as api:
+            async with self._retriever(api) as retriever:
+                await asyncio.gather(*[retriever.get_entry('en', name) for name in names], return_exceptions=True)
+        self.assertEquals([20, 5], [len(titles) for _, _, titles in api.requests])
+
+    @sync
+    async def test_get_entries_should_deduplicate_requests(self) -> None:
+        async with _WikipediaApi(self._PAGES) as api:
+            async with self._retriever(api) as retriever:
+                entry_1, entry_2 = await asyncio.gather(
+                    retriever.get_entry('en', 'Amsterdam'),
+                    retriever.get_entry('en', 'Amsterdam'),
+                )
+        self.assertEquals(entry_1.content, entry_2.content)
+        self.assertEquals([('en', 'extracts', ['Amsterdam'])], api.requests)
+
+    @sync
+    async def test_get_entry_should_cache(self) -> None:
+        async with _WikipediaApi(self._PAGES) as api:
+            async with self._retriever(api) as retriever:
+                await retriever.get_entry('en', 'Amsterdam')
+            async with self._retriever(api) as retriever:
+                entry = await retriever.get_entry('en', 'Amsterdam')
+        self.assertEquals('The capital of the Netherlands.', entry.content)
+        self.assertEquals(1, len(api.requests))
+
+    @sync
+    async def test_get_entry_should_revalidate_stale_cache(self) -> None:
+        async with _WikipediaApi(deepcopy(self._PAGES)) as api:
+            async with self._retriever(api, ttl=0) as retriever:
+                await retriever.get_entry('en', 'Amsterdam')
+            api.pages['en']['Amsterdam']['extract'] = 'The capital of the Kingdom of the Netherlands.'
+            async with self._retriever(api, ttl=0) as retriever:
+                stale_entry = await retriever.get_entry('en', 'Amsterdam')
+            async with self._retriever(api, ttl=0, stale_while_revalidate=0) as retriever:
+                api.available = False
+                with patch('sys.stderr'):
+                    revalidated_entry = await retriever.get_entry('en', 'Amsterdam')
+        self.assertEquals('The capital of the Netherlands.', stale_entry.content)
+        self.assertEquals('The capital of the Kingdom of the Netherlands.', revalidated_entry.content)
+        self.assertEquals(3, len(api.requests))
+
+    @sync
+    async def test_get_entry_should_refetch_expired_cache(self) -> None:
+        async with _WikipediaApi(deepcopy(self._PAGES)) as api:
+            async with self._retriever(api, ttl=0) as retriever:
+                await retriever.get_entry('en', 'Amsterdam')
+            api.pages['en']['Amsterdam']['extract'] = 'The capital of the Kingdom of the Netherlands.'
+            async with self._retriever(api, ttl=0, stale_while_revalidate=0) as retriever:
+                entry = await retriever.get_entry('en', 'Amsterdam')
+        self.assertEquals('The capital of the Kingdom of the Netherlands.', entry.content)
+
+    @sync
+    async def test_get_translations_should_return(self) -> None:
+        async with _WikipediaApi(self._PAGES) as api:
+            async with self._retriever(api) as retriever:
+                translations = await retriever.get_translations('en', 'Amsterdam')
+        self.assertEquals({
+            'nl': 'Amsterdam',
+            'uk': 'Амстердам',
+        }, translations)
+
+    @sync
+    async def test_get_translations_should_return_without_translations(self) -> None:
+        async with _WikipediaApi(self._PAGES) as api:
+            async with self._retriever(api) as retriever:
+                translations = await retriever.get_translations('en', 'Rotterdam')
+        self.assertEquals({}, translations)
+
+    @sync
+    async def test_get_translations_should_merge_continued_responses(self) -> None:
+        async with _WikipediaApi(self._PAGES, 1) as api:
+            async with self._retriever(api) as retriever:
+                translations = await retriever.get_translations('en', 'Amsterdam')
+        self.assertEquals({
+            'nl': 'Amsterdam',
+            'uk': 'Амстердам',
+        }, translations)
+        self.assertEquals(2, len(api.requests))
+
+    @parameterized.expand([
+        ('{Haha Im not rly JSON}',),
+        ('{}',),
+        ('{"query": {}}',),
+        ('{"query": {"pages": {}}}',),
+        ('{"query": {"pages": []}}',),
+    ])
     @patch('sys.stderr')
     @sync
-    async def test_get_entry_with_client_error_should_raise_retrieval_error(self, m_aioresponses, m_stderr) -> None:
-        entry_language = 'en'
-        entry_name = 'Amsterdam'
-        api_url = 'https://en.wikipedia.org/w/api.php?action=query&titles=Amsterdam&prop=extracts&exintro&format=json&formatversion=2'
-        m_aioresponses.get(api_url, exception=aiohttp.ClientError())
-        with TemporaryDirectory() as cache_directory_path:
-            async with aiohttp.ClientSession() as session:
-                retriever = Retriever(session, cache_directory_path)
+    async def test_get_translations_with_unexpected_response_should_raise_retrieval_error(self, response_body: str, m_stderr) -> None:
+        async with _WikipediaApi(self._PAGES) as api:
+            api.response_body = response_body
+            async with self._retriever(api) as retriever:
                 with self.assertRaises(RetrievalError):
-                    await retriever.get_entry(entry_language, entry_name)
+                    await retriever.get_translations('en', 'Amsterdam')
 
 
 class PopulatorTest(TestCase):
@@ -470,6 +584,60 @@ class PopulatorTest(TestCase):
         self.assertIsNotNone(link_nl.description)
         self.assertEqual('external', link_nl.relationship)
 
+    @sync
+    async def test_populate_should_batch_requests(self) -> None:
+        pages = {
+            'en': {
+                'Amsterdam': {
+                    'extract': 'The capital of the Netherlands.',
+                    'langlinks': [
+                        {
+                            'lang': 'nl',
+                            'title': 'Amsterdam',
+                        },
+                    ],
+                },
+                'Rotterdam': {
+                    'extract': 'A port in the Netherlands.',
+                },
+            },
+            'nl': {
+                'Amsterdam': {
+                    'extract': 'De hoofdstad van Nederland.',
+                },
+            },
+        }
+        resources = []
+        for resource_id, entry_name in [('amsterdam', 'Amsterdam'), ('rotterdam', 'Rotterdam'), ('amstelredam', 'Amsterdam')]:
+            resource = IdentifiableSource(resource_id, entry_name)
+            resource.links.add(Link('https://en.wikipedia.org/wiki/%s' % entry_name))
+            resources.append(resource)
+        async with _WikipediaApi(pages) as api:
+            with TemporaryDirectory() as output_directory_path:
+                with TemporaryDirectory() as cache_directory_path:
+                    configuration = Configuration(
+                        output_directory_path, 'https://example.com')
+                    configuration.cache_directory_path = cache_directory_path
+                    configuration.locales.clear()
+                    configuration.locales['en-US'] = LocaleConfiguration('en-US', 'en')
+                    configuration.locales['nl-NL'] = LocaleConfiguration('nl-NL', 'nl')
+                    async with Site(configuration) as site:
+                        for resource in resources:
+                            site.ancestry.sources[resource.id] = resource
+                        async with aiohttp.ClientSession() as session:
+                            retriever = Retriever(session, cache_directory_path, api_url=api.url)
+                            sut = _Populator(site, retriever)
+                            await sut.populate()
+                            await retriever.close()
+        self.assertCountEqual([
+            ('en', 'extracts', ['Amsterdam', 'Rotterdam']),
+            ('en', 'langlinks', ['Amsterdam', 'Rotterdam']),
+            ('nl', 'extracts', ['Amsterdam']),
+        ], api.requests)
+        self.assertEqual(2, len(resources[0].links))
+        self.assertEqual(1, len(resources[1].links))
+        self.assertEqual(2, len(resources[2].links))
+
 
 class WikipediaTest(TestCase):
     @aioresponses()
@@ -483,7 +651,7 @@ class WikipediaTest(TestCase):
             # Add a link that doesn't point to Wikipedia at all to test it's ignored.
             Link('https://example.com'),
         ]
-        api_url = 'https://en.wikipedia.org/w/api.php?action=query&titles=Amsterdam&prop=extracts&exintro&format=json&formatversion=2'
+        api_url = 'https://en.wikipedia.org/w/api.php?action=query&titles=Amsterdam&prop=extracts&exintro&exlimit=max&format=json&formatversion=2'
         title = 'Amstelredam'
         extract = 'De hoofdstad van Nederland.'
         api_response_body = {
@@ -527,7 +695,7 @@ class WikipediaTest(TestCase):
                 ],
             }
         }
-        entry_api_url = 'https://en.wikipedia.org/w/api.php?action=query&titles=Amsterdam&prop=extracts&exintro&format=json&formatversion=2'
+        entry_api_url = 'https://en.wikipedia.org/w/api.php?action=query&titles=Amsterdam&prop=extracts&exintro&exlimit=max&format=json&formatversion=2'
         m_aioresponses.get(entry_api_url, payload=entry_api_response_body)
         translations_api_response_body = {
             'query': {
@@ -538,7 +706,7 @@ class WikipediaTest(TestCase):
                 ],
             },
         }
-        translations_api_url = 'https://en.wikipedia.org/w/api.php?action=query&titles=Amsterdam&prop=langlinks&lllimit=500&format=json&formatversion=2'
+        translations_api_url = 'https://en.wikipedia.org/w/api.php?action=query&titles=Amsterdam&prop=langlinks&lllimit=max&format=json&formatversion=2'
         m_aioresponses.get(translations_api_url, payload=translations_api_response_body)
 
         with TemporaryDirectory() as output_directory_path:
@@ -1,6 +1,8 @@
+import gc
+import tracemalloc
 from gettext import NullTranslations
 from tempfile import TemporaryFile, NamedTemporaryFile
-from typing import Any
+from typing import Any, Set, Type
 from unittest.mock import Mock
 
 from geopy import Point
@@ -12,7 +14,9 @@ from betty.ancestry import EventHandlingSetList, Person, Event, Place, File, Not
     PresenceRole, Attendee, Beneficiary, Witness, EventType, UnknownEventType, LifeEventType, PreBirthEventType, \
     PostDeathEventType, Baptism, Adoption, Death, Funeral, FinalDispositionEventType, Cremation, Burial, Will, \
     Engagement, Marriage, MarriageAnnouncement, Divorce, DivorceAnnouncement, Residence, Immigration, Emigration, \
-    Correspondence, Occupation, Retirement, Confirmation, Missing, EVENT_TYPE_TYPES, RESOURCE_TYPES, Resource
+    Correspondence, Occupation, Retirement, Confirmation, Missing, EVENT_TYPE_TYPES, RESOURCE_TYPES, Resource, \
+    EventTypeOrder, get_event_type_order
+from betty.graph import CyclicGraphError
 from betty.locale import Date, Translations
 from betty.media_type import MediaType
 from betty.tests import TestCase
@@ -65,6 +69,24 @@ class EventHandlingSetListTest(TestCase):
         self.assertSequenceEqual([1, 2, 3, 4, 5, 6], added)
         self.assertSequenceEqual([1, 2, 3], removed)
 
+    def test_remove_should_ignore_unknown_values(self) -> None:
+        removed = []
+        sut = EventHandlingSetList(lambda _: None, lambda value: removed.append(value))
+        sut.append(1, 2, 3)
+        sut.remove(4, 2, 5, 3)
+        self.assertSequenceEqual([1], sut)
+        self.assertSequenceEqual([2, 3], removed)
+
+    def test_replace_should_keep_remaining_values(self) -> None:
+        added = []
+        removed = []
+        sut = EventHandlingSetList(lambda value: added.append(value), lambda value: removed.append(value))
+        sut.append(1, 2, 3)
+        sut.replace(3, 4, 1)
+        self.assertSequenceEqual([3, 4, 1], sut)
+        self.assertSequenceEqual([1, 2, 3, 4], added)
+        self.assertSequenceEqual([2], removed)
+
     def test_clear(self) -> None:
         added = []
         removed = []
@@ -100,6 +122,22 @@ class EventHandlingSetListTest(TestCase):
         with self.assertRaises(IndexError):
             sut[3]
 
+    def test_iter_should_allow_changes_during_iteration(self) -> None:
+        sut = EventHandlingSetList(lambda _: None, lambda _: None)
+        sut.append(1, 2, 3)
+        iterated = []
+        for value in sut:
+            iterated.append(value)
+            sut.remove(value)
+        self.assertSequenceEqual([1, 2, 3], iterated)
+        self.assertSequenceEqual([], sut)
+
+    def test_contains(self) -> None:
+        sut = EventHandlingSetList(lambda _: None, lambda _: None)
+        sut.append(1, 2, 3)
+        self.assertIn(2, sut)
+        self.assertNotIn(4, sut)
+
     def test_set_like_functionality(self) -> None:
         sut = EventHandlingSetList(lambda _: None, lambda _: None)
         # Ensure duplicates are skipped.
@@ -619,6 +657,12 @@ class AttendeeTest(TestCase):
             self.assertNotEqual('', sut.label)
 
 
+class PresenceRoleTest(TestCase):
+    def test_should_be_interned(self) -> None:
+        self.assertIs(Subject(), Subject())
+        self.assertIsNot(Subject(), Witness())
+
+
 class PresenceTest(TestCase):
     def test_person(self) -> None:
         person = Mock(Person)
@@ -637,6 +681,10 @@ class PresenceTest(TestCase):
 
 
 class EventTypeTest(TestCase):
+    def test_should_be_interned(self) -> None:
+        self.assertIs(Birth(), Birth())
+        self.assertIsNot(Birth(), Death())
+
     def test_comes_before(self) -> None:
         self.assertIsInstance(EventType.comes_before(), set)
 
@@ -970,6 +1018,77 @@ class EventTypeTypesTest(TestCase):
             self.assertTrue(issubclass(event_type_type, EventType))
 
 
+class EventTypeOrderTest(TestCase):
+    class _Before(EventType):
+        @classmethod
+        def comes_before(cls) -> Set[Type[EventType]]:
+            return {EventTypeOrderTest._Abstract}
+
+    class _Abstract(EventType):
+        pass  # pragma: no cover
+
+    class _Concrete(_Abstract):
+        pass  # pragma: no cover
+
+    class _After(EventType):
+        @classmethod
+        def comes_after(cls) -> Set[Type[EventType]]:
+            return {EventTypeOrderTest._Concrete}
+
+    class _Unrelated(EventType):
+        pass  # pragma: no cover
+
+    def test_event_type_types(self) -> None:
+        sut = EventTypeOrder([self._After, self._Unrelated, self._Concrete, self._Before])
+        self.assertEquals([self._Unrelated, self._Before, self._Concrete, self._After], sut.event_type_types)
+
+    def test_rank(self) -> None:
+        sut = EventTypeOrder([self._After, self._Concrete, self._Before])
+        self.assertEquals(0, sut.rank(self._Before))
+        self.assertEquals(1, sut.rank(self._Concrete))
+        self.assertEquals(2, sut.rank(self._After))
+
+    def test_rank_without_event_type(self) -> None:
+        sut = EventTypeOrder([self._After, self._Concrete, self._Before])
+        self.assertEquals(3, sut.rank(self._Unrelated))
+
+    def test_comes_before(self) -> None:
+        sut = EventTypeOrder([self._After, self._Unrelated, self._Concrete, self._Before])
+        self.assertTrue(sut.comes_before(self._Before, self._Concrete))
+        self.assertTrue(sut.comes_before(self._Before, self._After))
+        self.assertFalse(sut.comes_before(self._After, self._Before))
+        self.assertFalse(sut.comes_before(self._Before, self._Before))
+        self.assertFalse(sut.comes_before(self._Before, self._Unrelated))
+        self.assertFalse(sut.comes_before(self._Before, Birth))
+
+    def test_comes_after(self) -> None:
+        sut = EventTypeOrder([self._After, self._Unrelated, self._Concrete, self._Before])
+        self.assertTrue(sut.comes_after(self._After, self._Before))
+        self.assertFalse(sut.comes_after(self._Before, self._After))
+
+    def test_with_cycle_should_raise_cyclic_graph_error(self) -> None:
+        class _AfterAfter(EventType):
+            @classmethod
+            def comes_before(cls) -> Set[Type[EventType]]:
+                return {EventTypeOrderTest._Before}
+
+            @classmethod
+            def comes_after(cls) -> Set[Type[EventType]]:
+                return {EventTypeOrderTest._After}
+
+        with self.assertRaises(CyclicGraphError):
+            EventTypeOrder([self._Before, self._Concrete, self._After, _AfterAfter])
+
+    def test_get_event_type_order(self) -> None:
+        sut = get_event_type_order()
+        self.assertIs(sut, get_event_type_order())
+        self.assertCountEqual(EVENT_TYPE_TYPES, sut.event_type_types)
+        self.assertTrue(sut.comes_before(Birth, Burial))
+        self.assertTrue(sut.comes_before(Death, Will))
+        self.assertTrue(sut.comes_after(Marriage, Engagement))
+        self.assertFalse(sut.comes_before(Residence, Occupation))
+
+
 class EventTest(TestCase):
     def test_resource_type_name(self) -> None:
         self.assertIsInstance(Event.resource_type_name(), str)
@@ -1094,12 +1213,18 @@ class PersonNameTest(TestCase):
     def test_gt(self, expected: bool, left: PersonName, right: Any) -> None:
         self.assertEquals(expected, left > right)
 
+    def test_hash(self) -> None:
+        self.assertEquals(hash(PersonName('Janet', 'Not a Girl')), hash(PersonName('Janet', 'Not a Girl')))
+
 
 class PersonTest(TestCase):
     def test_resource_type_name(self) -> None:
         self.assertIsInstance(Person.resource_type_name(), str)
         self.assertNotEqual('', Person.resource_type_name())
 
+    def test_hash(self) -> None:
+        self.assertEquals(hash(Person('1')), hash(Person('1')))
+
     def test_parents(self) -> None:
         sut = Person('1')
         parent = Person('2')
@@ -1228,6 +1353,38 @@ class PersonTest(TestCase):
         self.assertEquals([file1, file2, file3, file4, file5, file6], list(sut.associated_files))
 
 
+class MemoryTest(TestCase):
+    # The number of bytes each person, with their name, birth and death, and a parent, may take up at most.
+    _PERSON_BUDGET = 4096
+
+    def test_people_should_fit_the_memory_budget(self) -> None:
+        people = []
+        gc.collect()
+        tracemalloc.start()
+        try:
+            for i in range(0, 1000):
+                person = Person('P%d' % i)
+                person.names.append(PersonName('Jane', 'Doe'))
+                for event_type in (Birth(), Death()):
+                    event = IdentifiableEvent('E%d%s' % (i, event_type.name()), event_type, Date(1970, 1, 1))
+                    Presence(person, Subject(), event)
+                if people:
+                    person.parents.append(people[-1])
+                people.append(person)
+            size = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        self.assertLessEqual(size / len(people), self._PERSON_BUDGET)
+
+    def test_slotted_types_should_not_populate_instance_dictionaries(self) -> None:
+        person = Person('P1')
+        person.names.append(PersonName('Jane'))
+        Presence(person, Subject(), IdentifiableEvent('E1', Birth(), Date(1970, 1, 1)))
+        self.assertEquals({}, vars(person))
+        self.assertEquals({}, vars(person.names[0]))
+        self.assertEquals({}, vars(person.presences[0].event))
+
+
 class ResourceTypesTest(TestCase):
     def test(self) -> None:
         for resource_type in RESOURCE_TYPES:
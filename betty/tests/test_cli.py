@@ -1,6 +1,6 @@
 import unittest
 from json import dump
-from os import path, makedirs
+from os import path, makedirs, listdir
 from tempfile import NamedTemporaryFile, TemporaryDirectory
 from typing import Callable, Dict
 from unittest.mock import patch
@@ -11,6 +11,7 @@ from click.testing import CliRunner
 import betty
 from betty import os
 from betty.error import UserFacingError
+from betty.image import ImageCache
 from betty.plugin import Plugin
 from betty.serve import Server
 from betty.tests import patch_cache, TestCase
@@ -154,6 +155,37 @@ class ClearCachesTest(TestCase):
         with self.assertRaises(FileNotFoundError):
             open(cached_file_path)
 
+    @patch_cache
+    def test_images(self):
+        cached_file_path = path.join(betty._CACHE_DIRECTORY_PATH, 'KeepMeAroundPlease')
+        open(cached_file_path, 'w').close()
+        cached_image_file_path = path.join(betty._CACHE_DIRECTORY_PATH, 'image', 'RemoveMePlease')
+        makedirs(path.dirname(cached_image_file_path))
+        open(cached_image_file_path, 'w').close()
+        runner = CliRunner()
+        result = runner.invoke(main, ('clear-caches', '--images'))
+        self.assertEqual(0, result.exit_code)
+        self.assertTrue(path.exists(cached_file_path))
+        self.assertFalse(path.exists(cached_image_file_path))
+
+    @patch_cache
+    def test_max_size(self):
+        image_cache_directory_path = path.join(betty._CACHE_DIRECTORY_PATH, 'image')
+        image_cache = ImageCache(image_cache_directory_path)
+        with TemporaryDirectory() as directory_path:
+            source_file_path = path.join(directory_path, 'source.png')
+            open(source_file_path, 'w').close()
+
+            def _derive(derivative_file_path: str) -> None:
+                with open(derivative_file_path, 'wb') as f:
+                    f.write(b'derivative')
+            image_cache.publish(source_file_path, '99x-.png', _derive, path.join(directory_path, 'F1-99x-.png'))
+            image_cache.close()
+        runner = CliRunner()
+        result = runner.invoke(main, ('clear-caches', '--max-size', '0'))
+        self.assertEqual(0, result.exit_code)
+        self.assertEquals(['index.sqlite'], listdir(image_cache_directory_path))
+
 
 class GenerateTest(TestCase):
     @patch('betty.generate.generate', new_callable=AsyncMock)
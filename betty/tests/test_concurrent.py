@@ -1,9 +1,15 @@
+import threading
+from concurrent.futures import CancelledError
 from concurrent.futures.thread import ThreadPoolExecutor
 
 from betty.concurrent import ExceptionRaisingExecutor
 from betty.tests import TestCase
 
 
+def _task():
+    return 'Hello, world!'
+
+
 class ExceptionRaisingExecutorTest(TestCase):
     def test_without_exception_should_not_raise(self) -> None:
         def _task():
@@ -19,3 +25,74 @@ class ExceptionRaisingExecutorTest(TestCase):
         with self.assertRaises(RuntimeError):
             with ExceptionRaisingExecutor(ThreadPoolExecutor()) as sut:
                 sut.submit(_task)
+
+    def test_submit_should_return_result(self) -> None:
+        with ExceptionRaisingExecutor(ThreadPoolExecutor()) as sut:
+            future = sut.submit(_task)
+        self.assertEquals('Hello, world!', future.result())
+        self.assertEquals(1, sut.submitted_count)
+        self.assertEquals(1, sut.done_count)
+
+    def test_submit_should_raise_previous_exception(self) -> None:
+        def _failing_task():
+            raise RuntimeError()
+
+        sut = ExceptionRaisingExecutor(ThreadPoolExecutor())
+        try:
+            future = sut.submit(_failing_task)
+            with self.assertRaises(RuntimeError):
+                future.result()
+            with self.assertRaises(RuntimeError):
+                sut.submit(_task)
+        finally:
+            # The error was raised already, so it must not be raised again.
+            sut.shutdown()
+
+    def test_exception_should_cancel_pending_tasks(self) -> None:
+        failing_task_started = threading.Event()
+        fail = threading.Event()
+
+        def _failing_task():
+            failing_task_started.set()
+            fail.wait()
+            raise RuntimeError()
+
+        sut = ExceptionRaisingExecutor(ThreadPoolExecutor(1))
+        sut.submit(_failing_task)
+        failing_task_started.wait()
+        future = sut.submit(_task)
+        fail.set()
+        with self.assertRaises(RuntimeError):
+            sut.shutdown()
+        with self.assertRaises(CancelledError):
+            future.result()
+
+    def test_submit_should_block_if_max_pending_is_reached(self) -> None:
+        release = threading.Event()
+
+        def _blocking_task():
+            release.wait()
+
+        sut = ExceptionRaisingExecutor(ThreadPoolExecutor(), 1)
+        sut.submit(_blocking_task)
+        submitted = threading.Event()
+
+        def _submit():
+            sut.submit(_task)
+            submitted.set()
+        submitter = threading.Thread(target=_submit)
+        submitter.start()
+        self.assertFalse(submitted.wait(0.1))
+        release.set()
+        self.assertTrue(submitted.wait(5))
+        submitter.join()
+        sut.shutdown()
+        self.assertEquals(2, sut.done_count)
+
+    def test_timings(self) -> None:
+        with ExceptionRaisingExecutor(ThreadPoolExecutor()) as sut:
+            sut.submit(_task)
+            sut.submit(_task)
+        timing = sut.timings['%s._task' % __name__]
+        self.assertEquals(2, timing.count)
+        self.assertGreaterEqual(timing.total, timing.maximum)
@@ -3,6 +3,7 @@ from collections import OrderedDict
 from os.path import join
 from tempfile import NamedTemporaryFile, TemporaryDirectory
 from typing import Any, Dict
+from unittest.mock import patch
 
 import yaml
 from parameterized import parameterized
@@ -197,6 +198,13 @@ class FromTest(TestCase):
         self.assertEquals('/', configuration.root_path)
         self.assertFalse(configuration.clean_urls)
         self.assertFalse(configuration.content_negotiation)
+        self.assertFalse(configuration.incremental)
+        self.assertEquals(1, configuration.processes)
+        self.assertFalse(configuration.snapshot)
+        self.assertIsNone(configuration.image_cache_size)
+        self.assertEquals([], configuration.image_formats)
+        self.assertFalse(configuration.normalize_permissions)
+        self.assertFalse(configuration.sitemap_gzip)
 
     def test_from_file_should_parse_title(self):
         title = 'My first Betty site'
@@ -279,6 +287,77 @@ class FromTest(TestCase):
             configuration = from_file(f)
             self.assertEquals(mode, configuration.mode)
 
+    def test_from_file_should_parse_incremental(self):
+        config_dict = dict(**self._MINIMAL_CONFIG_DICT)
+        config_dict['incremental'] = True
+        with self._write(config_dict) as f:
+            configuration = from_file(f)
+            self.assertTrue(configuration.incremental)
+
+    def test_from_file_should_parse_processes(self):
+        config_dict = dict(**self._MINIMAL_CONFIG_DICT)
+        config_dict['processes'] = 8
+        with self._write(config_dict) as f:
+            configuration = from_file(f)
+            self.assertEquals(8, configuration.processes)
+
+    def test_from_file_should_error_if_processes_is_invalid(self):
+        config_dict = dict(**self._MINIMAL_CONFIG_DICT)
+        config_dict['processes'] = 0
+        with self._write(config_dict) as f:
+            with self.assertRaises(ConfigurationValueError):
+                from_file(f)
+
+    def test_from_file_should_parse_snapshot(self):
+        config_dict = dict(**self._MINIMAL_CONFIG_DICT)
+        config_dict['snapshot'] = True
+        with self._write(config_dict) as f:
+            configuration = from_file(f)
+            self.assertTrue(configuration.snapshot)
+
+    def test_from_file_should_parse_image_cache_size(self):
+        config_dict = dict(**self._MINIMAL_CONFIG_DICT)
+        config_dict['image_cache_size'] = 1024
+        with self._write(config_dict) as f:
+            configuration = from_file(f)
+            self.assertEquals(1024, configuration.image_cache_size)
+
+    def test_from_file_should_error_if_image_cache_size_is_invalid(self):
+        config_dict = dict(**self._MINIMAL_CONFIG_DICT)
+        config_dict['image_cache_size'] = 0
+        with self._write(config_dict) as f:
+            with self.assertRaises(ConfigurationValueError):
+                from_file(f)
+
+    @patch('betty.voluptuous.is_format_supported', return_value=True)
+    def test_from_file_should_parse_image_formats(self, _):
+        config_dict = dict(**self._MINIMAL_CONFIG_DICT)
+        config_dict['image_formats'] = ['avif', 'webp']
+        with self._write(config_dict) as f:
+            configuration = from_file(f)
+            self.assertEquals(['avif', 'webp'], configuration.image_formats)
+
+    def test_from_file_should_error_if_image_formats_is_invalid(self):
+        config_dict = dict(**self._MINIMAL_CONFIG_DICT)
+        config_dict['image_formats'] = ['gif']
+        with self._write(config_dict) as f:
+            with self.assertRaises(ConfigurationValueError):
+                from_file(f)
+
+    def test_from_file_should_parse_normalize_permissions(self):
+        config_dict = dict(**self._MINIMAL_CONFIG_DICT)
+        config_dict['normalize_permissions'] = True
+        with self._write(config_dict) as f:
+            configuration = from_file(f)
+            self.assertTrue(configuration.normalize_permissions)
+
+    def test_from_file_should_parse_sitemap_gzip(self):
+        config_dict = dict(**self._MINIMAL_CONFIG_DICT)
+        config_dict['sitemap_gzip'] = True
+        with self._write(config_dict) as f:
+            configuration = from_file(f)
+            self.assertTrue(configuration.sitemap_gzip)
+
     def test_from_file_should_parse_assets_directory_path(self):
         with TemporaryDirectory() as assets_directory_path:
             config_dict = dict(**self._MINIMAL_CONFIG_DICT)
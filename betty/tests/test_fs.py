@@ -3,7 +3,7 @@ from os import mkdir
 from os.path import join, dirname
 from tempfile import TemporaryDirectory
 
-from betty.fs import iterfiles, FileSystem, hashfile
+from betty.fs import iterfiles, FileSystem, hashfile, _clone
 from betty.asyncio import sync
 from betty.tests import TestCase
 
@@ -172,3 +172,77 @@ class FileSystemTest(TestCase):
                         self.assertEquals('oranges', f.read())
                     with await sut.open(join(destination_path, 'basket', 'bananas')) as f:
                         self.assertEquals('bananas', f.read())
+
+    @sync
+    async def test_copytree_should_replace_stale_files(self):
+        with TemporaryDirectory() as source_path:
+            with open(join(source_path, 'apples'), 'w') as f:
+                f.write('apples')
+            with TemporaryDirectory() as destination_path:
+                with open(join(destination_path, 'apples'), 'w') as f:
+                    f.write('notapples')
+                sut = FileSystem(source_path)
+
+                await sut.copytree('', destination_path)
+
+                with open(join(destination_path, 'apples')) as f:
+                    self.assertEquals('apples', f.read())
+
+    @sync
+    async def test_copytree_should_skip_unchanged_files(self):
+        with TemporaryDirectory() as source_path:
+            with open(join(source_path, 'apples'), 'w') as f:
+                f.write('apples')
+            with TemporaryDirectory() as destination_path:
+                sut = FileSystem(source_path)
+                await sut.copytree('', destination_path)
+                destination_inode = os.stat(join(destination_path, 'apples')).st_ino
+
+                await FileSystem(source_path).copytree('', destination_path)
+
+                self.assertEquals(destination_inode, os.stat(join(destination_path, 'apples')).st_ino)
+
+    @sync
+    async def test_copytree_should_share_copies(self):
+        with TemporaryDirectory() as source_path:
+            with open(join(source_path, 'apples'), 'w') as f:
+                f.write('apples')
+            with TemporaryDirectory() as destination_path:
+                sut = FileSystem(source_path)
+
+                await sut.copytree('', join(destination_path, 'en'))
+                await sut.copytree('', join(destination_path, 'nl'))
+
+                source_stat = os.stat(join(source_path, 'apples'))
+                en_stat = os.stat(join(destination_path, 'en', 'apples'))
+                nl_stat = os.stat(join(destination_path, 'nl', 'apples'))
+                self.assertNotEqual(source_stat.st_ino, en_stat.st_ino)
+                self.assertEquals(en_stat.st_ino, nl_stat.st_ino)
+
+    @sync
+    async def test_copytree_should_not_share_changed_copies(self):
+        with TemporaryDirectory() as source_path:
+            with open(join(source_path, 'apples'), 'w') as f:
+                f.write('apples')
+            with TemporaryDirectory() as destination_path:
+                sut = FileSystem(source_path)
+                await sut.copytree('', join(destination_path, 'en'))
+                with open(join(destination_path, 'en', 'apples'), 'w') as f:
+                    f.write('notapples')
+
+                await sut.copytree('', join(destination_path, 'nl'))
+
+                with open(join(destination_path, 'nl', 'apples')) as f:
+                    self.assertEquals('apples', f.read())
+
+
+class CloneTest(TestCase):
+    def test_clone(self):
+        with TemporaryDirectory() as working_directory_path:
+            source_file_path = join(working_directory_path, 'source')
+            destination_file_path = join(working_directory_path, 'destination')
+            with open(source_file_path, 'wb') as f:
+                f.write(b'apples' * 2 ** 16)
+            _clone(source_file_path, destination_file_path)
+            with open(destination_file_path, 'rb') as f:
+                self.assertEquals(b'apples' * 2 ** 16, f.read())
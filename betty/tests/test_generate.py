@@ -1,4 +1,6 @@
 import json as stdjson
+import os
+import stat
 from os import makedirs, path
 from os.path import join, exists
 from tempfile import TemporaryDirectory, NamedTemporaryFile
@@ -8,10 +10,10 @@ from lxml import etree
 
 from betty import json
 from betty.ancestry import Person, Place, Source, PlaceName, File, IdentifiableEvent, IdentifiableCitation, \
-    IdentifiableSource, Birth
+    IdentifiableSource, Birth, PersonName
 from betty.config import Configuration, LocaleConfiguration
 from betty.asyncio import sync
-from betty.generate import generate
+from betty.generate import generate, _Writer
 from betty.site import Site
 from betty.tests import TestCase
 
@@ -54,6 +56,12 @@ class RenderTest(GenerateTestCase):
         await generate(self.site)
         self.assert_betty_html('/index.html')
 
+    @sync
+    async def test_search_index(self):
+        await generate(self.site)
+        file_path = join(self.site.configuration.www_directory_path, 'search', 'index.json')
+        self.assertTrue(exists(file_path), '%s does not exist' % file_path)
+
     @sync
     async def test_files(self):
         await generate(self.site)
@@ -175,6 +183,94 @@ class MultilingualTest(GenerateTestCase):
             self.assertIn(translation_link, f.read())
 
 
+class IncrementalTest(GenerateTestCase):
+    def setUp(self):
+        GenerateTestCase.setUp(self)
+        configuration = Configuration(
+            self._outputDirectory.name, 'https://ancestry.example.com')
+        configuration.incremental = True
+        self.site = Site(configuration)
+
+    @sync
+    async def test_should_skip_unchanged_resources(self):
+        person = Person('PERSON1')
+        self.site.ancestry.people[person.id] = person
+        await generate(self.site)
+        file_path = self.assert_betty_html('/person/%s/index.html' % person.id)
+        with open(file_path, 'w') as f:
+            f.write('Betty was here')
+        await generate(self.site)
+        with open(file_path) as f:
+            self.assertEquals('Betty was here', f.read())
+
+    @sync
+    async def test_should_regenerate_changed_resources(self):
+        person = Person('PERSON1')
+        self.site.ancestry.people[person.id] = person
+        await generate(self.site)
+        file_path = self.assert_betty_html('/person/%s/index.html' % person.id)
+        with open(file_path, 'w') as f:
+            f.write('Betty was here')
+        person.names.append(PersonName('Jane'))
+        await generate(self.site)
+        with open(self.assert_betty_html('/person/%s/index.html' % person.id)) as f:
+            self.assertIn('Jane', f.read())
+
+    @sync
+    async def test_should_regenerate_resources_with_changed_references(self):
+        person = Person('PERSON1')
+        parent = Person('PERSON2')
+        person.parents.append(parent)
+        self.site.ancestry.people[person.id] = person
+        self.site.ancestry.people[parent.id] = parent
+        await generate(self.site)
+        file_path = self.assert_betty_html('/person/%s/index.html' % person.id)
+        with open(file_path, 'w') as f:
+            f.write('Betty was here')
+        parent.names.append(PersonName('Jane'))
+        await generate(self.site)
+        with open(self.assert_betty_html('/person/%s/index.html' % person.id)) as f:
+            self.assertIn('Jane', f.read())
+
+    @sync
+    async def test_should_remove_removed_resources(self):
+        person = Person('PERSON1')
+        self.site.ancestry.people[person.id] = person
+        await generate(self.site)
+        self.assert_betty_html('/person/%s/index.html' % person.id)
+        del self.site.ancestry.people[person.id]
+        await generate(self.site)
+        self.assertFalse(exists(join(self.site.configuration.www_directory_path, 'person', person.id)))
+
+
+class ParallelTest(GenerateTestCase):
+    def setUp(self):
+        GenerateTestCase.setUp(self)
+        configuration = Configuration(
+            self._outputDirectory.name, 'https://ancestry.example.com')
+        configuration.processes = 2
+        configuration.locales.clear()
+        configuration.locales['en-US'] = LocaleConfiguration('en-US', 'en')
+        configuration.locales['nl-NL'] = LocaleConfiguration('nl-NL', 'nl')
+        self.site = Site(configuration)
+
+    @sync
+    async def test(self):
+        people = [Person('PERSON%d' % i) for i in range(0, 20)]
+        for person in people:
+            person.names.append(PersonName('Jane'))
+            self.site.ancestry.people[person.id] = person
+        place = Place('PLACE1', [PlaceName('one')])
+        self.site.ancestry.places[place.id] = place
+        await generate(self.site)
+        for locale_alias in ('en', 'nl'):
+            for person in people:
+                self.assert_betty_html('/%s/person/%s/index.html' % (locale_alias, person.id))
+                self.assert_betty_json('/%s/person/%s/index.json' % (locale_alias, person.id), 'person')
+            self.assert_betty_html('/%s/place/%s/index.html' % (locale_alias, place.id))
+            self.assert_betty_json('/%s/place/%s/index.json' % (locale_alias, place.id), 'place')
+
+
 class ResourceOverrideTest(GenerateTestCase):
     @sync
     async def test(self):
@@ -192,19 +288,120 @@ class ResourceOverrideTest(GenerateTestCase):
                     self.assertIn('Betty was here', f.read())
 
 
-class SitemapRenderTest(GenerateTestCase):
+class PermissionsTest(GenerateTestCase):
     def setUp(self):
         GenerateTestCase.setUp(self)
         configuration = Configuration(
             self._outputDirectory.name, 'https://ancestry.example.com')
         self.site = Site(configuration)
+        self._umask = os.umask(0o077)
+
+    def tearDown(self):
+        os.umask(self._umask)
+        GenerateTestCase.tearDown(self)
+
+    def _write_foreign_file(self) -> str:
+        foreign_directory_path = join(self.site.configuration.www_directory_path, 'foreign')
+        makedirs(foreign_directory_path)
+        os.chmod(foreign_directory_path, 0o700)
+        foreign_file_path = join(foreign_directory_path, 'index.html')
+        with open(foreign_file_path, 'w') as f:
+            f.write('Betty was not here')
+        os.chmod(foreign_file_path, 0o600)
+        return foreign_file_path
+
+    def assert_readable(self) -> None:
+        for directory_path, subdirectory_names, file_names in os.walk(self.site.configuration.www_directory_path):
+            self.assertEquals(0o755, stat.S_IMODE(os.stat(directory_path).st_mode), directory_path)
+            for file_name in file_names:
+                file_path = join(directory_path, file_name)
+                self.assertEquals(0o644, stat.S_IMODE(os.stat(file_path).st_mode), file_path)
 
     @sync
-    async def test_validate(self):
+    async def test_should_create_readable_files(self):
+        self.site.ancestry.people['PERSON1'] = Person('PERSON1')
         await generate(self.site)
-        with open(path.join(path.dirname(__file__), 'test_generate_assets', 'sitemap.xsd')) as f:
+        self.assert_readable()
+        # The previous mask is restored.
+        self.assertEquals(0o077, os.umask(0o077))
+
+    @sync
+    async def test_should_publish_readable_files(self):
+        with TemporaryDirectory() as source_directory_path:
+            source_file_path = join(source_directory_path, 'F1.txt')
+            with open(source_file_path, 'w') as f:
+                f.write('Betty was here')
+            os.chmod(source_file_path, 0o600)
+            self.site.ancestry.files['F1'] = File('F1', source_file_path)
+            await generate(self.site)
+            self.assert_readable()
+            with open(join(self.site.configuration.www_directory_path, 'file', 'F1.txt')) as f:
+                self.assertEquals('Betty was here', f.read())
+            # The original is left alone.
+            self.assertEquals(0o600, stat.S_IMODE(os.stat(source_file_path).st_mode))
+
+    @sync
+    async def test_should_not_normalize_foreign_files(self):
+        foreign_file_path = self._write_foreign_file()
+        await generate(self.site)
+        self.assertEquals(0o600, stat.S_IMODE(os.stat(foreign_file_path).st_mode))
+
+    @sync
+    async def test_should_normalize_foreign_files(self):
+        self.site.configuration.normalize_permissions = True
+        self._write_foreign_file()
+        await generate(self.site)
+        self.assert_readable()
+
+
+class WriterTest(TestCase):
+    def test_write(self):
+        with TemporaryDirectory() as directory_path:
+            sut = _Writer()
+            sut.makedirs([join(directory_path, 'person'), join(directory_path, 'person', 'PERSON1')])
+            sut.write(join(directory_path, 'person', 'PERSON1', 'index.html'), 'Betty was here')
+            sut.close()
+            with open(join(directory_path, 'person', 'PERSON1', 'index.html')) as f:
+                self.assertEquals('Betty was here', f.read())
+
+    def test_write_should_overwrite(self):
+        with TemporaryDirectory() as directory_path:
+            file_path = join(directory_path, 'index.html')
+            with open(file_path, 'w') as f:
+                f.write('Betty was here, and then some')
+            sut = _Writer()
+            sut.write(file_path, 'Betty was here')
+            sut.close()
+            with open(file_path) as f:
+                self.assertEquals('Betty was here', f.read())
+
+    def test_close_should_raise_write_errors(self):
+        with TemporaryDirectory() as directory_path:
+            sut = _Writer()
+            sut.write(join(directory_path, 'person', 'index.html'), 'Betty was here')
+            with self.assertRaises(FileNotFoundError):
+                sut.close()
+
+
+class SitemapRenderTest(GenerateTestCase):
+    def setUp(self):
+        GenerateTestCase.setUp(self)
+        configuration = Configuration(
+            self._outputDirectory.name, 'https://ancestry.example.com')
+        self.site = Site(configuration)
+
+    def _assert_valid(self, schema_file_name: str, file_path: str) -> None:
+        with open(path.join(path.dirname(__file__), 'test_generate_assets', schema_file_name)) as f:
             schema_doc = etree.parse(f)
         schema = etree.XMLSchema(schema_doc)
-        with open(path.join(self.site.configuration.www_directory_path, 'sitemap.xml')) as f:
+        with open(file_path) as f:
             sitemap_doc = etree.parse(f)
-        schema.validate(sitemap_doc)
+        schema.assertValid(sitemap_doc)
+
+    @sync
+    async def test_validate(self):
+        person = Person('PERSON1')
+        self.site.ancestry.people[person.id] = person
+        await generate(self.site)
+        self._assert_valid('siteindex.xsd', path.join(self.site.configuration.www_directory_path, 'sitemap.xml'))
+        self._assert_valid('sitemap.xsd', path.join(self.site.configuration.www_directory_path, 'sitemap-0.xml'))
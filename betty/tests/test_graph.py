@@ -56,3 +56,31 @@ class TSortTest(TestCase):
         }
         with self.assertRaises(CyclicGraphError):
             tsort(graph)
+
+    def test_with_cyclic_edges_should_name_cycle(self):
+        graph = {
+            0: {1},
+            1: {2},
+            2: {3},
+            3: {1, 4},
+        }
+        with self.assertRaises(CyclicGraphError) as caught:
+            tsort(graph)
+        self.assertEquals([1, 2, 3], caught.exception.vertices)
+        self.assertEquals('The graph contains a cycle: 1 -> 2 -> 3 -> 1.', str(caught.exception))
+
+    def test_with_self_loop(self):
+        graph = {
+            1: {1},
+        }
+        with self.assertRaises(CyclicGraphError) as caught:
+            tsort(graph)
+        self.assertEquals([1], caught.exception.vertices)
+
+    def test_should_sort_independent_vertices_in_order_of_appearance(self):
+        graph = {
+            'c': {'a'},
+            'b': set(),
+            'd': {'a'},
+        }
+        self.assertEquals(['c', 'b', 'd', 'a'], tsort(graph))
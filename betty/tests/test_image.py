@@ -0,0 +1,143 @@
+import os
+from os.path import join, exists
+from tempfile import TemporaryDirectory
+from time import time
+from typing import List
+
+from betty.image import ImageCache, ImageBatch, is_format_supported
+from betty.tests import TestCase
+
+
+class ImageCacheTest(TestCase):
+    def setUp(self) -> None:
+        self._directory = TemporaryDirectory()
+        self._cache_directory_path = join(self._directory.name, 'cache')
+        self._www_directory_path = join(self._directory.name, 'www')
+        self._derived = []
+        self._caches = []
+
+    def tearDown(self) -> None:
+        for cache in self._caches:
+            cache.close()
+        self._directory.cleanup()
+
+    def _new_cache(self, *args, **kwargs) -> ImageCache:
+        cache = ImageCache(self._cache_directory_path, *args, **kwargs)
+        self._caches.append(cache)
+        return cache
+
+    def _write_source(self, name: str, contents: bytes) -> str:
+        source_file_path = join(self._directory.name, name)
+        with open(source_file_path, 'wb') as f:
+            f.write(contents)
+        return source_file_path
+
+    def _derive(self, contents: bytes):
+        def _derive(derivative_file_path: str) -> None:
+            self._derived.append(contents)
+            with open(derivative_file_path, 'wb') as f:
+                f.write(contents)
+        return _derive
+
+    def _publish(self, cache: ImageCache, source_file_path: str, transformation: str, contents: bytes, destination_name: str) -> str:
+        destination_file_path = join(self._www_directory_path, destination_name)
+        cache.publish(source_file_path, transformation, self._derive(contents), destination_file_path)
+        return destination_file_path
+
+    def _cached_file_names(self) -> List[str]:
+        return sorted(file_name for file_name in os.listdir(self._cache_directory_path) if not file_name.startswith('index.sqlite'))
+
+    def test_publish(self):
+        cache = self._new_cache()
+        source_file_path = self._write_source('source.png', b'source')
+        destination_file_path = self._publish(cache, source_file_path, '99x-.png', b'derivative', 'F1-99x-.png')
+        with open(destination_file_path, 'rb') as f:
+            self.assertEquals(b'derivative', f.read())
+        self.assertEquals(['%s-99x-.png' % cache.hash_source(source_file_path)], self._cached_file_names())
+
+    def test_publish_should_derive_once_per_source_contents_and_transformation(self):
+        cache = self._new_cache()
+        source_file_path = self._write_source('source.png', b'source')
+        duplicate_source_file_path = self._write_source('duplicate.png', b'source')
+        self._publish(cache, source_file_path, '99x-.png', b'derivative', 'F1-99x-.png')
+        self._publish(cache, source_file_path, '99x-.png', b'derivative', 'F1-99x-.png')
+        self._publish(cache, duplicate_source_file_path, '99x-.png', b'derivative', 'F2-99x-.png')
+        self._publish(self._new_cache(), source_file_path, '99x-.png', b'derivative', 'F1-99x-.png')
+        self._publish(cache, source_file_path, '-x99.png', b'other derivative', 'F1--x99.png')
+        self.assertEquals([b'derivative', b'other derivative'], self._derived)
+        self.assertTrue(exists(join(self._www_directory_path, 'F2-99x-.png')))
+
+    def test_publish_should_derive_again_if_source_contents_change(self):
+        cache = self._new_cache()
+        source_file_path = self._write_source('source.png', b'source')
+        self._publish(cache, source_file_path, '99x-.png', b'derivative', 'F1-99x-.png')
+        self._write_source('source.png', b'changed source')
+        os.utime(source_file_path, ns=(0, 0))
+        self._publish(cache, source_file_path, '99x-.png', b'changed derivative', 'F2-99x-.png')
+        self.assertEquals([b'derivative', b'changed derivative'], self._derived)
+
+    def test_publish_should_evict_least_recently_used_derivatives(self):
+        cache = self._new_cache(size=20)
+        source_file_path = self._write_source('source.png', b'source')
+        self._publish(cache, source_file_path, '1x-.png', b'0123456789', 'F1-1x-.png')
+        self._publish(cache, source_file_path, '2x-.png', b'0123456789', 'F1-2x-.png')
+        # Use the first derivative again, so the second one becomes the least recently used.
+        self._publish(cache, source_file_path, '1x-.png', b'0123456789', 'F1-1x-.png')
+        destination_file_path = self._publish(cache, source_file_path, '3x-.png', b'0123456789', 'F1-3x-.png')
+        source_hash = cache.hash_source(source_file_path)
+        self.assertEquals(['%s-1x-.png' % source_hash, '%s-3x-.png' % source_hash], self._cached_file_names())
+        # Evicted derivatives remain published.
+        self.assertTrue(exists(join(self._www_directory_path, 'F1-2x-.png')))
+        self.assertTrue(exists(destination_file_path))
+
+    def test_prune_by_size(self):
+        cache = self._new_cache()
+        source_file_path = self._write_source('source.png', b'source')
+        self._publish(cache, source_file_path, '1x-.png', b'0123456789', 'F1-1x-.png')
+        self._publish(cache, source_file_path, '2x-.png', b'0123456789', 'F1-2x-.png')
+        self.assertEquals(1, cache.prune(size=15))
+        self.assertEquals(['%s-2x-.png' % cache.hash_source(source_file_path)], self._cached_file_names())
+
+    def test_prune_by_last_use(self):
+        cache = self._new_cache()
+        source_file_path = self._write_source('source.png', b'source')
+        self._publish(cache, source_file_path, '1x-.png', b'0123456789', 'F1-1x-.png')
+        self.assertEquals(0, cache.prune(unused_since=time() - 60))
+        self.assertEquals(1, cache.prune(unused_since=time() + 60))
+        self.assertEquals([], self._cached_file_names())
+
+
+class ImageBatchTest(TestCase):
+    def test_submit(self):
+        submitted = []
+
+        class _Executor:
+            def submit(self, *args):
+                submitted.append(args)
+
+        def _job(*args):
+            pass  # pragma: no cover
+
+        batch = ImageBatch()
+        batch.add(_job, ('source-1.png',), '1x-.png')
+        batch.add(_job, ('source-2.png',), '1x-.png')
+        batch.add(_job, ('source-1.png',), '2x-.png')
+        self.assertEquals(3, len(batch))
+        batch.submit(_Executor())
+        self.assertEquals([
+            (_job, 'source-1.png', ['1x-.png', '2x-.png']),
+            (_job, 'source-2.png', ['1x-.png']),
+        ], submitted)
+        # Derivatives are submitted only once.
+        self.assertEquals(0, len(batch))
+        batch.submit(_Executor())
+        self.assertEquals(2, len(submitted))
+
+
+class IsFormatSupportedTest(TestCase):
+    def test_with_supported_format(self):
+        # Pillow has supported WebP for as long as Betty has existed.
+        self.assertTrue(is_format_supported('webp'))
+
+    def test_with_unsupported_format(self):
+        self.assertFalse(is_format_supported('betty'))
@@ -1,15 +1,19 @@
-from os import makedirs, path
+from os import makedirs, path, listdir, remove
 from tempfile import TemporaryDirectory
 from typing import List, Dict, Optional, Iterable, Type
 from unittest import TestCase
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
+
+from PIL import Image
+from jinja2 import Environment, DictLoader
 
 from parameterized import parameterized
 
-from betty.ancestry import File, PlaceName, Subject, Attendee, Witness, Dated, Resource, Person, Place, Citation
+from betty.ancestry import File, PlaceName, Subject, Attendee, Witness, Dated, Resource, Person, Place, Citation, \
+    IdentifiableEvent, Birth, Death, Burial, Residence
 from betty.config import Configuration, LocaleConfiguration
 from betty.asyncio import sync
-from betty.jinja2 import Jinja2Renderer, _Citer, Jinja2Provider
+from betty.jinja2 import Jinja2Renderer, _Citer, Jinja2Provider, _BytecodeCache, _draft_image
 from betty.locale import Date, Datey, DateRange, Localized
 from betty.media_type import MediaType
 from betty.plugin import Plugin
@@ -80,6 +84,56 @@ class Jinja2RendererTest(TestCase):
                     self.assertFalse(path.exists(scss_file_path))
 
 
+class BytecodeCacheTest(TestCase):
+    def test_should_load_code_from_disk(self) -> None:
+        loader = DictLoader({
+            'index.txt.j2': '{% if true %}true{% endif %}',
+        })
+        with TemporaryDirectory() as cache_directory_path:
+            Environment(loader=loader, bytecode_cache=_BytecodeCache(cache_directory_path)).get_template('index.txt.j2')
+            with patch.object(Environment, 'compile') as m_compile:
+                template = Environment(loader=loader, bytecode_cache=_BytecodeCache(cache_directory_path)).get_template('index.txt.j2')
+        m_compile.assert_not_called()
+        self.assertEquals('true', template.render())
+
+    def test_should_load_code_from_memory(self) -> None:
+        loader = DictLoader({
+            'index.txt.j2': '{% if true %}true{% endif %}',
+        })
+        with TemporaryDirectory() as cache_directory_path:
+            sut = _BytecodeCache(cache_directory_path)
+            Environment(loader=loader, bytecode_cache=sut).get_template('index.txt.j2')
+            for file_name in listdir(cache_directory_path):
+                remove(path.join(cache_directory_path, file_name))
+            with patch.object(Environment, 'compile') as m_compile:
+                template = Environment(loader=loader, bytecode_cache=sut).get_template('index.txt.j2')
+        m_compile.assert_not_called()
+        self.assertEquals('true', template.render())
+
+    def test_should_compile_changed_templates(self) -> None:
+        with TemporaryDirectory() as cache_directory_path:
+            sut = _BytecodeCache(cache_directory_path)
+            Environment(loader=DictLoader({
+                'index.txt.j2': '{% if true %}true{% endif %}',
+            }), bytecode_cache=sut).get_template('index.txt.j2')
+            template = Environment(loader=DictLoader({
+                'index.txt.j2': '{% if false %}true{% else %}false{% endif %}',
+            }), bytecode_cache=sut).get_template('index.txt.j2')
+        self.assertEquals('false', template.render())
+
+    def test_should_compile_templates_with_invalid_code(self) -> None:
+        loader = DictLoader({
+            'index.txt.j2': '{% if true %}true{% endif %}',
+        })
+        with TemporaryDirectory() as cache_directory_path:
+            Environment(loader=loader, bytecode_cache=_BytecodeCache(cache_directory_path)).get_template('index.txt.j2')
+            for file_name in listdir(cache_directory_path):
+                with open(path.join(cache_directory_path, file_name), 'r+b') as f:
+                    f.truncate(16)
+            template = Environment(loader=loader, bytecode_cache=_BytecodeCache(cache_directory_path)).get_template('index.txt.j2')
+        self.assertEquals('true', template.render())
+
+
 class FilterFlattenTest(TemplateTestCase):
     @parameterized.expand([
         ('', '{{ [] | flatten | join(", ") }}'),
@@ -186,6 +240,8 @@ class FilterImageTest(TemplateTestCase):
          '{{ file | image(width=99, height=99) }}', File('F1', image_path, media_type=MediaType('image/png'))),
         ('/file/F1-99x99.png:/file/F1-99x99.png',
          '{{ file | image(width=99, height=99) }}:{{ file | image(width=99, height=99) }}', File('F1', image_path, media_type=MediaType('image/png'))),
+        ('/file/F1-99x-.webp',
+         '{{ file | image(width=99, format="webp") }}', File('F1', image_path, media_type=MediaType('image/png'))),
     ])
     @sync
     async def test(self, expected, template, file):
@@ -206,6 +262,58 @@ class FilterImageTest(TemplateTestCase):
                 pass
 
 
+class FilterImageSourcesTest(TemplateTestCase):
+    image_path = path.join(path.dirname(path.dirname(__file__)), 'assets', 'public', 'static', 'betty-512x512.png')
+
+    @sync
+    async def test(self):
+        file = File('F1', self.image_path, media_type=MediaType('image/png'))
+        template = '{% set image_sources = file | image_sources([198, 99], 2) %}{{ image_sources.src }}|{{ image_sources.srcset }}{% for source in image_sources.sources %}|{{ source.type }}:{{ source.srcset }}{% endfor %}'
+
+        def _update_configuration(configuration: Configuration) -> None:
+            configuration.image_formats = ['webp']
+        async with self._render(template_string=template, data={
+            'file': file,
+        }, update_configuration=_update_configuration) as (actual, site):
+            self.assertEquals('/file/F1-198x99.png|/file/F1-99x50.png 99w, /file/F1-198x99.png 198w|image/webp:/file/F1-99x50.webp 99w, /file/F1-198x99.webp 198w', actual)
+            for file_name in ['F1-99x50.png', 'F1-198x99.png', 'F1-99x50.webp', 'F1-198x99.webp']:
+                self.assertTrue(path.exists(path.join(site.configuration.www_directory_path, 'file', file_name)))
+
+    @sync
+    async def test_without_widths(self):
+        file = File('F1', self.image_path, media_type=MediaType('image/png'))
+        with self.assertRaises(ValueError):
+            async with self._render(template_string='{{ file | image_sources([]) }}', data={
+                'file': file,
+            }):
+                pass
+
+
+class DraftImageTest(TestCase):
+    @parameterized.expand([
+        ((200, 150), [(100, None)]),
+        ((200, 150), [(None, 75)]),
+        ((400, 300), [(100, 100)]),
+        ((400, 300), [(100, None), (150, 150)]),
+        ((800, 600), [(300, None)]),
+    ])
+    def test(self, expected, sizes):
+        with TemporaryDirectory() as working_directory_path:
+            image_path = path.join(working_directory_path, 'image.jpg')
+            Image.new('RGB', (800, 600)).save(image_path)
+            with Image.open(image_path) as image:
+                _draft_image(image, sizes)
+                self.assertEquals(expected, image.size)
+
+    def test_without_jpeg(self):
+        with TemporaryDirectory() as working_directory_path:
+            image_path = path.join(working_directory_path, 'image.png')
+            Image.new('RGB', (800, 600)).save(image_path)
+            with Image.open(image_path) as image:
+                _draft_image(image, [(100, None)])
+                self.assertEquals((800, 600), image.size)
+
+
 class TestPlugin(Plugin):
     """
     This class must be top-level. Otherwise it cannot be imported by its fully qualified name.
@@ -336,6 +444,22 @@ class FilterSortLocalizedsTest(TemplateTestCase):
             self.assertEquals('[]', actual)
 
 
+class FilterSortEventsTest(TemplateTestCase):
+    @sync
+    async def test(self):
+        template = '{{ data | sort_events | map(attribute="id") | join(", ") }}'
+        data = [
+            IdentifiableEvent('E4', Burial(), Date(1971, 1, 1)),
+            IdentifiableEvent('E3', Death(), Date(1970, 1, 1)),
+            IdentifiableEvent('E2', Residence(), Date(1970, 1, 1)),
+            IdentifiableEvent('E1', Birth(), Date(1970, 1, 1)),
+        ]
+        async with self._render(template_string=template, data={
+            'data': data,
+        }) as (actual, _):
+            self.assertEquals('E1, E2, E3, E4', actual)
+
+
 class FilterSelectLocalizedsTest(TemplateTestCase):
     @parameterized.expand([
         ('', 'en', []),
@@ -1,13 +1,15 @@
 import json as stdjson
-from tempfile import TemporaryDirectory, NamedTemporaryFile
+from typing import Type, Dict, Any
+from tempfile import TemporaryDirectory, NamedTemporaryFile, TemporaryFile
 
 from geopy import Point
+from parameterized import parameterized
 
 from betty import json
 from betty.ancestry import Place, Person, PlaceName, Link, Presence, Source, File, Note, PersonName, \
     IdentifiableEvent, IdentifiableSource, IdentifiableCitation, Subject, Birth, Enclosure
 from betty.config import Configuration, LocaleConfiguration
-from betty.json import JSONEncoder
+from betty.json import JSONEncoder, StdlibJSONBackend, OrjsonJSONBackend, orjson, JSONBackend
 from betty.locale import Date, DateRange
 from betty.media_type import MediaType
 from betty.site import Site
@@ -15,16 +17,26 @@ from betty.tests import TestCase
 
 
 class JSONEncoderTest(TestCase):
+    def _new_site(self, output_directory: str) -> Site:
+        configuration = Configuration(
+            output_directory, '')
+        configuration.locales.clear()
+        configuration.locales['en-US'] = LocaleConfiguration('en-US', 'en')
+        configuration.locales['nl-NL'] = LocaleConfiguration('nl-NL', 'nl')
+        return Site(configuration)
+
     def assert_encodes(self, expected, data, schema_definition: str):
         with TemporaryDirectory() as output_directory:
-            configuration = Configuration(
-                output_directory, '')
-            configuration.locales.clear()
-            configuration.locales['en-US'] = LocaleConfiguration('en-US', 'en')
-            configuration.locales['nl-NL'] = LocaleConfiguration('nl-NL', 'nl')
-            site = Site(configuration)
-            encoded_data = stdjson.loads(stdjson.dumps(data, cls=JSONEncoder.get_factory(
-                site, configuration.default_locale)))
+            site = self._new_site(output_directory)
+            configuration = site.configuration
+            encoded = JSONEncoder(site, configuration.default_locale, backend=StdlibJSONBackend()).encode(data)
+            # All backends must produce identical output.
+            if orjson is not None:
+                self.assertEquals(encoded, JSONEncoder(
+                    site, configuration.default_locale, backend=OrjsonJSONBackend()).encode(data))
+            self.assertEquals(stdjson.dumps(data, cls=JSONEncoder.get_factory(site, configuration.default_locale)),
+                              stdjson.dumps(stdjson.loads(encoded)))
+            encoded_data = stdjson.loads(encoded)
             json.validate(encoded_data, schema_definition, site)
             self.assertEquals(expected, encoded_data)
 
@@ -622,3 +634,56 @@ class JSONEncoderTest(TestCase):
             'mediaType': 'text/html',
         }
         self.assert_encodes(expected, link, 'link')
+
+    def test_subclass_should_encode(self) -> None:
+        class _Link(Link):
+            pass
+        link = _Link('https://example.com')
+        expected = {
+            'url': 'https://example.com',
+        }
+        self.assert_encodes(expected, link, 'link')
+
+    @parameterized.expand([
+        (StdlibJSONBackend,),
+        (OrjsonJSONBackend,),
+    ])
+    def test_unknown_value_should_not_encode(self, backend_type: Type[JSONBackend]) -> None:
+        if backend_type is OrjsonJSONBackend and orjson is None:
+            self.skipTest('orjson is not installed.')
+        with TemporaryDirectory() as output_directory:
+            sut = JSONEncoder(self._new_site(output_directory), 'en-US', backend=backend_type())
+            with self.assertRaisesRegex(TypeError, 'object is not JSON serializable'):
+                sut.encode(object())
+
+    @parameterized.expand([
+        ('{"name":"Ｊａｎｅ","id":18446744073709551616}', {}),
+        ('{\n  "name": "\\uff2a\\uff41\\uff4e\\uff45",\n  "id": 18446744073709551616\n}', {
+            'indent': 2,
+            'ensure_ascii': True,
+        }),
+    ])
+    def test_encode_should_fall_back_to_stdlib(self, expected: str, options: Dict[str, Any]) -> None:
+        if orjson is None:
+            self.skipTest('orjson is not installed.')
+        with TemporaryDirectory() as output_directory:
+            sut = JSONEncoder(self._new_site(output_directory), 'en-US', backend=OrjsonJSONBackend(), **options)
+            self.assertEquals(expected, sut.encode({
+                'name': 'Ｊａｎｅ',
+                'id': 2 ** 64,
+            }))
+
+    @parameterized.expand([
+        (StdlibJSONBackend,),
+        (OrjsonJSONBackend,),
+    ])
+    def test_dump_should_reuse_encoder(self, backend_type: Type[JSONBackend]) -> None:
+        if backend_type is OrjsonJSONBackend and orjson is None:
+            self.skipTest('orjson is not installed.')
+        with TemporaryDirectory() as output_directory:
+            sut = JSONEncoder(self._new_site(output_directory), 'en-US', backend=backend_type())
+            for _ in range(2):
+                with TemporaryFile('w+') as f:
+                    sut.dump([Link('https://example.com'), MediaType('text/html')], f)
+                    f.seek(0)
+                    self.assertEquals([{'url': 'https://example.com'}, 'text/html'], stdjson.load(f))
@@ -0,0 +1,84 @@
+from os.path import join
+from tempfile import TemporaryDirectory
+
+from betty.ancestry import Person, PersonName, Presence, IdentifiableEvent, Birth, Subject, Place, PlaceName, Link
+from betty.manifest import Manifest, Fingerprinter
+from betty.tests import TestCase
+
+
+class ManifestTest(TestCase):
+    def test_load_without_file(self):
+        with TemporaryDirectory() as directory_path:
+            sut = Manifest.load(join(directory_path, 'manifest.json'))
+        self.assertEquals({}, sut.get('en-US', 'person'))
+
+    def test_load_with_invalid_file(self):
+        with TemporaryDirectory() as directory_path:
+            file_path = join(directory_path, 'manifest.json')
+            with open(file_path, 'w') as f:
+                f.write('{')
+            sut = Manifest.load(file_path)
+        self.assertEquals({}, sut.get('en-US', 'person'))
+
+    def test_save_and_load(self):
+        fingerprints = {
+            'P1': 'abc',
+        }
+        with TemporaryDirectory() as directory_path:
+            file_path = join(directory_path, 'manifest.json')
+            manifest = Manifest()
+            manifest.set('en-US', 'person', fingerprints)
+            manifest.save(file_path)
+            sut = Manifest.load(file_path)
+        self.assertEquals(fingerprints, sut.get('en-US', 'person'))
+        self.assertEquals({}, sut.get('nl-NL', 'person'))
+
+
+class FingerprinterTest(TestCase):
+    def test_fingerprint_should_be_stable(self):
+        person = Person('P1')
+        person.names.append(PersonName('Jane'))
+        self.assertEquals(Fingerprinter('site').fingerprint(person), Fingerprinter('site').fingerprint(person))
+
+    def test_fingerprint_should_not_change_with_unused_associations(self):
+        person = Person('P1')
+        before = Fingerprinter('site').fingerprint(person)
+        list(person.parents)
+        list(person.presences)
+        self.assertEquals(before, Fingerprinter('site').fingerprint(person))
+
+    def test_fingerprint_should_change_with_site(self):
+        person = Person('P1')
+        self.assertNotEquals(Fingerprinter('site').fingerprint(person), Fingerprinter('another-site').fingerprint(person))
+
+    def test_fingerprint_should_change_with_state(self):
+        person = Person('P1')
+        before = Fingerprinter('site').fingerprint(person)
+        person.private = True
+        self.assertNotEquals(before, Fingerprinter('site').fingerprint(person))
+
+    def test_fingerprint_should_change_with_set_state(self):
+        place = Place('P1', [PlaceName('The Place')])
+        link = Link('https://example.com')
+        place.links.add(link)
+        before = Fingerprinter('site').fingerprint(place)
+        link.label = 'The Place'
+        self.assertNotEquals(before, Fingerprinter('site').fingerprint(place))
+
+    def test_fingerprint_should_change_with_reference_state(self):
+        person = Person('P1')
+        parent = Person('P2')
+        person.parents.append(parent)
+        before = Fingerprinter('site').fingerprint(person)
+        parent.names.append(PersonName('Jane'))
+        self.assertNotEquals(before, Fingerprinter('site').fingerprint(person))
+
+    def test_fingerprint_should_change_with_indirect_reference_state(self):
+        person = Person('P1')
+        event = IdentifiableEvent('E1', Birth())
+        place = Place('P1', [PlaceName('The Place')])
+        event.place = place
+        Presence(person, Subject(), event)
+        before = Fingerprinter('site').fingerprint(person)
+        place.names.append(PlaceName('The Other Place'))
+        self.assertNotEquals(before, Fingerprinter('site').fingerprint(person))
@@ -0,0 +1,103 @@
+from os.path import join
+from tempfile import TemporaryDirectory
+from typing import Dict
+
+from voluptuous import Schema, Required
+
+from betty.ancestry import Person, PersonName
+from betty.asyncio import sync
+from betty.config import Configuration
+from betty.parse import parse, Parser
+from betty.plugin import Plugin
+from betty.site import Site
+from betty.tests import TestCase
+
+
+class PeopleParser(Plugin, Parser):
+    configuration_schema: Schema = Schema({
+        Required('file'): str,
+    })
+
+    parses = 0
+
+    def __init__(self, site: Site, file_path: str):
+        self._site = site
+        self._file_path = file_path
+
+    @classmethod
+    def for_site(cls, site: Site, configuration: Dict):
+        return cls(site, configuration['file'])
+
+    async def parse(self) -> None:
+        PeopleParser.parses += 1
+        with open(self._file_path) as f:
+            for person_id in f.read().split():
+                person = Person(person_id)
+                person.names.append(PersonName(person_id))
+                self._site.ancestry.people[person_id] = person
+
+
+class ParseTest(TestCase):
+    def setUp(self) -> None:
+        PeopleParser.parses = 0
+        self._output_directory = TemporaryDirectory()
+        self._cache_directory = TemporaryDirectory()
+        self._people_file_path = join(self._cache_directory.name, 'people.txt')
+
+    def tearDown(self) -> None:
+        self._output_directory.cleanup()
+        self._cache_directory.cleanup()
+
+    def _write_people(self, *person_ids: str) -> None:
+        with open(self._people_file_path, 'w') as f:
+            f.write(' '.join(person_ids))
+
+    def _configuration(self, snapshot: bool = True) -> Configuration:
+        configuration = Configuration(self._output_directory.name, 'https://example.com')
+        configuration.cache_directory_path = self._cache_directory.name
+        configuration.snapshot = snapshot
+        configuration.plugins[PeopleParser] = {
+            'file': self._people_file_path,
+        }
+        return configuration
+
+    async def _parse(self, configuration: Configuration) -> Site:
+        async with Site(configuration) as site:
+            await parse(site)
+        return site
+
+    @sync
+    async def test_parse_should_load_snapshot(self):
+        self._write_people('P1', 'P2')
+        await self._parse(self._configuration())
+        site = await self._parse(self._configuration())
+        self.assertEquals(1, PeopleParser.parses)
+        self.assertEquals(['P1', 'P2'], list(site.ancestry.people.keys()))
+        self.assertEquals('P1', site.ancestry.people['P1'].names[0].individual)
+        self.assertIs(site.ancestry.people['P1'], site.ancestry.people['P1'].names[0].person)
+
+    @sync
+    async def test_parse_should_not_load_snapshot_if_source_file_changed(self):
+        self._write_people('P1', 'P2')
+        await self._parse(self._configuration())
+        self._write_people('P3')
+        site = await self._parse(self._configuration())
+        self.assertEquals(2, PeopleParser.parses)
+        self.assertEquals(['P3'], list(site.ancestry.people.keys()))
+
+    @sync
+    async def test_parse_should_not_load_snapshot_into_populated_ancestry(self):
+        self._write_people('P1')
+        await self._parse(self._configuration())
+        async with Site(self._configuration()) as site:
+            site.ancestry.people['P2'] = Person('P2')
+            await parse(site)
+        self.assertEquals(2, PeopleParser.parses)
+        self.assertCountEqual(['P1', 'P2'], list(site.ancestry.people.keys()))
+
+    @sync
+    async def test_parse_without_snapshot(self):
+        self._write_people('P1')
+        await self._parse(self._configuration(False))
+        await self._parse(self._configuration(False))
+        self.assertEquals(2, PeopleParser.parses)
@@ -1,3 +1,8 @@
+import asyncio
+import gzip
+import json
+from os import listdir
+from os.path import join
 from tempfile import TemporaryDirectory
 
 from parameterized import parameterized
@@ -5,7 +10,7 @@ from parameterized import parameterized
 from betty.ancestry import Person, Place, PlaceName, PersonName, File
 from betty.config import Configuration, LocaleConfiguration
 from betty.asyncio import sync
-from betty.search import Index
+from betty.search import Index, tokenize, _build_trie
 from betty.site import Site
 from betty.tests import TestCase
 
@@ -186,3 +191,130 @@ class IndexTest(TestCase):
 
         self.assertEquals('"file" is dutch for "traffic jam"', indexed[0]['text'])
         self.assertIn(expected, indexed[0]['result'])
+
+    @sync
+    async def test_write(self):
+        jane = Person('P1')
+        jane.names.append(PersonName('Jane', 'Doe'))
+        janet = Person('P2')
+        janet.names.append(PersonName('Janet', 'Doughnut'))
+        place = Place('P3', [PlaceName('Amsterdam')])
+
+        with TemporaryDirectory() as output_directory_path:
+            configuration = Configuration(
+                output_directory_path, 'https://example.com')
+            async with Site(configuration) as site:
+                site.ancestry.people[jane.id] = jane
+                site.ancestry.people[janet.id] = janet
+                site.ancestry.places[place.id] = place
+                index_directory_path = join(output_directory_path, 'search')
+                await Index(site).write(index_directory_path)
+
+            with open(join(index_directory_path, 'index.json')) as f:
+                index = json.load(f)
+            self.assertEquals(2, index['prefixLength'])
+            self.assertIn('<!-- betty-search-result -->', index['resultContainerTemplate'])
+            self.assertIn('<!-- betty-search-results -->', index['resultsContainerTemplate'])
+            self.assertEquals({'am': 0, 'do': 1, 'ja': 2}, index['shards'])
+            with open(join(index_directory_path, 'shard', '1.json')) as f:
+                self.assertEquals({
+                    'e': {'': [1]},
+                    'ughnut': {'': [2]},
+                }, json.load(f))
+            with open(join(index_directory_path, 'shard', '2.json')) as f:
+                self.assertEquals({
+                    'ne': {
+                        '': [1],
+                        't': {'': [2]},
+                    },
+                }, json.load(f))
+            with open(join(index_directory_path, 'result', '0.json')) as f:
+                results = json.load(f)
+            self.assertEquals(3, len(results))
+            self.assertIn('/place/P3/index.html', results[0])
+            self.assertIn('/person/P1/index.html', results[1])
+            self.assertIn('/person/P2/index.html', results[2])
+            for file_name in listdir(join(index_directory_path, 'shard')):
+                if file_name.endswith('.json'):
+                    file_path = join(index_directory_path, 'shard', file_name)
+                    with open(file_path, 'rb') as f, gzip.open('%s.gz' % file_path) as gzip_f:
+                        self.assertEquals(f.read(), gzip_f.read())
+
+    @sync
+    async def test_write_should_remove_previous_index(self):
+        with TemporaryDirectory() as output_directory_path:
+            configuration = Configuration(
+                output_directory_path, 'https://example.com')
+            async with Site(configuration) as site:
+                index_directory_path = join(output_directory_path, 'search')
+                site.ancestry.places['P1'] = Place('P1', [PlaceName('Amsterdam')])
+                await Index(site).write(index_directory_path)
+                del site.ancestry.places['P1']
+                await Index(site).write(index_directory_path)
+
+            self.assertEquals([], listdir(join(index_directory_path, 'shard')))
+            self.assertEquals([], listdir(join(index_directory_path, 'result')))
+
+    @sync
+    async def test_write_should_limit_concurrency(self):
+        class _TrackingIndex(Index):
+            def __init__(self, *args, **kwargs):
+                Index.__init__(self, *args, **kwargs)
+                self.rendering = 0
+                self.max_rendering = 0
+
+            async def _render_resource(self, resource):
+                self.rendering += 1
+                self.max_rendering = max(self.max_rendering, self.rendering)
+                await asyncio.sleep(0)
+                self.rendering -= 1
+                return resource.id
+
+        with TemporaryDirectory() as output_directory_path:
+            configuration = Configuration(
+                output_directory_path, 'https://example.com')
+            async with Site(configuration) as site:
+                for i in range(250):
+                    place = Place('P%03d' % i, [PlaceName('Place %03d' % i)])
+                    site.ancestry.places[place.id] = place
+                sut = _TrackingIndex(site, concurrency=3)
+                index_directory_path = join(output_directory_path, 'search')
+                await sut.write(index_directory_path)
+
+            self.assertEquals(3, sut.max_rendering)
+            results = []
+            for chunk_index in range(3):
+                with open(join(index_directory_path, 'result', '%d.json' % chunk_index)) as f:
+                    results.extend(json.load(f))
+            self.assertEquals(['P%03d' % i for i in range(250)], results)
+
+
+class TokenizeTest(TestCase):
+    @parameterized.expand([
+        ([], ''),
+        (['jane', 'doe'], 'Jane Doe'),
+        (['emile', 'zoe'], 'Émile  Zoë'),
+        (['o', 'neill', 'bergh'], "O'Neill-Bergh"),
+        (['1890'], '(1890)'),
+    ])
+    def test(self, expected, text: str):
+        self.assertEquals(expected, tokenize(text))
+
+
+class BuildTrieTest(TestCase):
+    def test(self):
+        postings = {
+            'ne': [3, 1, 8],
+            'net': [2],
+            '': [5],
+            'hn': [7],
+        }
+        expected = {
+            '': [5],
+            'hn': {'': [7]},
+            'ne': {
+                '': [1, 2, 5],
+                't': {'': [2]},
+            },
+        }
+        self.assertEquals(expected, _build_trie(postings))
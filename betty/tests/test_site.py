@@ -1,9 +1,10 @@
+import json
 from typing import List, Type, Set, Any
 
 from voluptuous import Schema, Required
 
-from betty.ancestry import Ancestry
-from betty.config import Configuration
+from betty.ancestry import Ancestry, Person
+from betty.config import Configuration, LocaleConfiguration
 from betty.asyncio import sync
 from betty.graph import CyclicGraphError
 from betty.plugin import Plugin, NO_CONFIGURATION
@@ -219,3 +220,21 @@ class SiteTest(TestCase):
         async with Site(configuration) as sut:
             self.assertEquals(2, len(sut.assets.paths))
             self.assertEquals(assets_directory_path, sut.assets.paths[0])
+
+    @sync
+    async def test_json_encoder_should_be_reused(self):
+        configuration = Configuration(**self._MINIMAL_CONFIGURATION_ARGS)
+        async with Site(configuration) as sut:
+            self.assertIs(sut.json_encoder, sut.json_encoder)
+
+    @sync
+    async def test_json_encoder_should_be_localized(self):
+        configuration = Configuration(**self._MINIMAL_CONFIGURATION_ARGS)
+        configuration.locales.clear()
+        configuration.locales['en-US'] = LocaleConfiguration('en-US', 'en')
+        configuration.locales['nl-NL'] = LocaleConfiguration('nl-NL', 'nl')
+        async with Site(configuration) as sut:
+            async with sut.with_locale('nl-NL') as localized_sut:
+                self.assertIsNot(sut.json_encoder, localized_sut.json_encoder)
+                encoded_person = json.loads(localized_sut.json_encoder.encode(Person('P1')))
+                self.assertEquals('/nl/person/P1/index.json', encoded_person['links'][0]['url'])
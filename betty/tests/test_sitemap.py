@@ -0,0 +1,95 @@
+import gzip
+from os import listdir
+from os.path import join
+from tempfile import TemporaryDirectory
+from typing import List
+
+from lxml import etree
+
+from betty.ancestry import Person, Place, PlaceName
+from betty.config import Configuration, LocaleConfiguration
+from betty.asyncio import sync
+from betty.site import Site
+from betty.sitemap import Sitemap
+from betty.tests import TestCase
+
+_NAMESPACES = {
+    'sitemap': 'http://www.sitemaps.org/schemas/sitemap/0.9',
+}
+
+
+class SitemapTest(TestCase):
+    def setUp(self) -> None:
+        self._output_directory = TemporaryDirectory()
+        self._www_directory_path = self._output_directory.name
+        configuration = Configuration(self._output_directory.name, 'https://example.com')
+        self.site = Site(configuration)
+
+    def tearDown(self) -> None:
+        self._output_directory.cleanup()
+
+    def _locs(self, file_name: str) -> List[str]:
+        with open(join(self._www_directory_path, file_name), 'rb') as f:
+            contents = f.read()
+        if file_name.endswith('.gz'):
+            contents = gzip.decompress(contents)
+        return etree.fromstring(contents).xpath('//sitemap:loc/text()', namespaces=_NAMESPACES)
+
+    def _sitemap_file_names(self) -> List[str]:
+        return sorted(file_name for file_name in listdir(self._www_directory_path) if file_name.startswith('sitemap'))
+
+    @sync
+    async def test_write_empty(self):
+        async with self.site:
+            Sitemap(self.site).write(self._www_directory_path)
+        self.assertEquals(['https://example.com/sitemap-0.xml'], self._locs('sitemap.xml'))
+        self.assertEquals([], self._locs('sitemap-0.xml'))
+
+    @sync
+    async def test_write(self):
+        self.site.configuration.locales.clear()
+        self.site.configuration.locales['en-US'] = LocaleConfiguration('en-US', 'en')
+        self.site.configuration.locales['nl-NL'] = LocaleConfiguration('nl-NL', 'nl')
+        self.site.ancestry.people['P1'] = Person('P1')
+        self.site.ancestry.places['PL1'] = Place('PL1', [PlaceName('Amsterdam')])
+        async with self.site:
+            Sitemap(self.site).write(self._www_directory_path)
+        self.assertEquals(['sitemap-0.xml', 'sitemap.xml'], self._sitemap_file_names())
+        self.assertEquals([
+            'https://example.com/en/person/P1/index.html',
+            'https://example.com/en/place/PL1/index.html',
+            'https://example.com/nl/person/P1/index.html',
+            'https://example.com/nl/place/PL1/index.html',
+        ], self._locs('sitemap-0.xml'))
+
+    @sync
+    async def test_write_should_shard(self):
+        for i in range(0, 5):
+            self.site.ancestry.people['P%d' % i] = Person('P%d' % i)
+        async with self.site:
+            Sitemap(self.site, urls_per_shard=2).write(self._www_directory_path)
+        self.assertEquals([
+            'https://example.com/sitemap-0.xml',
+            'https://example.com/sitemap-1.xml',
+            'https://example.com/sitemap-2.xml',
+        ], self._locs('sitemap.xml'))
+        self.assertEquals(2, len(self._locs('sitemap-0.xml')))
+        self.assertEquals(2, len(self._locs('sitemap-1.xml')))
+        self.assertEquals(['https://example.com/person/P4/index.html'], self._locs('sitemap-2.xml'))
+
+    @sync
+    async def test_write_should_compress(self):
+        self.site.ancestry.people['P1'] = Person('P1')
+        async with self.site:
+            Sitemap(self.site, compress=True).write(self._www_directory_path)
+        self.assertEquals(['https://example.com/sitemap-0.xml.gz'], self._locs('sitemap.xml'))
+        self.assertEquals(['https://example.com/person/P1/index.html'], self._locs('sitemap-0.xml.gz'))
+
+    @sync
+    async def test_write_should_remove_previous_shards(self):
+        for i in range(0, 3):
+            self.site.ancestry.people['P%d' % i] = Person('P%d' % i)
+        async with self.site:
+            Sitemap(self.site, urls_per_shard=1).write(self._www_directory_path)
+            Sitemap(self.site, compress=True).write(self._www_directory_path)
+        self.assertEquals(['sitemap-0.xml.gz', 'sitemap.xml'], self._sitemap_file_names())
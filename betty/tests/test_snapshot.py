@@ -0,0 +1,88 @@
+from os.path import join
+from tempfile import TemporaryDirectory
+
+from betty.ancestry import Ancestry, Person, PersonName, IdentifiableEvent, Birth, Presence, Subject, Place, \
+    PlaceName, IdentifiableSource, IdentifiableCitation, Source
+from betty.snapshot import dump, load
+from betty.tests import TestCase
+
+
+class SnapshotTest(TestCase):
+    def _ancestry(self) -> Ancestry:
+        ancestry = Ancestry()
+        person = Person('P1')
+        person.names.append(PersonName('Jane', 'Doe'))
+        parent = Person('P2')
+        person.parents.append(parent)
+        place = Place('P1', [PlaceName('The Place')])
+        event = IdentifiableEvent('E1', Birth())
+        event.place = place
+        Presence(person, Subject(), event)
+        source = IdentifiableSource('S1', 'The Source')
+        source.contained_by = Source('The Archive')
+        citation = IdentifiableCitation('C1', source)
+        person.citations.append(citation)
+        ancestry.people[person.id] = person
+        ancestry.people[parent.id] = parent
+        ancestry.places[place.id] = place
+        ancestry.events[event.id] = event
+        ancestry.sources[source.id] = source
+        ancestry.citations[citation.id] = citation
+        return ancestry
+
+    def test_load_without_file(self):
+        ancestry = Ancestry()
+        with TemporaryDirectory() as directory_path:
+            self.assertFalse(load(ancestry, join(directory_path, 'ancestry.pickle'), 'fingerprint'))
+        self.assertEquals({}, ancestry.people)
+
+    def test_load_with_invalid_file(self):
+        ancestry = Ancestry()
+        with TemporaryDirectory() as directory_path:
+            file_path = join(directory_path, 'ancestry.pickle')
+            with open(file_path, 'wb') as f:
+                f.write(b'betty')
+            self.assertFalse(load(ancestry, file_path, 'fingerprint'))
+        self.assertEquals({}, ancestry.people)
+
+    def test_load_with_other_fingerprint(self):
+        ancestry = Ancestry()
+        with TemporaryDirectory() as directory_path:
+            file_path = join(directory_path, 'ancestry.pickle')
+            dump(self._ancestry(), file_path, 'fingerprint')
+            self.assertFalse(load(ancestry, file_path, 'another-fingerprint'))
+        self.assertEquals({}, ancestry.people)
+
+    def test_dump_and_load(self):
+        ancestry = Ancestry()
+        with TemporaryDirectory() as directory_path:
+            file_path = join(directory_path, 'ancestry.pickle')
+            dump(self._ancestry(), file_path, 'fingerprint')
+            self.assertTrue(load(ancestry, file_path, 'fingerprint'))
+        person = ancestry.people['P1']
+        parent = ancestry.people['P2']
+        event = ancestry.events['E1']
+        source = ancestry.sources['S1']
+        self.assertEquals('Jane', person.names[0].individual)
+        self.assertIs(person, person.names[0].person)
+        self.assertEquals([parent], list(person.parents))
+        self.assertEquals([person], list(parent.children))
+        self.assertIs(event, person.presences[0].event)
+        self.assertIsInstance(event.type, Birth)
+        self.assertIs(Birth(), event.type)
+        self.assertIs(ancestry.places['P1'], event.place)
+        self.assertEquals('The Place', event.place.names[0].name)
+        self.assertEquals('The Source', source.name)
+        self.assertEquals('The Archive', source.contained_by.name)
+        self.assertIs(source, ancestry.citations['C1'].source)
+        self.assertEquals([ancestry.citations['C1']], list(person.citations))
+
+    def test_loaded_associations_should_be_handled(self):
+        ancestry = Ancestry()
+        with TemporaryDirectory() as directory_path:
+            file_path = join(directory_path, 'ancestry.pickle')
+            dump(self._ancestry(), file_path, 'fingerprint')
+            load(ancestry, file_path, 'fingerprint')
+        child = Person('P3')
+        ancestry.people['P1'].children.append(child)
+        self.assertEquals([ancestry.people['P1']], list(child.parents))
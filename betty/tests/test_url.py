@@ -101,3 +101,12 @@ class SiteUrlGeneratorTest(TestCase):
         sut = SiteUrlGenerator(configuration)
         with self.assertRaises(ValueError):
             sut.generate(9, 'text/html')
+
+    def test_generate_should_generate_for_multiple_resources_of_the_same_type(self):
+        configuration = Configuration('/tmp', 'https://example.com')
+        sut = SiteUrlGenerator(configuration)
+        self.assertEquals('/person/P1/index.html', sut.generate(Person('P1'), 'text/html'))
+        self.assertEquals('/person/P2/index.json', sut.generate(Person('P2'), 'application/json'))
+        self.assertEquals('/index.html', sut.generate('/index.html', 'text/html'))
+        with self.assertRaises(ValueError):
+            sut.generate(9, 'text/html')
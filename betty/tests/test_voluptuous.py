@@ -1,11 +1,12 @@
 from os import path
+from unittest.mock import patch
 
 from parameterized import parameterized
 from voluptuous import Invalid
 
 from betty import os
 from betty.tests import TestCase
-from betty.voluptuous import Path, Importable
+from betty.voluptuous import Path, Importable, ImageFormat
 
 
 class PathTest(TestCase):
@@ -49,3 +50,18 @@ class ImportableTest(TestCase):
 
     def test_with_importable_should_return(self):
         self.assertEqual(self.__class__, Importable()('%s.%s' % (self.__module__, self.__class__.__name__)))
+
+
+class ImageFormatTest(TestCase):
+    def test_with_unknown_format_should_raise_invalid(self):
+        with self.assertRaises(Invalid):
+            ImageFormat()('gif')
+
+    @patch('betty.voluptuous.is_format_supported', return_value=False)
+    def test_with_unsupported_format_should_raise_invalid(self, _):
+        with self.assertRaises(Invalid):
+            ImageFormat()('avif')
+
+    @patch('betty.voluptuous.is_format_supported', return_value=True)
+    def test_with_supported_format_should_return(self, _):
+        self.assertEqual('webp', ImageFormat()('webp'))
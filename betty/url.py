@@ -75,11 +75,19 @@ class SiteUrlGenerator(LocalizedUrlGenerator):
             IdentifiableResourceUrlGenerator(configuration, Note, 'note/%s/index.%s'),
             LocalizedPathUrlGenerator(configuration),
         ]
+        # Whether a generator supports a resource depends on the resource's type only, so remember which generator
+        # supports which exact resource type, rather than trying all generators for every resource.
+        self._generators_by_type = {}
 
     def generate(self, resource: Any, *args, **kwargs) -> str:
+        resource_type = type(resource)
+        with suppress(KeyError):
+            return self._generators_by_type[resource_type].generate(resource, *args, **kwargs)
         for generator in self._generators:
             with suppress(ValueError):
-                return generator.generate(resource, *args, **kwargs)
+                url = generator.generate(resource, *args, **kwargs)
+                self._generators_by_type[resource_type] = generator
+                return url
         raise ValueError('No URL generator found for %s.' % (
             resource if isinstance(resource, str) else type(resource)))
 
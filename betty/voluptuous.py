@@ -2,6 +2,7 @@ from os import path
 
 from voluptuous import Invalid
 
+from betty.image import FORMAT_MEDIA_TYPES, is_format_supported
 from betty.importlib import import_any
 
 
@@ -23,3 +24,14 @@ def Importable():
             raise Invalid(e)
 
     return _importable
+
+
+def ImageFormat():
+    def _image_format(v):
+        if v not in FORMAT_MEDIA_TYPES:
+            raise Invalid('"%s" is not an image format. Choose one of %s.' % (v, ', '.join(sorted(FORMAT_MEDIA_TYPES))))
+        if not is_format_supported(v):
+            raise Invalid('Images cannot be saved as %s, because your version of Pillow does not support it.' % v)
+        return v
+
+    return _image_format
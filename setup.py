@@ -59,6 +59,15 @@ SETUP = {
         'voluptuous ~= 0.12.0',
     ],
     'extras_require': {
+        'avif': [
+            'pillow-avif-plugin ~= 1.1',
+        ],
+        'brotli': [
+            'brotli ~= 1.0.9',
+        ],
+        'orjson': [
+            'orjson ~= 3.4.6',
+        ],
         'development': [
             'aioresponses ~= 0.7.1',
             'autopep8 ~= 1.5.4',
@@ -68,6 +77,7 @@ SETUP = {
             'html5lib ~= 1.1',
             'mock ~= 4.0.2; python_version <= "3.7"',
             'nose2 ~= 0.9.2',
+            'orjson ~= 3.4.6',
             'parameterized ~= 0.7.4',
             'setuptools ~= 50.3.2',
             'twine ~= 3.2.0',